@@ -1,97 +1,491 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import codecs
+import threading
+import time
 from urllib3.util.retry import Retry
 from requests import Session
 from requests.adapters import HTTPAdapter
+import os
 import json
+import fnmatch
 import urllib
 import logging
+from token_cache import TOKEN_CACHE
+from ratelimit import RateLimiter
+from metrics import METRICS
+from log_config import LazyJson
+from lookup_cache import LOOKUP_CACHE
+from journal import entity_key, get_journal, step_id
 
 log = logging.getLogger(__name__)
 
+# Alerting endpoints whose existing entities are indexed by prefetch_entities
+ENTITY_ENDPOINTS = ("health-rules", "actions", "policies")
+# Teardown phases: policies reference actions and health rules, so they go first
+DELETE_PHASES = (("policies",), ("actions", "health-rules"))
+ENTITY_LABELS = {"health-rules": "health rule", "actions": "action", "policies": "policy"}
+# Bytes read per network chunk when streaming list endpoints
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Compact record yielded by AppDynamics.iter_entities
+EntitySummary = namedtuple("EntitySummary", ["id", "name", "enabled"])
+
+
+def iter_json_array(chunks):
+    """
+    Incrementally decodes a top-level JSON array from an iterable of byte or
+    text chunks, yielding one element at a time. Only the element currently
+    being parsed is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf = ""
+    pos = 0
+    exhausted = False
+    started = False
+
+    def more():
+        nonlocal buf, pos, exhausted
+        for chunk in chunks:
+            text = utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                buf = buf[pos:] + text
+                pos = 0
+                return True
+        buf = buf[pos:] + utf8.decode(b"", final=True)
+        pos = 0
+        exhausted = True
+        return False
+
+    while True:
+        # Skip whitespace and separators between elements
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buf):
+            if exhausted:
+                if not started:
+                    return
+                raise ValueError("Truncated JSON array in response")
+            more()
+            continue
+
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("Expected a JSON array in response")
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if exhausted:
+                raise
+            more()
+            continue
+        if not isinstance(item, (dict, list)):
+            # A scalar cut at a chunk edge can still decode ("1." of "1.5" as 1),
+            # so it only counts once the delimiter after it has arrived
+            after = end
+            while after < len(buf) and buf[after] in " \t\r\n":
+                after += 1
+            if after >= len(buf) or buf[after] not in ",]":
+                if not exhausted:
+                    more()
+                    continue
+                if after < len(buf):
+                    raise ValueError(f"Unexpected {buf[after]!r} after a value in JSON array")
+        pos = end
+        yield item
+
+def controller_base_url(account_name, base_url=None):
+    """Controller URL for an account, overridable via argument or APPD_BASE_URL."""
+    base_url = base_url or os.getenv("APPD_BASE_URL", "").strip()
+    if base_url:
+        return base_url.rstrip("/") + "/"
+    return f"https://{account_name}.saas.appdynamics.com/controller/"
+
+
 class AppDynamics:
-    def __init__(self, env, client_id, account_name, client_secret):
+    def __init__(self, env, client_id, account_name, client_secret, max_workers=1, rate_limiter=None,
+                 base_url=None, metrics=None, lookup_cache=None, journal=None, pool_size=None):
         self.client_id = client_id
         self.env = env
         self.account_name = account_name
         self.client_secret = client_secret
+        # Number of concurrent POSTs used by create_health_rules (1 = sequential)
+        self.max_workers = max(1, int(max_workers))
+        # Application ids, tiers and nodes, shared across clients and (optionally) runs
+        self.lookup_cache = lookup_cache or LOOKUP_CACHE
+        # Completed creates; skips repeats within a run and, with APPD_JOURNAL, across reruns
+        self.journal = journal or get_journal()
+        # (appd_id, endpoint) -> {name: id} for entities known to exist on the controller
+        self._entity_index = {}
+        self._index_lock = threading.Lock()
+        self._prefetch_locks = {}
+        # Client-side throttle shared by every call made through this client
+        self.rate_limiter = rate_limiter or RateLimiter.from_env()
+        # Per-endpoint counts, statuses, retries and latencies of every controller call
+        self.metrics = metrics or METRICS
         self.session = Session()
-        self.base_url = f"https://{account_name}.saas.appdynamics.com/controller/"
-        self.token = self.get_access_token()
+        # APPD_BASE_URL points the client at another controller, e.g. mock_controller.py
+        self.base_url = controller_base_url(account_name, base_url)
+        self.token_cache = TOKEN_CACHE
+        self.token_expires_at = 0
+        self.token_refresh_at = 0
+        self._token_lock = threading.Lock()
         self.session.headers = {
-            "Authorization": f"Bearer {self.token}",
             "Accept": "application/json",
             "Content-Type": "application/json",
         }
+        self.token = self.get_access_token()
         self.params = {"output": "json"}
-        self.session.mount(
-            "https://",
-            HTTPAdapter(
-                max_retries=Retry(
-                    total=5,
-                    read=5,
-                    connect=5,
-                    backoff_factor=0.2,
-                    allowed_methods=frozenset(["GET", "POST", "PUT"]),
-                    status_forcelist=(500, 502, 504, 403),
-                )
+        adapter = HTTPAdapter(
+            max_retries=Retry(
+                total=5,
+                read=5,
+                connect=5,
+                backoff_factor=0.2,
+                allowed_methods=frozenset(["GET", "POST", "PUT"]),
+                # 429/503 are handled by the rate limiter so it can adapt to them
+                status_forcelist=(500, 502, 504),
             ),
+            # One pooled connection per request that can be in flight, so parallel
+            # calls reuse sockets instead of opening and discarding extras
+            pool_maxsize=max(10, self._in_flight_bound(pool_size)),
         )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _in_flight_bound(self, pool_size=None):
+        """
+        Requests this client can have in flight at once: `pool_size` threads
+        share it (batch runs workers x max_workers), max_workers by default,
+        and the rate limiter never lets more than its max concurrency through.
+        """
+        threads = int(pool_size or self.max_workers)
+        concurrency = getattr(self.rate_limiter, "concurrency", None)
+        return min(threads, concurrency.max_limit) if concurrency else threads
+
+    def _fetch_access_token(self):
+        """POSTs client credentials and returns (access_token, expires_in)."""
+        url = f"{self.base_url}api/oauth/access_token"
+        payload = {
+            "grant_type": "client_credentials",
+            "client_id": f"{self.client_id}@{self.account_name}",
+            "client_secret": self.client_secret,
+        }
+        # Authorization=None drops any stale bearer header inherited from the session
+        headers = {"Content-Type": "application/x-www-form-urlencoded", "Authorization": None}
+        start = time.perf_counter()
+        response = self.session.post(url, data=payload, headers=headers)
+        self.metrics.observe_request("POST", url, time.perf_counter() - start, [response.status_code])
+        response.raise_for_status()
+        token_data = response.json()
+        return token_data["access_token"], token_data.get("expires_in")
 
-    def get_access_token(self):
+    def get_access_token(self, force_refresh=False):
+        """
+        Returns a valid access token from the shared token cache, fetching one only
+        when none is cached or the cached one is close to expiry. The session's
+        Authorization header is updated in place.
+        """
         try:
-            url = f"{self.base_url}api/oauth/access_token"
-            payload = {
-                "grant_type": "client_credentials",
-                "client_id": f"{self.client_id}@{self.account_name}",
-                "client_secret": self.client_secret,
-            }
-            headers = {"Content-Type": "application/x-www-form-urlencoded"}
-            response = self.session.post(url, data=payload, headers=headers)
-            response.raise_for_status()
-            return response.json()["access_token"]
+            with self._token_lock:
+                if force_refresh:
+                    self.token_cache.invalidate(self.account_name, self.client_id, getattr(self, "token", None))
+                entry = self.token_cache.get_or_fetch(
+                    self.account_name, self.client_id, self._fetch_access_token
+                )
+                self.token = entry["access_token"]
+                self.token_expires_at = entry["expires_at"]
+                self.token_refresh_at = self.token_cache.refresh_at(entry)
+                self.session.headers["Authorization"] = f"Bearer {self.token}"
+                return self.token
         except Exception:
             log.exception("Error retrieving access token")
             raise
 
-    def get_appID(self, ApplicationName):
+    def _request(self, method, url, **kwargs):
+        """
+        Sends a request on the shared session through the rate limiter. Refreshes
+        the token shortly before it expires, and retries once with a fresh token
+        on a 401. Every call is recorded in self.metrics.
+        """
+        statuses = []
+        attempts = 0
+
+        def send():
+            nonlocal attempts
+            attempts += 1
+            response = self.session.request(method, url, **kwargs)
+            # Attempts urllib3 retried internally (5xx, connection errors)
+            history = getattr(getattr(response.raw, "retries", None), "history", None) or ()
+            attempts += len(history)
+            statuses.extend(h.status for h in history if h.status)
+            statuses.append(response.status_code)
+            return response
+
+        start = time.perf_counter()
         try:
+            if self.token_refresh_at <= time.time():
+                self.get_access_token()
+            sent_token = self.token
+            response = self.rate_limiter.send(send, method, url)
+            if response.status_code == 401:
+                log.info(f"401 from {url}; retrying once with a fresh access token")
+                if self.token == sent_token:
+                    self.get_access_token(force_refresh=True)
+                response = self.rate_limiter.send(send, method, url)
+        except Exception:
+            self.metrics.observe_request(
+                method, url, time.perf_counter() - start, statuses,
+                max(0, attempts - 1), error=True,
+            )
+            raise
+        self.metrics.observe_request(
+            method, url, time.perf_counter() - start, statuses, attempts - 1
+        )
+        return response
+
+    def _lookup_404(self, err, appd_id=None, kind=None, *parts):
+        """Drops cached lookups that a 404 proved stale."""
+        response = getattr(err, "response", None)
+        if response is None or response.status_code != 404:
+            return
+        if kind:
+            self.lookup_cache.invalidate(self.base_url, kind, *parts)
+        if appd_id is not None:
+            self._application_404(appd_id)
+
+    def _application_404(self, appd_id):
+        """
+        A call under applications/{appd_id} returned 404: the application may
+        have been deleted or recreated with a new id, so its cached id, tiers,
+        nodes and prefetched entity index are all dropped.
+        """
+        self.lookup_cache.invalidate_application(self.base_url, appd_id)
+        with self._index_lock:
+            for key in [key for key in self._entity_index if key[0] == appd_id]:
+                del self._entity_index[key]
+
+    def get_appID(self, ApplicationName, refresh=False):
+        def fetch():
             encoded_name = urllib.parse.quote(ApplicationName)
-            response = self.session.get(
+            response = self._request(
+                "GET",
                 f"{self.base_url}rest/applications/{encoded_name}",
                 params=self.params,
             )
             response.raise_for_status()
             return response.json()[0]["id"]
-        except Exception:
+
+        try:
+            return self.lookup_cache.get_or_fetch(
+                self.base_url, "app_id", (ApplicationName,), fetch, refresh
+            )
+        except Exception as err:
+            self._lookup_404(err, None, "app_id", ApplicationName)
             log.exception(f"Error looking up application ID for {ApplicationName}")
             raise
 
-    def get_appd_nodes(self, appd_id):
-        try:
-            response = self.session.get(
+    def get_appd_nodes(self, appd_id, refresh=False):
+        def fetch():
+            response = self._request(
+                "GET",
                 f"{self.base_url}rest/applications/{appd_id}/nodes",
                 params=self.params,
             )
             response.raise_for_status()
             return response.json()
-        except Exception:
+
+        try:
+            return self.lookup_cache.get_or_fetch(self.base_url, "nodes", (appd_id,), fetch, refresh)
+        except Exception as err:
+            # The application itself is gone, so its cached id is stale too
+            self._lookup_404(err, appd_id)
             log.exception(f"Error retrieving nodes for application ID {appd_id}")
             raise
 
-    def get_appd_tier(self, appd_id, appd_tier):
-        try:
+    def get_appd_tier(self, appd_id, appd_tier, refresh=False):
+        def fetch():
             tier = urllib.parse.quote(appd_tier)
-            response = self.session.get(
+            response = self._request(
+                "GET",
                 f"{self.base_url}rest/applications/{appd_id}/tiers/{tier}/",
                 params=self.params,
             )
             response.raise_for_status()
             return response.json()
-        except Exception:
+
+        try:
+            return self.lookup_cache.get_or_fetch(
+                self.base_url, "tier", (appd_id, appd_tier), fetch, refresh
+            )
+        except Exception as err:
+            self._lookup_404(err, appd_id, "tier", appd_id, appd_tier)
             log.exception(f"Error retrieving tier {appd_tier} for application ID {appd_id}")
             raise
 
+    def get_appd_tiers(self, appd_id, refresh=False):
+        """
+        Returns {tier name: tier} for every tier of an application from a single
+        GET. Cached like the other lookups, so a batch resolves the type of all
+        its tiers with one request per application. Treat the dict as read-only.
+        """
+        def fetch():
+            response = self._request(
+                "GET",
+                f"{self.base_url}rest/applications/{appd_id}/tiers",
+                params=self.params,
+            )
+            response.raise_for_status()
+            return {tier["name"]: tier for tier in response.json()}
+
+        try:
+            return self.lookup_cache.get_or_fetch(self.base_url, "tiers", (appd_id,), fetch, refresh)
+        except Exception as err:
+            self._lookup_404(err, appd_id)
+            log.exception(f"Error retrieving tiers for application ID {appd_id}")
+            raise
+
+    def find_appd_tier(self, appd_id, appd_tier):
+        """
+        Resolves one tier from the application's tier index, falling back to
+        get_appd_tier for tiers created after the index was fetched. Returns
+        the same [tier] list shape as get_appd_tier.
+        """
+        tier = self.get_appd_tiers(appd_id).get(appd_tier)
+        if tier is not None:
+            return [tier]
+        return self.get_appd_tier(appd_id, appd_tier)
+
+    def iter_entities(self, appd_id, endpoint, page_size=None):
+        """
+        Streams the listing of an alerting endpoint (health-rules, actions, policies)
+        as compact EntitySummary(id, name, enabled) records.
+
+        The response body is decoded incrementally, so memory stays flat however
+        many entities the application has. When the controller paginates (a
+        Link: rel="next" header) the following pages are fetched lazily.
+        page_size is passed as the `limit` query parameter when given.
+        """
+        url = f"{self.base_url}alerting/rest/v1/applications/{appd_id}/{endpoint}"
+        params = dict(self.params)
+        if page_size:
+            params["limit"] = int(page_size)
+
+        while url:
+            response = self._request("GET", url, params=params, stream=True)
+            try:
+                if response.status_code == 404:
+                    self._application_404(appd_id)
+                response.raise_for_status()
+                for item in iter_json_array(response.iter_content(chunk_size=STREAM_CHUNK_SIZE)):
+                    yield EntitySummary(item.get("id"), item.get("name"), item.get("enabled"))
+                url = response.links.get("next", {}).get("url")
+                # The next link already carries its own query string
+                params = None
+            finally:
+                response.close()
+
+    def prefetch_entities(self, appd_id, endpoints=ENTITY_ENDPOINTS, refresh=False):
+        """
+        Fetches the existing health rules, actions and policies of an application
+        in parallel and indexes them by name, so later POSTs for entities that
+        already exist can be skipped. Safe to call repeatedly; only the first
+        call per application hits the controller unless refresh=True.
+
+        Returns the endpoints whose listing failed. Those are left unindexed
+        (a failed refresh drops the old index), so nothing is ever judged
+        absent from a listing that did not happen.
+        """
+        with self._index_lock:
+            app_lock = self._prefetch_locks.setdefault(appd_id, threading.Lock())
+
+        with app_lock:
+            missing = [
+                e for e in endpoints
+                if refresh or (appd_id, e) not in self._entity_index
+            ]
+            if not missing:
+                return []
 
-       def _post(self, endpoint, appd_id, payload, entity_name):
+            def fetch(endpoint):
+                try:
+                    return endpoint, {e.name: e.id for e in self.iter_entities(appd_id, endpoint)}
+                except Exception:
+                    log.exception(f"Error prefetching {endpoint} for application ID {appd_id}")
+                    return endpoint, None
+
+            with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                listings = list(executor.map(fetch, missing))
+
+            failed = []
+            with self._index_lock:
+                for endpoint, items in listings:
+                    # Leave the endpoint unindexed on failure so POSTs go through as before
+                    if items is None:
+                        self._entity_index.pop((appd_id, endpoint), None)
+                        failed.append(endpoint)
+                        continue
+                    self._entity_index[(appd_id, endpoint)] = items
+                    log.info(f"Indexed {len(items)} existing {endpoint} for {appd_id}")
+            return failed
+
+    def _lookup_entity(self, appd_id, endpoint, name):
+        """Returns (True, id) when the name is known to exist, else (False, None)."""
+        with self._index_lock:
+            index = self._entity_index.get((appd_id, endpoint))
+            if index is None or name not in index:
+                return False, None
+            return True, index[name]
+
+    def _remember_entity(self, appd_id, endpoint, name, entity_id=None):
+        with self._index_lock:
+            index = self._entity_index.get((appd_id, endpoint))
+            if index is not None and name:
+                if entity_id is not None or name not in index:
+                    index[name] = entity_id
+
+    def _forget_entity(self, appd_id, endpoint, name):
+        with self._index_lock:
+            index = self._entity_index.get((appd_id, endpoint))
+            if index is not None:
+                index.pop(name, None)
+
+    def _post(self, endpoint, appd_id, payload, entity_name, use_journal=True):
+        """
+        Creates one entity. Steps already recorded in the journal are skipped;
+        identical concurrent steps run once. Pass use_journal=False when the
+        caller has just checked the controller itself (reconcile).
+        """
+        name = payload.get("name") if isinstance(payload, dict) else None
+        if not use_journal or not name:
+            return self._create(endpoint, appd_id, payload, entity_name)
+
+        step = step_id(self.base_url, appd_id, endpoint, name, payload)
+        with self.journal.claim(step) as done:
+            if done:
+                log.info(
+                    f"{entity_name.title()} '{name}' already completed for {appd_id} "
+                    "(journal); skipping POST."
+                )
+                return {"success": True, "data": {"name": name}, "status": None,
+                        "skipped": True, "journaled": True}
+            result = self._create(endpoint, appd_id, payload, entity_name)
+            if result["success"]:
+                self.journal.record(
+                    step, entity_key(self.base_url, appd_id, endpoint, name),
+                    endpoint=endpoint, name=name, status=result.get("status"),
+                )
+            return result
+
+    def _create(self, endpoint, appd_id, payload, entity_name):
         # Guard against bad payloads 
         if isinstance(payload, str):
             log.error(
@@ -101,20 +495,30 @@ class AppDynamics:
             return {"success": False, "error": "Payload must be a dict or list"}
     
         # Debug payload
-        log.debug(f"Payload type for {entity_name}: {type(payload)}")
-        log.debug("POST body preview:\n%s", json.dumps(payload, indent=2))
+        # Formatted only when debug records are actually emitted
+        log.debug("Payload type for %s: %s", entity_name, type(payload))
+        log.debug("POST body preview:\n%s", LazyJson(payload, indent=2))
     
         url = f"{self.base_url}alerting/rest/v1/applications/{appd_id}/{endpoint}"
+        name = payload.get("name") if isinstance(payload, dict) else None
+
+        # Skip the round trip when the prefetched index already has this name
+        exists, entity_id = self._lookup_entity(appd_id, endpoint, name)
+        if exists:
+            log.info(
+                f"{entity_name.title()} '{name}' already exists for {appd_id}; skipping POST."
+            )
+            return {"success": True, "data": {"name": name, "id": entity_id}, "status": None, "skipped": True}
     
         try:
-            resp = self.session.post(url, params=self.params, json=payload)
-            name = payload.get("name")
+            resp = self._request("POST", url, params=self.params, json=payload)
 
             # ✅ Treat 409 Conflict (already exists) as success for health rules
             if resp.status_code == 409 and endpoint == "health-rules":
                 log.info(
                     f"{entity_name.title()} '{name}' already exists for {appd_id}; treating as success."
                 )
+                self._remember_entity(appd_id, endpoint, name)
                 return {"success": True, "data": {"name": name}, "status": 409}
 
             # ✅ Expected 201 Created on normal success
@@ -128,9 +532,13 @@ class AppDynamics:
                     data = resp.json()
                 except ValueError:
                     data = {"name": name}
+                entity_id = data.get("id") if isinstance(data, dict) else None
+                self._remember_entity(appd_id, endpoint, name, entity_id)
                 return {"success": True, "data": data, "status": resp.status_code}
 
             # ❌ Any other unexpected code
+            if resp.status_code == 404:
+                self._application_404(appd_id)
             try:
                 msg = resp.json().get("message", resp.text)
             except ValueError:
@@ -150,7 +558,7 @@ class AppDynamics:
             log.exception(
                 f"Exception while creating {entity_name} for {appd_id}"
             )
-            return {"success": False, "error": str(e), "data": {"name": payload.get("name")}}
+            return {"success": False, "error": str(e), "data": {"name": name}}
 
 
     def post_appd_hr(self, appd_id, payload):
@@ -162,15 +570,195 @@ class AppDynamics:
     def post_appd_action(self, appd_id, payload):
         return self._post("actions", appd_id, payload, "action")
 
-    def create_health_rules(self, appd_id, health_rule_payloads):
+    def _get_entity(self, endpoint, appd_id, entity_id):
+        """Returns the full definition of one health rule, action or policy."""
+        url = f"{self.base_url}alerting/rest/v1/applications/{appd_id}/{endpoint}/{entity_id}"
+        response = self._request("GET", url, params=self.params)
+        response.raise_for_status()
+        return response.json()
+
+    def _put(self, endpoint, appd_id, entity_id, payload, entity_name):
+        url = f"{self.base_url}alerting/rest/v1/applications/{appd_id}/{endpoint}/{entity_id}"
+        name = payload.get("name")
+        try:
+            resp = self._request("PUT", url, params=self.params, json=payload)
+            if resp.status_code in (200, 204):
+                log.info(
+                    f"Successfully updated {entity_name} '{name}' for {appd_id} "
+                    f"(Status: {resp.status_code})"
+                )
+                return {"success": True, "data": {"name": name, "id": entity_id}, "status": resp.status_code}
+
+            if resp.status_code == 404:
+                self._application_404(appd_id)
+            try:
+                msg = resp.json().get("message", resp.text)
+            except ValueError:
+                msg = resp.text
+            log.warning(
+                f"Failed to update {entity_name} '{name}' for {appd_id}: "
+                f"{msg} (Status: {resp.status_code})"
+            )
+            return {
+                "success": False,
+                "status": resp.status_code,
+                "message": msg,
+                "data": {"name": name, "id": entity_id},
+            }
+        except Exception as e:
+            log.exception(f"Exception while updating {entity_name} '{name}' for {appd_id}")
+            return {"success": False, "error": str(e), "data": {"name": name, "id": entity_id}}
+
+    def _delete(self, endpoint, appd_id, entity_id, entity_name, name=None):
+        url = f"{self.base_url}alerting/rest/v1/applications/{appd_id}/{endpoint}/{entity_id}"
+        label = name or entity_id
+        try:
+            resp = self._request("DELETE", url, params=self.params)
+            # A 404 means the entity is already gone, which is the goal of a delete
+            if resp.status_code in (200, 204, 404):
+                log.info(
+                    f"Deleted {entity_name} '{label}' for {appd_id} (Status: {resp.status_code})"
+                )
+                if name:
+                    self._forget_entity(appd_id, endpoint, name)
+                    # Re-creating it later must not be skipped as already done
+                    self.journal.forget(entity_key(self.base_url, appd_id, endpoint, name))
+                return {"success": True, "data": {"name": name, "id": entity_id}, "status": resp.status_code}
+
+            try:
+                msg = resp.json().get("message", resp.text)
+            except ValueError:
+                msg = resp.text
+            log.warning(
+                f"Failed to delete {entity_name} '{label}' for {appd_id}: "
+                f"{msg} (Status: {resp.status_code})"
+            )
+            return {
+                "success": False,
+                "status": resp.status_code,
+                "message": msg,
+                "data": {"name": name, "id": entity_id},
+            }
+        except Exception as e:
+            log.exception(f"Exception while deleting {entity_name} '{label}' for {appd_id}")
+            return {"success": False, "error": str(e), "data": {"name": name, "id": entity_id}}
+
+    # ─── Teardown ───────────────────────────────────────────────────────────────
+
+    def _entity_ids(self, appd_id, endpoint, names, refresh=False):
+        """
+        Resolves names to ids from the entity index (one listing per endpoint).
+        Names that do not exist on the controller are left out; a failed
+        listing raises rather than reporting every name as absent.
+        """
+        if self.prefetch_entities(appd_id, (endpoint,), refresh=refresh):
+            raise RuntimeError(f"Listing {endpoint} for application ID {appd_id} failed")
+        found = [self._lookup_entity(appd_id, endpoint, name) for name in names]
+        # Entities remembered from a 409 have no id yet; re-list once to learn them
+        if not refresh and any(known and entity_id is None for known, entity_id in found):
+            return self._entity_ids(appd_id, endpoint, names, refresh=True)
+        return [entity_id for known, entity_id in found if known and entity_id is not None]
+
+    def get_appd_policy_ids(self, appd_id, names, refresh=False):
+        return self._entity_ids(appd_id, "policies", names, refresh)
+
+    def get_appd_action_ids(self, appd_id, names, refresh=False):
+        return self._entity_ids(appd_id, "actions", names, refresh)
+
+    def get_appd_hr_ids(self, appd_id, names, refresh=False):
+        return self._entity_ids(appd_id, "health-rules", names, refresh)
+
+    def delete_appd_policy(self, appd_id, policy_id, name=None):
+        return self._delete("policies", appd_id, policy_id, "policy", name)
+
+    def delete_appd_action(self, appd_id, action_id, name=None):
+        return self._delete("actions", appd_id, action_id, "action", name)
+
+    def delete_appd_hr(self, appd_id, hr_id, name=None):
+        return self._delete("health-rules", appd_id, hr_id, "health rule", name)
+
+    def delete_entities(self, appd_id, names_by_endpoint, max_workers=None):
+        """
+        Bulk offboarding. `names_by_endpoint` maps "policies", "actions" and
+        "health-rules" to entity names. Each listing is fetched once (in
+        parallel) and names are resolved from that index. Policies are deleted
+        first, then actions and health rules together, each phase with up to
+        max_workers DELETEs in flight.
+
+        Returns one result per requested name, grouped by phase:
+        {"endpoint", "name", "id", "success", "status", ...}. Names not found on
+        the controller are reported as skipped successes. Names whose listing
+        failed are failures, and so is everything in the phases after one: if
+        the policies could not be listed they may still exist and reference
+        the actions and health rules.
+        """
+        workers = max(1, int(max_workers or self.max_workers))
+        endpoints = [e for e in names_by_endpoint if names_by_endpoint[e]]
+        # Always list fresh: a teardown must not trust an index built before it
+        unlisted = set(self.prefetch_entities(appd_id, endpoints, refresh=True))
+
         results = []
-        for idx, payload in enumerate(health_rule_payloads, start=1):
-            log.info(f"Creating health rule {idx}/{len(health_rule_payloads)} for AppD ID: {appd_id}")
+        blocked_by = None
+        for phase in DELETE_PHASES:
+            targets, phase_results = [], []
+            for endpoint in phase:
+                for name in names_by_endpoint.get(endpoint) or ():
+                    if blocked_by or endpoint in unlisted:
+                        error = (f"not attempted: listing {blocked_by} failed" if blocked_by
+                                 else f"listing {endpoint} failed")
+                        log.error(f"Cannot delete {ENTITY_LABELS[endpoint]} '{name}' for {appd_id}: {error}")
+                        phase_results.append({"endpoint": endpoint, "name": name, "id": None,
+                                              "success": False, "error": error, "status": None})
+                        continue
+                    known, entity_id = self._lookup_entity(appd_id, endpoint, name)
+                    if known and entity_id is not None:
+                        targets.append((endpoint, name, entity_id))
+                    else:
+                        log.info(f"{ENTITY_LABELS[endpoint].capitalize()} '{name}' not found "
+                                 f"for {appd_id}; nothing to delete")
+                        phase_results.append({"endpoint": endpoint, "name": name, "id": None,
+                                              "success": True, "skipped": True, "status": None})
+
+            def delete(target):
+                endpoint, name, entity_id = target
+                result = self._delete(endpoint, appd_id, entity_id, ENTITY_LABELS[endpoint], name)
+                return {"endpoint": endpoint, "name": name, "id": entity_id, **result}
+
+            if targets:
+                with ThreadPoolExecutor(max_workers=min(workers, len(targets))) as executor:
+                    phase_results = list(executor.map(delete, targets)) + phase_results
+            results.extend(phase_results)
+            blocked_by = blocked_by or next((e for e in phase if e in unlisted), None)
+
+        deleted = sum(1 for r in results if r["success"] and not r.get("skipped"))
+        failed = sum(1 for r in results if not r["success"])
+        log.info(f"Teardown for {appd_id}: {deleted} deleted, {failed} failed, "
+                 f"{len(results) - deleted - failed} not found")
+        return results
+
+    def create_health_rules(self, appd_id, health_rule_payloads, max_workers=None):
+        """
+        Posts every health rule payload and returns the results in input order.
+        With more than one worker the POSTs are sent in parallel over the shared session.
+        """
+        workers = max(1, int(max_workers or self.max_workers))
+        total = len(health_rule_payloads)
+
+        def create(indexed):
+            idx, payload = indexed
+            log.info(f"Creating health rule {idx}/{total} for AppD ID: {appd_id}")
             result = self.post_appd_hr(appd_id, payload)
             if not result["success"]:
                 log.warning(f"Health rule {idx} failed: {result.get('message') or result.get('error')}")
-            results.append(result)
-        return results
+            return result
+
+        indexed_payloads = list(enumerate(health_rule_payloads, start=1))
+        if workers == 1 or total <= 1:
+            return [create(item) for item in indexed_payloads]
+
+        with ThreadPoolExecutor(max_workers=min(workers, total)) as executor:
+            # executor.map yields in submission order, regardless of completion order
+            return list(executor.map(create, indexed_payloads))
 
     def create_policy_with_dynamic_healthrules(self, appd_id, policy_payload):
         """
@@ -187,31 +775,37 @@ class AppDynamics:
             log.exception(f"Error creating policy for app {appd_id}")
             return {"success": False, "error": str(e)}
 
-    def update_health_rule_thresholds(self,
-                                      appd_id,
-                                      healthrule_name,
-                                      critical_value=None,
-                                      warning_value=None):
-        try:
-            # Step 1: fetch all health rules
-            url = f"{self.base_url}alerting/rest/v1/applications/{appd_id}/health-rules"
-            response = self.session.get(url, params=self.params)
-            response.raise_for_status()
-            health_rules = response.json()
-
-            # Step 2: locate target
-            target = next((hr for hr in health_rules if hr["name"] == healthrule_name), None)
-            if not target:
-                log.warning(f"Health rule '{healthrule_name}' not found.")
-                return {"success": False, "message": "Health rule not found"}
-
-            hr_id = target["id"]
+    def _health_rule_ids(self, appd_id):
+        """Returns {name: id} for every health rule of the application (one list GET)."""
+        return {hr.name: hr.id for hr in self.iter_entities(appd_id, "health-rules")}
 
-            # Step 3: fetch details and update thresholds
-            hr_detail_url = (
-                f"{self.base_url}alerting/rest/v1/applications/{appd_id}/health-rules/{hr_id}"
+    @staticmethod
+    def _select_condition(conditions, condition, healthrule_name, label):
+        """
+        Picks the condition whose thresholds will change. With a shortName the
+        matching condition is used; without one the rule must have at most one.
+        Returns (condition or None, error message or None).
+        """
+        if not conditions:
+            return None, None
+        if condition:
+            match = next((c for c in conditions if c.get("shortName") == condition), None)
+            if match is None:
+                return None, f"Health rule '{healthrule_name}' has no {label} condition '{condition}'."
+            return match, None
+        if len(conditions) > 1:
+            return None, (
+                f"Health rule '{healthrule_name}' has multiple conditions. "
+                "Threshold update skipped."
             )
-            detail_resp = self.session.get(hr_detail_url, params=self.params)
+        return conditions[0], None
+
+    def _update_thresholds_by_id(self, appd_id, hr_id, healthrule_name,
+                                 critical_value=None, warning_value=None, condition=None):
+        """Detail GET, threshold edit and PUT for one health rule whose id is known."""
+        try:
+            hr_url = f"{self.base_url}alerting/rest/v1/applications/{appd_id}/health-rules/{hr_id}"
+            detail_resp = self._request("GET", hr_url, params=self.params)
             detail_resp.raise_for_status()
             hr_data = detail_resp.json()
 
@@ -219,18 +813,17 @@ class AppDynamics:
             critical_conditions = (eval_criterias.get("criticalCriteria") or {}).get("conditions", [])
             warning_conditions = (eval_criterias.get("warningCriteria") or {}).get("conditions", [])
 
-            # Step 4: guard multi-conditions
-            if len(critical_conditions) > 1 or len(warning_conditions) > 1:
-                msg = (
-                    f"Health rule '{healthrule_name}' has multiple conditions. "
-                    "Threshold update skipped."
-                )
+            critical_condition, critical_err = self._select_condition(
+                critical_conditions, condition, healthrule_name, "critical")
+            warning_condition, warning_err = self._select_condition(
+                warning_conditions, condition, healthrule_name, "warning")
+            msg = (critical_value is not None and critical_err) or (warning_value is not None and warning_err)
+            if msg:
                 log.warning(msg)
-                return {"success": False, "message": msg}
+                return {"success": False, "name": healthrule_name, "message": msg}
 
-            # Step 5: apply new thresholds
-            if critical_value is not None and critical_conditions:
-                metric = critical_conditions[0]["evalDetail"]["metricEvalDetail"]
+            if critical_value is not None and critical_condition:
+                metric = critical_condition["evalDetail"]["metricEvalDetail"]
                 if "compareValue" in metric:
                     old = metric["compareValue"]
                     metric["compareValue"] = float(critical_value)
@@ -240,8 +833,8 @@ class AppDynamics:
                     )
 
             if warning_value is not None:
-                if warning_conditions:
-                    metric = warning_conditions[0]["evalDetail"]["metricEvalDetail"]
+                if warning_condition:
+                    metric = warning_condition["evalDetail"]["metricEvalDetail"]
                     if "compareValue" in metric:
                         old = metric["compareValue"]
                         metric["compareValue"] = float(warning_value)
@@ -254,17 +847,80 @@ class AppDynamics:
                         f"No warning criteria for '{healthrule_name}'. Skipping warning update."
                     )
 
-            # Step 6: PUT update
-            put_url = (
-                f"{self.base_url}"
-                f"alerting/rest/v1/applications/{appd_id}/health-rules/{hr_id}"
-            )
-            put_resp = self.session.put(put_url, params=self.params, json=hr_data)
+            put_resp = self._request("PUT", hr_url, params=self.params, json=hr_data)
             put_resp.raise_for_status()
 
             log.info(f"Successfully updated thresholds for '{healthrule_name}'")
-            return {"success": True, "message": "Thresholds updated"}
+            return {"success": True, "name": healthrule_name, "message": "Thresholds updated"}
+
+        except Exception as e:
+            log.exception(f"Error updating health rule '{healthrule_name}'")
+            return {"success": False, "name": healthrule_name, "error": str(e)}
 
+    def update_health_rule_thresholds(self,
+                                      appd_id,
+                                      healthrule_name,
+                                      critical_value=None,
+                                      warning_value=None,
+                                      condition=None):
+        try:
+            # Step 1: locate target; the listing stream stops as soon as it is found
+            hr_id = next(
+                (hr.id for hr in self.iter_entities(appd_id, "health-rules") if hr.name == healthrule_name),
+                None,
+            )
+            if hr_id is None:
+                log.warning(f"Health rule '{healthrule_name}' not found.")
+                return {"success": False, "message": "Health rule not found"}
         except Exception as e:
             log.exception(f"Error updating health rule '{healthrule_name}'")
             return {"success": False, "error": str(e)}
+
+        # Step 2: fetch details, apply thresholds and PUT
+        return self._update_thresholds_by_id(
+            appd_id, hr_id, healthrule_name, critical_value, warning_value, condition
+        )
+
+    def bulk_update_health_rule_thresholds(self, appd_id, updates, max_workers=None):
+        """
+        Applies many threshold changes with a single health-rule list GET.
+
+        `updates` is an iterable of dicts with "name" (exact name or fnmatch glob),
+        "critical", "warning" and an optional "condition" shortName. When several
+        entries match the same rule the later entry wins. Detail GETs and PUTs run
+        concurrently. Returns one result per matched rule, plus a failed result for
+        every entry that matched nothing.
+        """
+        try:
+            hr_ids = self._health_rule_ids(appd_id)
+        except Exception as e:
+            log.exception(f"Error listing health rules for application ID {appd_id}")
+            return [{"success": False, "error": str(e)}]
+
+        targets = {}
+        results = []
+        for entry in updates:
+            pattern = entry["name"]
+            if any(ch in pattern for ch in "*?["):
+                matched = fnmatch.filter(hr_ids, pattern)
+            else:
+                matched = [pattern] if pattern in hr_ids else []
+            if not matched:
+                log.warning(f"Health rule '{pattern}' not found.")
+                results.append({"success": False, "name": pattern, "message": "Health rule not found"})
+            for name in matched:
+                targets[name] = entry
+
+        log.info(f"Updating thresholds for {len(targets)} health rule(s) in {appd_id}")
+
+        def update(item):
+            name, entry = item
+            return self._update_thresholds_by_id(
+                appd_id, hr_ids[name], name,
+                entry.get("critical"), entry.get("warning"), entry.get("condition"),
+            )
+
+        workers = max(1, int(max_workers or self.max_workers))
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(targets)))) as executor:
+            results.extend(executor.map(update, targets.items()))
+        return results
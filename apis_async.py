@@ -0,0 +1,346 @@
+import asyncio
+import json
+import time
+import urllib.parse
+import logging
+
+import aiohttp
+
+from token_cache import TOKEN_CACHE
+from apis import controller_base_url
+
+log = logging.getLogger(__name__)
+
+
+class AsyncAppDynamics:
+    """
+    asyncio counterpart of apis.AppDynamics.
+
+    Uses one pooled aiohttp session for every controller call and a semaphore
+    to cap how many requests are in flight at once. Results use the same
+    {"success", "data", "status"} shape as the requests-based client.
+
+    Usage:
+        async with AsyncAppDynamics(env, client_id, account, secret) as appd:
+            appd_id = await appd.get_appID("my-app")
+    """
+
+    def __init__(self, env, client_id, account_name, client_secret,
+                 max_concurrency=10, retries=5, backoff_factor=0.2, base_url=None):
+        self.client_id = client_id
+        self.env = env
+        self.account_name = account_name
+        self.client_secret = client_secret
+        self.base_url = controller_base_url(account_name, base_url)
+        self.params = {"output": "json"}
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.token = None
+        self.token_refresh_at = 0
+        self.session = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._token_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        """Creates the pooled session and fetches an access token."""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=60),
+            )
+            await self.get_access_token()
+        return self
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @property
+    def headers(self):
+        return {
+            "Authorization": f"Bearer {self.token}",
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+        }
+
+    async def _request(self, method, url, **kwargs):
+        """
+        Sends one authenticated request. Like the sync client, refreshes the
+        token shortly before it expires and retries once with a fresh token
+        on a 401. Returns (status, body).
+        """
+        if self.token_refresh_at <= time.time():
+            await self.get_access_token()
+        sent_token = self.token
+        status, body = await self._send(method, url, headers=self.headers, **kwargs)
+        if status == 401:
+            log.info(f"401 from {url}; retrying once with a fresh access token")
+            if self.token == sent_token:
+                await self.get_access_token(force_refresh=True)
+            status, body = await self._send(method, url, headers=self.headers, **kwargs)
+        return status, body
+
+    async def _send(self, method, url, **kwargs):
+        """
+        Sends one request under the concurrency semaphore.
+        Retries 500/502/504 and connection errors with exponential backoff,
+        mirroring the urllib3 Retry policy of the sync client.
+        Returns (status, body) where body is decoded JSON or raw text.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    async with self.session.request(method, url, **kwargs) as resp:
+                        text = await resp.text()
+                        status = resp.status
+                if status in (500, 502, 504) and attempt < self.retries:
+                    await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+                    continue
+                try:
+                    body = json.loads(text) if text else None
+                except ValueError:
+                    body = text
+                return status, body
+            except aiohttp.ClientConnectionError:
+                if attempt >= self.retries:
+                    raise
+                await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    @staticmethod
+    def _raise_for_status(status, body, url):
+        if status >= 400:
+            raise RuntimeError(f"{status} error for {url}: {body}")
+
+    async def get_access_token(self, force_refresh=False):
+        """
+        Returns a valid access token from the shared token cache, fetching one
+        only when none is cached or the cached one is close to expiry.
+        Concurrent callers wait for a single fetch.
+        """
+        try:
+            async with self._token_lock:
+                if force_refresh:
+                    TOKEN_CACHE.invalidate(self.account_name, self.client_id, self.token)
+                entry = TOKEN_CACHE.get(self.account_name, self.client_id)
+                if entry is None:
+                    url = f"{self.base_url}api/oauth/access_token"
+                    payload = {
+                        "grant_type": "client_credentials",
+                        "client_id": f"{self.client_id}@{self.account_name}",
+                        "client_secret": self.client_secret,
+                    }
+                    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+                    status, body = await self._send("POST", url, data=payload, headers=headers)
+                    self._raise_for_status(status, body, url)
+                    entry = TOKEN_CACHE.put(
+                        self.account_name, self.client_id, body["access_token"], body.get("expires_in")
+                    )
+                self.token = entry["access_token"]
+                self.token_refresh_at = TOKEN_CACHE.refresh_at(entry)
+                return self.token
+        except Exception:
+            log.exception("Error retrieving access token")
+            raise
+
+    async def get_appID(self, ApplicationName):
+        try:
+            encoded_name = urllib.parse.quote(ApplicationName)
+            url = f"{self.base_url}rest/applications/{encoded_name}"
+            status, body = await self._request("GET", url, params=self.params)
+            self._raise_for_status(status, body, url)
+            return body[0]["id"]
+        except Exception:
+            log.exception(f"Error looking up application ID for {ApplicationName}")
+            raise
+
+    async def get_appd_nodes(self, appd_id):
+        try:
+            url = f"{self.base_url}rest/applications/{appd_id}/nodes"
+            status, body = await self._request("GET", url, params=self.params)
+            self._raise_for_status(status, body, url)
+            return body
+        except Exception:
+            log.exception(f"Error retrieving nodes for application ID {appd_id}")
+            raise
+
+    async def get_appd_tier(self, appd_id, appd_tier):
+        try:
+            tier = urllib.parse.quote(appd_tier)
+            url = f"{self.base_url}rest/applications/{appd_id}/tiers/{tier}/"
+            status, body = await self._request("GET", url, params=self.params)
+            self._raise_for_status(status, body, url)
+            return body
+        except Exception:
+            log.exception(f"Error retrieving tier {appd_tier} for application ID {appd_id}")
+            raise
+
+    async def _post(self, endpoint, appd_id, payload, entity_name):
+        if isinstance(payload, str):
+            log.error(
+                f"Invalid payload type (str) passed for {entity_name}. "
+                "Expected dict or list."
+            )
+            return {"success": False, "error": "Payload must be a dict or list"}
+
+        url = f"{self.base_url}alerting/rest/v1/applications/{appd_id}/{endpoint}"
+        name = payload.get("name")
+
+        try:
+            status, body = await self._request("POST", url, params=self.params, json=payload)
+
+            if status == 409 and endpoint == "health-rules":
+                log.info(
+                    f"{entity_name.title()} '{name}' already exists for {appd_id}; treating as success."
+                )
+                return {"success": True, "data": {"name": name}, "status": 409}
+
+            if status == 201:
+                log.info(
+                    f"Successfully created {entity_name} '{name}' for {appd_id} "
+                    f"(Status: {status})"
+                )
+                data = body if isinstance(body, (dict, list)) else {"name": name}
+                return {"success": True, "data": data, "status": status}
+
+            msg = body.get("message", body) if isinstance(body, dict) else body
+            log.warning(
+                f"Failed to create {entity_name} '{name}' for {appd_id}: "
+                f"{msg} (Status: {status})"
+            )
+            return {
+                "success": False,
+                "status": status,
+                "message": msg,
+                "data": {"name": name},
+            }
+
+        except Exception as e:
+            log.exception(
+                f"Exception while creating {entity_name} for {appd_id}"
+            )
+            return {"success": False, "error": str(e), "data": {"name": name}}
+
+    async def post_appd_hr(self, appd_id, payload):
+        return await self._post("health-rules", appd_id, payload, "health rule")
+
+    async def post_appd_policy(self, appd_id, payload):
+        return await self._post("policies", appd_id, payload, "policy")
+
+    async def post_appd_action(self, appd_id, payload):
+        return await self._post("actions", appd_id, payload, "action")
+
+    async def create_health_rules(self, appd_id, health_rule_payloads):
+        """
+        Posts every health rule payload concurrently (bounded by max_concurrency)
+        and returns the results in input order.
+        """
+        total = len(health_rule_payloads)
+
+        async def create(idx, payload):
+            log.info(f"Creating health rule {idx}/{total} for AppD ID: {appd_id}")
+            result = await self.post_appd_hr(appd_id, payload)
+            if not result["success"]:
+                log.warning(f"Health rule {idx} failed: {result.get('message') or result.get('error')}")
+            return result
+
+        return await asyncio.gather(
+            *(create(idx, payload) for idx, payload in enumerate(health_rule_payloads, start=1))
+        )
+
+    async def create_policy_with_dynamic_healthrules(self, appd_id, policy_payload):
+        """
+        Posts the given policy with already-injected healthRule names.
+        Assumes health rules were created earlier in the flow.
+        """
+        try:
+            scope = policy_payload["events"]["healthRuleEvents"]["healthRuleScope"]
+            if scope.get("healthRuleScopeType") == "SPECIFIC_HEALTH_RULES":
+                if not scope.get("healthRules"):
+                    log.warning("Policy has SPECIFIC_HEALTH_RULES but no healthRules provided.")
+            return await self.post_appd_policy(appd_id, policy_payload)
+        except Exception as e:
+            log.exception(f"Error creating policy for app {appd_id}")
+            return {"success": False, "error": str(e)}
+
+    async def update_health_rule_thresholds(self,
+                                            appd_id,
+                                            healthrule_name,
+                                            critical_value=None,
+                                            warning_value=None):
+        try:
+            # Step 1: fetch all health rules
+            url = f"{self.base_url}alerting/rest/v1/applications/{appd_id}/health-rules"
+            status, health_rules = await self._request("GET", url, params=self.params)
+            self._raise_for_status(status, health_rules, url)
+
+            # Step 2: locate target
+            target = next((hr for hr in health_rules if hr["name"] == healthrule_name), None)
+            if not target:
+                log.warning(f"Health rule '{healthrule_name}' not found.")
+                return {"success": False, "message": "Health rule not found"}
+
+            hr_url = f"{url}/{target['id']}"
+
+            # Step 3: fetch details
+            status, hr_data = await self._request("GET", hr_url, params=self.params)
+            self._raise_for_status(status, hr_data, hr_url)
+
+            eval_criterias = hr_data.get("evalCriterias", {})
+            critical_conditions = (eval_criterias.get("criticalCriteria") or {}).get("conditions", [])
+            warning_conditions = (eval_criterias.get("warningCriteria") or {}).get("conditions", [])
+
+            # Step 4: guard multi-conditions
+            if len(critical_conditions) > 1 or len(warning_conditions) > 1:
+                msg = (
+                    f"Health rule '{healthrule_name}' has multiple conditions. "
+                    "Threshold update skipped."
+                )
+                log.warning(msg)
+                return {"success": False, "message": msg}
+
+            # Step 5: apply new thresholds
+            if critical_value is not None and critical_conditions:
+                metric = critical_conditions[0]["evalDetail"]["metricEvalDetail"]
+                if "compareValue" in metric:
+                    old = metric["compareValue"]
+                    metric["compareValue"] = float(critical_value)
+                    log.info(
+                        f"Updated critical threshold from {old} to {critical_value} "
+                        f"for '{healthrule_name}'."
+                    )
+
+            if warning_value is not None:
+                if warning_conditions:
+                    metric = warning_conditions[0]["evalDetail"]["metricEvalDetail"]
+                    if "compareValue" in metric:
+                        old = metric["compareValue"]
+                        metric["compareValue"] = float(warning_value)
+                        log.info(
+                            f"Updated warning threshold from {old} to {warning_value} "
+                            f"for '{healthrule_name}'."
+                        )
+                else:
+                    log.info(
+                        f"No warning criteria for '{healthrule_name}'. Skipping warning update."
+                    )
+
+            # Step 6: PUT update
+            status, body = await self._request("PUT", hr_url, params=self.params, json=hr_data)
+            self._raise_for_status(status, body, hr_url)
+
+            log.info(f"Successfully updated thresholds for '{healthrule_name}'")
+            return {"success": True, "message": "Thresholds updated"}
+
+        except Exception as e:
+            log.exception(f"Error updating health rule '{healthrule_name}'")
+            return {"success": False, "error": str(e)}
@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import dag
+import main as onboarding
+from apis import AppDynamics
+from metrics import METRICS
+
+log = onboarding.log
+
+DEFAULT_MANIFEST_PATH = "requests.jsonl"
+DEFAULT_BATCH_WORKERS = 4
+# Manifest entries resolved and scheduled together as one dependency graph
+DEFAULT_CHUNK_SIZE = 50
+
+# ─── Manifest handling ─────────────────────────────────────────────────────────
+
+def iter_manifest(path):
+    """
+    Streams (line_number, entry) pairs from a JSONL manifest.
+    Blank lines are skipped; malformed lines are yielded as {"_error": ...}
+    so they still get a result line.
+    """
+    with open(path, "r") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+                if not isinstance(entry, dict):
+                    raise ValueError("manifest entry must be a JSON object")
+            except ValueError as err:
+                entry = {"_error": f"Malformed manifest line: {err}"}
+            yield line_no, entry
+
+
+def _text(value):
+    """Manifest values may be numbers or null ("APPD_TIER": 42); params are strings."""
+    return "" if value is None else str(value).strip()
+
+
+def build_params(entry, settings):
+    """
+    Builds the template params for one manifest entry. Keys use the same
+    names as main.py's env vars; missing keys fall back to `settings`
+    (main.load_settings()).
+    """
+    emails = entry.get("USER_EMAIL", settings.email_list)
+    if isinstance(emails, list):
+        emails = [_text(e) for e in emails if _text(e)]
+    else:
+        emails = [e.strip() for e in _text(emails).split(",") if e.strip()]
+
+    return {
+        "appd_env":        _text(entry.get("APPD_ENV", settings.appd_env)),
+        "BusinessName":    _text(entry.get("BusinessName", settings.BusinessName)).upper(),
+        "ApplicationName": _text(entry.get("ApplicationName", settings.ApplicationName)),
+        "appd_tier":       _text(entry.get("APPD_TIER", settings.appd_tier)),
+        "user_email":      emails,
+        "critical_value":  entry.get("CRITICAL_VALUE", settings.critical_value),
+        "warning_value":   entry.get("WARNING_VALUE", settings.warning_value),
+        "update":          False,
+        "healthrule_name": "",
+    }
+
+
+# ─── Per-entry onboarding ──────────────────────────────────────────────────────
+
+def resolve_entry(appd, config, entry, settings):
+    """
+    Resolves what one manifest entry's onboarding steps need. Returns
+    (summary, context) where context is (appd_id, tier_type, monitoring, params),
+    or None when the entry stops here (error or unsupported tier) with the
+    reason recorded in the summary.
+    """
+    if "_error" in entry:
+        return {"status": "error", "error": entry["_error"]}, None
+
+    params = build_params(entry, settings)
+    monitoring = str(entry.get("Synthetic", settings.monitoring)).strip().lower()
+    summary = {
+        "ApplicationName": params["ApplicationName"],
+        "appd_tier":       params["appd_tier"],
+    }
+
+    try:
+        appd_id = appd.get_appID(params["ApplicationName"])
+        summary["appd_id"] = appd_id
+
+        tier_type = None
+        if monitoring != "synthetic":
+            if not params["appd_tier"]:
+                return {**summary, "status": "error", "error": "APPD_TIER is required"}, None
+            # Resolved from one tier listing per application, not a GET per tier
+            tiers = appd.find_appd_tier(appd_id, params["appd_tier"])
+            if not tiers:
+                return {**summary, "status": "error", "error": "Tier not found"}, None
+            tier_type = tiers[0]["type"]
+        summary["tier_type"] = tier_type
+    except Exception as e:
+        log.error("Onboarding error for %s/%s: %s",
+                  params["ApplicationName"], params["appd_tier"], e)
+        return {**summary, "status": "error", "error": str(e)}, None
+
+    if monitoring != "synthetic" and tier_type not in config.get("supported_tier_types", []):
+        log.warning("Skipping unsupported tier type: %s", tier_type)
+        return {**summary, "status": "skipped", "reason": "unsupported tier type"}, None
+
+    return summary, (appd_id, tier_type, monitoring, params)
+
+
+def finish_entry(summary, keys, results):
+    """Turns one entry's step results into its JSON-serialisable result line."""
+    outcome = onboarding.summarize_steps(keys, results)
+    return {
+        **summary,
+        "status":          "ok" if not outcome["failed"] else "partial",
+        "actions":         len(outcome["actions"]),
+        "health_rules":    outcome["health_rules"],
+        "policies":        len(outcome["policies"]),
+        "failed":          outcome["failed"],
+    }
+
+# ─── Batch driver ──────────────────────────────────────────────────────────────
+
+def run_batch(appd, config, entries, out, workers=DEFAULT_BATCH_WORKERS, settings=None,
+              chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Onboards (line_number, entry) pairs with one shared client, `chunk_size`
+    entries at a time so the manifest is streamed rather than loaded whole.
+
+    Each chunk's entries are resolved, then all of their steps run as one
+    dag.Graph on workers x appd.max_workers threads: tier B's actions run while tier A's health
+    rules are in flight, and each policy starts as soon as its own tier is
+    ready. Result lines are written to `out` in manifest order.
+    Returns a {status: count} summary.
+    """
+    settings = settings or onboarding.load_settings()
+    workers = max(1, int(workers))
+    counts = {}
+
+    def run_chunk(chunk):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            resolved = list(executor.map(
+                lambda item: resolve_entry(appd, config, item[1], settings), chunk
+            ))
+
+        graph = dag.Graph()
+        steps = [
+            None if context is None
+            else onboarding.add_onboarding_steps(graph, appd, context[0], config, *context[1:])
+            for _, context in resolved
+        ]
+        # Same in-flight bound as per-entry onboarding had: entries x HR workers each
+        results = graph.run(max_workers=workers * appd.max_workers) if len(graph) else {}
+
+        for (line_no, _), (summary, _), keys in zip(chunk, resolved, steps):
+            result = {"line": line_no, **(summary if keys is None else finish_entry(summary, keys, results))}
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            out.write(json.dumps(result) + "\n")
+        out.flush()
+
+    chunk = []
+    for item in entries:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            run_chunk(chunk)
+            chunk = []
+    if chunk:
+        run_chunk(chunk)
+
+    return counts
+
+
+def main(manifest_path=None):
+    onboarding.setup_logging()
+    settings = onboarding.load_settings()
+    manifest_path = manifest_path or os.getenv("MANIFEST_PATH", "").strip() or DEFAULT_MANIFEST_PATH
+    results_path = os.getenv("RESULTS_PATH", "").strip()
+    workers = int(os.getenv("BATCH_WORKERS", "").strip() or DEFAULT_BATCH_WORKERS)
+    chunk_size = int(os.getenv("BATCH_CHUNK", "").strip() or DEFAULT_CHUNK_SIZE)
+    print(f"Batch onboarding from {manifest_path}", "\n")
+
+    config = onboarding.load_config()
+    client_id, client_secret = onboarding.get_secrets(settings.account_name, settings.secrets_file_path)
+
+    # One client (one token, one pooled session, one app-id cache) for the whole batch
+    appd = AppDynamics(
+        settings.appd_env, client_id, settings.account_name, client_secret,
+        max_workers=settings.hr_workers, pool_size=workers * settings.hr_workers,
+    )
+
+    out = open(results_path, "w") if results_path else sys.stdout
+    try:
+        counts = run_batch(
+            appd, config, iter_manifest(manifest_path), out, workers, settings, chunk_size
+        )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    log.info("Batch finished: %s", counts)
+    log.info("Controller request stats: %s", appd.rate_limiter.stats())
+    METRICS.write(settings.metrics_path, settings.prom_textfile)
+    return 0 if set(counts) <= {"ok", "skipped"} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,395 @@
+"""
+Repeatable benchmarks for the onboarding code paths.
+
+Measures template rendering, db_hr payload generation, create_health_rules
+at several concurrency levels and full batch onboarding runs, all against
+synthetic templates and a local mock_controller with fixed latency, so the
+numbers do not depend on a real controller or the production templates.
+
+    python bench.py --out bench_results.json
+    python bench.py --out bench_results.json --compare baseline.json --tolerance 0.15
+
+Results are written as JSON: {"meta": {...}, "results": {name: {...}}}. Every
+result carries "seconds" (median wall time over --repeat runs); --compare
+flags any benchmark whose median is more than --tolerance slower than the
+baseline's and exits non-zero.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+BENCH_GROUPS = ("render", "db", "hr", "onboarding")
+HR_TEMPLATE_COUNT = 8
+
+HR_TEMPLATE = """{
+    "name": "{{BusinessName}}.{{ApplicationName}}.{{appd_env}}.{{appd_tier}} | Bench HR __INDEX__",
+    "enabled": true,
+    "useDataFromLastNMinutes": 30,
+    "waitTimeAfterViolation": 5,
+    "scheduleName": "Always",
+    "affects": {
+        "affectedEntityType": "TIER_NODE_TRANSACTION_PERFORMANCE",
+        "affectedEntities": {
+            "tierOrNode": "TIER_AFFECTED_ENTITIES",
+            "typeofNode": "ALL_NODES",
+            "affectedTiers": {"tierScope": "SPECIFIC_TIERS", "tiers": ["{{appd_tier}}"]}
+        }
+    },
+    "evalCriterias": {
+        {% for level, value in [("critical", critical_value or 1000), ("warning", warning_value or 500)] %}
+        "{{level}}Criteria": {
+            "conditionAggregationType": "ALL",
+            "conditions": [{
+                "name": "Metric __INDEX__",
+                "shortName": "A",
+                "evaluateToTrueOnNoData": false,
+                "evalDetail": {
+                    "evalDetailType": "SINGLE_METRIC",
+                    "metricAggregateFunction": "VALUE",
+                    "metricPath": "Average Response Time (ms)",
+                    "metricEvalDetail": {
+                        "metricEvalDetailType": "SPECIFIC_TYPE",
+                        "compareCondition": "GREATER_THAN_SPECIFIC_VALUE",
+                        "compareValue": {{value}}
+                    }
+                }
+            }]
+        }{% if not loop.last %},{% endif %}
+        {% endfor %}
+    }
+}
+"""
+
+ACTION_TEMPLATE = """{
+    "name": "email_list",
+    "actionType": "EMAIL",
+    "emails": {{ user_email | tojson }}
+}
+"""
+
+
+# ─── Fixtures ──────────────────────────────────────────────────────────────────
+
+def write_fixtures(root):
+    """
+    Writes the synthetic templates under root/templates and returns the
+    matching config (same keys as config.json).
+    """
+    templates = root / "templates"
+    templates.mkdir(parents=True, exist_ok=True)
+    (templates / "bench_action.json.j2").write_text(ACTION_TEMPLATE)
+    shutil.copy(Path(__file__).parent / "policy_template.j2", templates / "bench_policy.json.j2")
+    hr_templates = []
+    for index in range(HR_TEMPLATE_COUNT):
+        name = f"bench_hr_{index}.json.j2"
+        (templates / name).write_text(HR_TEMPLATE.replace("__INDEX__", str(index)))
+        hr_templates.append(name)
+    return {
+        "supported_tier_types": ["Application Server"],
+        "base_actions":         ["bench_action.json.j2"],
+        "jvm_healthrules":      hr_templates,
+        "clr_healthrules":      hr_templates,
+        "base_healthrules":     hr_templates,
+        "synthetic_healthrules": hr_templates,
+        "policies":             ["bench_policy.json.j2"],
+    }
+
+
+def template_params(app, tier):
+    return {
+        "appd_env":        "BENCH",
+        "BusinessName":    "BENCH",
+        "ApplicationName": app,
+        "appd_tier":       tier,
+        "user_email":      ["bench@example.com"],
+        "critical_value":  None,
+        "warning_value":   None,
+        "update":          False,
+        "healthrule_name": "",
+        "healthrule_names": [f"Bench HR {i}" for i in range(HR_TEMPLATE_COUNT)],
+    }
+
+
+def manifest_entries(app, tiers):
+    """(line_number, entry) pairs in the shape batch.iter_manifest yields."""
+    return [
+        (line_no, {
+            "APPD_ENV":        "BENCH",
+            "BusinessName":    "BENCH",
+            "ApplicationName": app,
+            "APPD_TIER":       f"tier-{line_no:04d}",
+            "USER_EMAIL":      "bench@example.com",
+        })
+        for line_no in range(1, tiers + 1)
+    ]
+
+
+# ─── Timing ────────────────────────────────────────────────────────────────────
+
+def measure(run, repeat, setup=None, ops=1):
+    """
+    Calls run(setup()) `repeat` times, timing only run(). Returns the median,
+    min and max wall time plus ops_per_sec, and the last run's return value.
+    """
+    samples, value = [], None
+    for attempt in range(repeat):
+        arg = setup(attempt) if setup else None
+        start = time.perf_counter()
+        value = run(arg)
+        samples.append(time.perf_counter() - start)
+    median = statistics.median(samples)
+    result = {
+        "seconds":     round(median, 6),
+        "min":         round(min(samples), 6),
+        "max":         round(max(samples), 6),
+        "repeat":      repeat,
+        "ops":         ops,
+        "ops_per_sec": round(ops / median, 2) if median else None,
+    }
+    return result, value
+
+
+# ─── Benchmarks ────────────────────────────────────────────────────────────────
+
+def bench_render(config, repeat, sizes=(100, 1000)):
+    import render
+
+    templates = config["base_actions"] + config["jvm_healthrules"] + config["policies"]
+    results = {}
+    for size in sizes:
+        params = [template_params("bench-app", f"tier-{i:04d}") for i in range(size)]
+
+        def render_all(_):
+            for p in params:
+                for tmpl in templates:
+                    render.render_template_json(tmpl, p)
+
+        ops = size * len(templates)
+        results[f"render.cold[params={size}]"], _ = measure(
+            render_all, repeat, setup=lambda _: render.clear_render_cache(), ops=ops
+        )
+        results[f"render.warm[params={size}]"], _ = measure(render_all, repeat, ops=ops)
+    return results
+
+
+def bench_db_payloads(repeat, sizes=(10, 100, 1000), group_size=0):
+    import db_hr
+
+    results = {}
+    for size in sizes:
+        # Same comma-separated form as the DATABASES env var
+        databases = ",".join(f"db-{i:05d}" for i in range(size))
+
+        def build(_):
+            builder = db_hr.AppDPolicyActionBuilder(
+                "BENCH", "ORACLE", "bench-app", "BENCH", databases,
+                "bench@example.com", "bench", "secret", "client", group_size=group_size,
+            )
+            health_rules = []
+            for rule_key in db_hr.DEFAULT_DB_RULES:
+                name = f"BENCH.ORACLE.{rule_key}"
+                builder.process_health_rule(name, builder.create_payload(name), health_rules, rule_key)
+            return len(health_rules)
+
+        result, count = measure(build, repeat)
+        result.update(ops=count, ops_per_sec=round(count / result["seconds"], 2))
+        results[f"db.payloads[dbs={size}]"] = result
+    return results
+
+
+def bench_create_health_rules(client_factory, config, repeat, workers=(1, 4, 16)):
+    import render
+
+    results = {}
+    for count in workers:
+        def setup(attempt):
+            # A fresh application per run, so every POST is a create
+            appd = client_factory(count)
+            app = f"bench-hr-w{count}-{attempt}"
+            appd_id = appd.get_appID(app)
+            params = template_params(app, "tier-0001")
+            payloads = [render.render_template_json(t, params) for t in config["jvm_healthrules"]]
+            return appd, appd_id, payloads
+
+        def run(arg):
+            appd, appd_id, payloads = arg
+            return appd.create_health_rules(appd_id, payloads, max_workers=count)
+
+        result, last = measure(run, repeat, setup=setup, ops=len(config["jvm_healthrules"]))
+        result["failed"] = sum(1 for r in last if not r.get("success"))
+        results[f"hr.create[workers={count}]"] = result
+    return results
+
+
+def bench_onboarding(controller, client_factory, config, repeat, tiers=(1, 10, 100), workers=8):
+    import batch
+
+    results = {}
+    for count in tiers:
+        def setup(attempt):
+            appd = client_factory(workers, pool_size=workers * workers)
+            entries = manifest_entries(f"bench-onboard-t{count}-{attempt}", count)
+            # Tiers exist up front, as they would on a real controller
+            controller.state.add_application(
+                entries[0][1]["ApplicationName"],
+                tiers={entry["APPD_TIER"]: "Application Server" for _, entry in entries},
+            )
+            return appd, entries
+
+        def run(arg):
+            appd, entries = arg
+            return batch.run_batch(appd, config, entries, io.StringIO(), workers=workers)
+
+        before = sum(controller.stats().values())
+        result, counts = measure(run, repeat, setup=setup, ops=count)
+        result["statuses"] = counts
+        result["requests_per_run"] = (sum(controller.stats().values()) - before) // repeat
+        results[f"onboarding[tiers={count}]"] = result
+    return results
+
+
+# ─── Reporting ─────────────────────────────────────────────────────────────────
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares median seconds with a baseline results file. Returns
+    (report_lines, regressions) where regressions names every benchmark more
+    than `tolerance` (a fraction) slower than the baseline.
+    """
+    lines, regressions = [], []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("seconds"):
+            lines.append(f"  {name:<32} {result['seconds']:>10.4f}s   (no baseline)")
+            continue
+        ratio = result["seconds"] / base["seconds"]
+        if ratio > 1 + tolerance:
+            verdict = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            verdict = "faster"
+        else:
+            verdict = "ok"
+        lines.append(
+            f"  {name:<32} {result['seconds']:>10.4f}s  vs {base['seconds']:>10.4f}s  "
+            f"{(ratio - 1) * 100:+7.1f}%  {verdict}"
+        )
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the onboarding code paths")
+    parser.add_argument("--out", default="bench_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Baseline results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Allowed slowdown against the baseline (0.10 = 10%%)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", default=",".join(BENCH_GROUPS),
+                        help=f"Comma-separated groups to run ({', '.join(BENCH_GROUPS)})")
+    parser.add_argument("--latency", default="fixed:0.02",
+                        help="Mock controller latency spec (see mock_controller.LatencyModel)")
+    parser.add_argument("--client-rate", type=float, default=1000.0,
+                        help="Client-side requests/second per rate-limit bucket")
+    args = parser.parse_args()
+    groups = {g.strip() for g in args.only.split(",") if g.strip()}
+
+    workdir = Path(tempfile.mkdtemp(prefix="appd-bench-"))
+    config = write_fixtures(workdir)
+    # Read on first render / client creation; token and lookup caches stay in memory
+    os.environ["TEMPLATES_PATH"] = str(workdir / "templates")
+    os.environ["JINJA_CACHE_DIR"] = str(workdir / "jinja-cache")
+    os.environ["APPD_TOKEN_CACHE"] = ""
+    os.environ["APPD_LOOKUP_CACHE"] = ""
+
+    from apis import AppDynamics
+    from ratelimit import RATE_BUCKETS, RateLimiter
+    from mock_controller import MockController
+    from log_config import configure_logging
+
+    # Onboarding logs every entity at INFO, which would dominate the timings
+    configure_logging(level="WARNING")
+
+    controller = MockController(latency=args.latency).start()
+
+    def client_factory(max_workers, pool_size=None):
+        limiter = RateLimiter(
+            rates={name: args.client_rate for name in RATE_BUCKETS},
+            max_concurrency=max(16, max_workers),
+        )
+        return AppDynamics(
+            "BENCH", "bench", "bench", "secret",
+            max_workers=max_workers, rate_limiter=limiter, base_url=controller.url,
+            pool_size=pool_size,
+        )
+
+    results = {}
+    try:
+        if "render" in groups:
+            results.update(bench_render(config, args.repeat))
+        if "db" in groups:
+            results.update(bench_db_payloads(args.repeat))
+        if "hr" in groups:
+            results.update(bench_create_health_rules(client_factory, config, args.repeat))
+        if "onboarding" in groups:
+            results.update(bench_onboarding(controller, client_factory, config, args.repeat))
+    finally:
+        controller.shutdown()
+        controller.server_close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at":  time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit":      _git_commit(),
+            "python":      platform.python_version(),
+            "platform":    platform.platform(),
+            "repeat":      args.repeat,
+            "latency":     args.latency,
+            "client_rate": args.client_rate,
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} benchmark results to {args.out}")
+
+    if not args.compare:
+        for name, result in results.items():
+            print(f"  {name:<32} {result['seconds']:>10.4f}s  {result['ops_per_sec']:>12} ops/s")
+        return 0
+
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    lines, regressions = compare(results, baseline, args.tolerance)
+    print(f"Compared with {args.compare} (commit {baseline.get('meta', {}).get('commit')}):")
+    print("\n".join(lines))
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
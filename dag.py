@@ -0,0 +1,113 @@
+import time
+import logging
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+log = logging.getLogger(__name__)
+
+# Outcome of one node: status is "ok", "error" or "skipped" (an upstream node failed)
+NodeResult = namedtuple("NodeResult", ["status", "value", "error", "seconds"])
+
+
+class Graph:
+    """
+    A dependency graph of callables, run by a thread-pool scheduler.
+
+    Each node is fn(inputs) -> value, where inputs maps each dependency's key
+    to its value. A node starts as soon as all of its dependencies finished,
+    so independent chains overlap and the wall time approaches the longest
+    chain rather than the sum of every step. A node whose dependency raised is
+    skipped, and so is everything downstream of it.
+
+    Dependencies must be added before their dependents, which also keeps the
+    graph acyclic.
+    """
+
+    def __init__(self):
+        self._nodes = {}   # key -> (fn, deps), in insertion (topological) order
+
+    def __contains__(self, key):
+        return key in self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def add(self, key, fn, deps=()):
+        """Adds a node and returns its key. Adding an existing key is a no-op."""
+        if key in self._nodes:
+            return key
+        missing = [d for d in deps if d not in self._nodes]
+        if missing:
+            raise ValueError(f"Node {key!r} depends on unknown node(s): {missing!r}")
+        self._nodes[key] = (fn, tuple(deps))
+        return key
+
+    @staticmethod
+    def _call(key, fn, inputs):
+        start = time.perf_counter()
+        try:
+            value = fn(inputs)
+        except Exception as e:
+            log.exception(f"Step {key!r} failed")
+            return NodeResult("error", None, str(e), time.perf_counter() - start)
+        return NodeResult("ok", value, None, time.perf_counter() - start)
+
+    def run(self, max_workers=8):
+        """Runs every node and returns {key: NodeResult}."""
+        results = {}
+        remaining = {key: len(deps) for key, (_, deps) in self._nodes.items()}
+        dependents = {key: [] for key in self._nodes}
+        for key, (_, deps) in self._nodes.items():
+            for dep in deps:
+                dependents[dep].append(key)
+
+        ready = deque(key for key, count in remaining.items() if count == 0)
+        running = {}
+        started = time.perf_counter()
+
+        def finish(key, result):
+            results[key] = result
+            for dependent in dependents[key]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+
+        with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+            while ready or running:
+                while ready:
+                    key = ready.popleft()
+                    fn, deps = self._nodes[key]
+                    failed = [d for d in deps if results[d].status != "ok"]
+                    if failed:
+                        finish(key, NodeResult("skipped", None, f"upstream step {failed[0]!r} failed", 0.0))
+                        continue
+                    inputs = {d: results[d].value for d in deps}
+                    running[executor.submit(self._call, key, fn, inputs)] = key
+                if running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(running.pop(future), future.result())
+
+        elapsed = time.perf_counter() - started
+        path_seconds, _ = self.critical_path(results)
+        work = sum(r.seconds for r in results.values())
+        log.info(
+            f"Ran {len(results)} step(s) in {elapsed:.2f}s "
+            f"(critical path {path_seconds:.2f}s, total work {work:.2f}s)"
+        )
+        return results
+
+    def critical_path(self, results):
+        """
+        Longest chain of measured step durations: (seconds, [keys]). This is the
+        lower bound on wall time however many workers run the graph.
+        """
+        longest = {}
+        for key, (_, deps) in self._nodes.items():
+            own = results[key].seconds if key in results else 0.0
+            best = max(deps, key=lambda d: longest[d][0], default=None)
+            if best is None:
+                longest[key] = (own, [key])
+            else:
+                longest[key] = (longest[best][0] + own, longest[best][1] + [key])
+        return max(longest.values(), key=lambda item: item[0], default=(0.0, []))
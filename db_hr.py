@@ -1,11 +1,21 @@
 from sys import exit
 import json
+import logging
 import requests
 import os
 import sys
-from pathlib import Path
-from jinja2 import Environment, FileSystemLoader, StrictUndefined
-from jinja2.exceptions import TemplateNotFound
+import time
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from render import render_template_json
+from token_cache import TOKEN_CACHE
+import db_inventory
+from log_config import LazyJson, configure_logging
+
+log = logging.getLogger(__name__)
 
 BASE_PAYLOAD_TEMPLATE = {
     "name": None,  # Placeholder for health_rule_name
@@ -36,39 +46,37 @@ PARAMS_TEMPLATE = {
     "user_email": "{{user_email}}"
 }
 
-TEMPLATE_ENV = Environment(
-    loader=FileSystemLoader(
-        searchpath=Path(__file__).parent.parent.joinpath("templates"),
-    ),
-    undefined=StrictUndefined,
-    keep_trailing_newline=True,
-    lstrip_blocks=True,
-    trim_blocks=True,
-)
-
-def render_template_json(template, params):
+def build_session(pool_size=10):
+    """Keep-alive session with the same retry policy as apis.AppDynamics."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        max_retries=Retry(
+            total=5,
+            read=5,
+            connect=5,
+            backoff_factor=0.2,
+            allowed_methods=frozenset(["GET", "POST", "PUT"]),
+            status_forcelist=(500, 502, 504),
+        ),
+        pool_maxsize=max(10, pool_size),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def post_request(url, headers, payload, session=None):
     """
-    Accepts a template filename and parameters to pass to the template
-    when rendering. Produces a rendered template as a string.
-    
+    POSTs a payload and returns the created entity. `session` is anything
+    with requests' post(): a Session, or an AppDPolicyActionBuilder, whose
+    post() keeps the access token fresh.
     """
     try:
-        appd_obj = TEMPLATE_ENV.get_template(template).render(params)
-        appd_obj_json = json.loads(appd_obj)
-        json_string = json.dumps(appd_obj_json, indent=2)
-        return json_string
-
-    except TemplateNotFound as e:
-        exit(f"{e.__class__.__name__} : templates/{e}")
-
-def post_request(url, headers, payload):
-    try:
-        response = requests.post(
+        response = (session or requests).post(
                 url= url,
                 headers=headers,
-                data=payload,
+                data=payload if isinstance(payload, str) else json.dumps(payload),
         )
-        print(f"*******71****: {url} {payload}")
+        log.debug("POST %s payload: %s", url, payload if isinstance(payload, str) else LazyJson(payload))
         if response.status_code != 201:
             response_text = json.loads(response.text.encode("utf8"))
             print(
@@ -86,6 +94,29 @@ def post_request(url, headers, payload):
             f"Error  for {url} : {e}, response status code:{response.status_code} response text:{response.text}\n"
         )
 
+def group_databases(databases, group_size):
+    """
+    Splits databases into deterministic groups of about `group_size`.
+
+    Each database lands in bucket crc32(serverName) % bucket_count, where
+    bucket_count is ceil(len / group_size) rounded up to a power of two. Adding
+    or removing a database therefore changes only its own bucket, until the
+    fleet grows or shrinks past a power-of-two boundary and most databases
+    move; AppDPolicyActionBuilder.prune_group_rules() then deletes the group
+    rules left behind. Returns [(bucket_index, [databases sorted by serverName])]
+    for non-empty buckets.
+    """
+    needed = max(1, -(-len(databases) // max(1, group_size)))
+    bucket_count = 1 << (needed - 1).bit_length()
+    buckets = {}
+    for db in databases:
+        index = zlib.crc32(db["serverName"].encode("utf-8")) % bucket_count
+        buckets.setdefault(index, []).append(db)
+    return [
+        (index, sorted(buckets[index], key=lambda db: db["serverName"]))
+        for index in sorted(buckets)
+    ]
+
 def databases_generator(databases):
     """Generate the specific database list."""
     if databases is None:
@@ -104,284 +135,191 @@ def databases_generator(databases):
     return db_list
 
 
-def get_db_calls_per_min(data=None):
-    """Template for DB calls per min."""
-    new_data = data.copy()
-    new_data["name"] += " - DB Calls Per Min"
-    new_data["evalCriterias"] = {
-        "criticalCriteria": {
-            "conditionAggregationType": "ALL",
-            "conditionExpression": None,
-            "conditions": [
-                {
-                    "name": "High Number of Connections",
-                    "shortName": "A",
-                    "evaluateToTrueOnNoData": "false",
-                    "evalDetail": {
-                        "evalDetailType": "SINGLE_METRIC",
-                        "metricAggregateFunction": "VALUE",
-                        "metricPath": "DB|KPI|Number of Connections",
-                        "metricEvalDetail": {
-                            "metricEvalDetailType": "SPECIFIC_TYPE",
-                            "compareCondition": "GREATER_THAN_SPECIFIC_VALUE",
-                            "compareValue": 200000,
-                        },
-                    },
-                    "triggerEnabled": "true",
-                    "minimumTriggers": 15,
-                },
-                {
-                    "name": "Number of Connections above 4 standard deviations of the default baseline",
-                    "shortName": "B",
-                    "evaluateToTrueOnNoData": "false",
-                    "evalDetail": {
-                        "evalDetailType": "SINGLE_METRIC",
-                        "metricAggregateFunction": "VALUE",
-                        "metricPath": "DB|KPI|Number of Connections",
-                        "metricEvalDetail": {
-                            "metricEvalDetailType": "BASELINE_TYPE",
-                            "baselineCondition": "GREATER_THAN_BASELINE",
-                            "baselineName": "Default Baseline",
-                            "compareValue": 4,
-                            "baselineUnit": "STANDARD_DEVIATIONS",
-                        },
-                    },
-                    "triggerEnabled": "false",
-                    "minimumTriggers": 15,
-                },
-            ],
-            "evalMatchingCriteria": None,
+# ─── DB health-rule catalog ────────────────────────────────────────────────────
+# One entry per rule type. A condition with "baselineName" compares against that
+# baseline in standard deviations; otherwise it compares to a fixed value.
+DB_RULE_CATALOG = {
+    "calls_per_min": {
+        "suffix": " - DB Calls Per Min",
+        "label": "DB CALLS PER MINUTE",
+        "conditions": (
+            {"name": "High Number of Connections", "shortName": "A",
+             "metricPath": "DB|KPI|Number of Connections",
+             "compareCondition": "GREATER_THAN_SPECIFIC_VALUE", "compareValue": 200000,
+             "minimumTriggers": 15},
+            {"name": "Number of Connections above 4 standard deviations of the default baseline", "shortName": "B",
+             "metricPath": "DB|KPI|Number of Connections",
+             "baselineName": "Default Baseline", "compareValue": 4,
+             "minimumTriggers": 15},
+        ),
+    },
+    "conn_per_min": {
+        "suffix": " - DB Connections Per Minute",
+        "label": "DB CONNECTIONS PER MINUTE",
+        "conditions": (
+            {"name": "High Number of Connections", "shortName": "A",
+             "metricPath": "DB|KPI|Number of Connections",
+             "compareCondition": "GREATER_THAN_SPECIFIC_VALUE", "compareValue": 30,
+             "minimumTriggers": 10},
+            {"name": "Number of Connections above 4 standard deviations of the default baseline", "shortName": "B",
+             "metricPath": "DB|KPI|Number of Connections",
+             "baselineName": "Default Baseline", "compareValue": 3,
+             "minimumTriggers": 10},
+        ),
+    },
+    "exec_time": {
+        "suffix": " - DB Time Spent in Executions",
+        "label": "DB TIME SPENT IN EXECUTIONS",
+        "conditions": (
+            {"name": "Query Execution Time", "shortName": "A",
+             "metricPath": "DB|KPI|Time Spent in Executions (s)",
+             "compareCondition": "GREATER_THAN_SPECIFIC_VALUE", "compareValue": 3000,
+             "minimumTriggers": 15},
+            {"name": "Condition 2", "shortName": "B",
+             "metricPath": "DB|KPI|Time Spent in Executions (s)",
+             "baselineName": "Daily Trend - Last 30 days", "compareValue": 4,
+             "minimumTriggers": 15},
+        ),
+    },
+    "gc_block": {
+        "suffix": " - DB gc current block receive time",
+        "label": "DB GC CURRENT BLOCK RECEIVE TIME",
+        "conditions": (
+            {"name": "gc current block receive time HIGH", "shortName": "A",
+             "metricPath": "DB|Server Statistic|gc current block receive time",
+             "compareCondition": "GREATER_THAN_SPECIFIC_VALUE", "compareValue": 12000,
+             "minimumTriggers": 15},
+            {"name": "Condition 2", "shortName": "B",
+             "metricPath": "DB|Server Statistic|gc current block receive time",
+             "baselineName": "Default Baseline", "compareValue": 4,
+             "minimumTriggers": 15},
+        ),
+    },
+    "connections": {
+        "suffix": " - Drop in connections",
+        "label": "DROP IN CONNECTIONS",
+        "conditions": (
+            {"name": "Drop in connections", "shortName": "A",
+             "metricPath": "DB|KPI|Number of Connections",
+             "compareCondition": "LESS_THAN_SPECIFIC_VALUE", "compareValue": 1,
+             "minimumTriggers": 10},
+        ),
+    },
+    "availability": {
+        "suffix": " - DBAvailablity",
+        "label": "DB AVAILABILITY",
+        "conditions": (
+            {"name": "DBAvailablity", "shortName": "A",
+             "metricPath": "DB|KPI|DB Availability",
+             "compareCondition": "LESS_THAN_SPECIFIC_VALUE", "compareValue": 1,
+             "minimumTriggers": 10},
+        ),
+    },
+}
+
+# Rule types created by main(), in creation order
+DEFAULT_DB_RULES = ("conn_per_min", "exec_time", "gc_block", "connections", "availability")
+
+
+def _compile_condition(spec):
+    if "baselineName" in spec:
+        metric_eval_detail = {
+            "metricEvalDetailType": "BASELINE_TYPE",
+            "baselineCondition": spec.get("baselineCondition", "GREATER_THAN_BASELINE"),
+            "baselineName": spec["baselineName"],
+            "compareValue": spec["compareValue"],
+            "baselineUnit": spec.get("baselineUnit", "STANDARD_DEVIATIONS"),
+        }
+        trigger_enabled = spec.get("triggerEnabled", "false")
+    else:
+        metric_eval_detail = {
+            "metricEvalDetailType": "SPECIFIC_TYPE",
+            "compareCondition": spec["compareCondition"],
+            "compareValue": spec["compareValue"],
+        }
+        trigger_enabled = spec.get("triggerEnabled", "true")
+
+    return {
+        "name": spec["name"],
+        "shortName": spec["shortName"],
+        "evaluateToTrueOnNoData": "false",
+        "evalDetail": {
+            "evalDetailType": "SINGLE_METRIC",
+            "metricAggregateFunction": "VALUE",
+            "metricPath": spec["metricPath"],
+            "metricEvalDetail": metric_eval_detail,
         },
-        "warningCriteria": None,
+        "triggerEnabled": trigger_enabled,
+        "minimumTriggers": spec["minimumTriggers"],
     }
-    return new_data
 
-def get_db_conn_per_min(data=None):
-    """Template for DB connections per min."""
-    new_data = data.copy()
-    new_data["name"] += " - DB Connections Per Minute"
-    new_data["evalCriterias"] = {
+
+def _compile_rule(entry):
+    """
+    Builds the evalCriterias of one catalog entry. Returns (suffix, criteria_json)
+    where criteria_json is the serialised criteria: an immutable string every
+    per-database payload splices in unchanged.
+    """
+    eval_criterias = {
         "criticalCriteria": {
             "conditionAggregationType": "ALL",
             "conditionExpression": None,
-            "conditions": [
-                {
-                    "name": "High Number of Connections",
-                    "shortName": "A",
-                    "evaluateToTrueOnNoData": "false",
-                    "evalDetail": {
-                        "evalDetailType": "SINGLE_METRIC",
-                        "metricAggregateFunction": "VALUE",
-                        "metricPath": "DB|KPI|Number of Connections",
-                        "metricEvalDetail": {
-                            "metricEvalDetailType": "SPECIFIC_TYPE",
-                            "compareCondition": "GREATER_THAN_SPECIFIC_VALUE",
-                            "compareValue": 30,
-                        },
-                    },
-                    "triggerEnabled": "true",
-                    "minimumTriggers": 10,
-                },
-                {
-                    "name": "Number of Connections above 4 standard deviations of the default baseline",
-                    "shortName": "B",
-                    "evaluateToTrueOnNoData": "false",
-                    "evalDetail": {
-                        "evalDetailType": "SINGLE_METRIC",
-                        "metricAggregateFunction": "VALUE",
-                        "metricPath": "DB|KPI|Number of Connections",
-                        "metricEvalDetail": {
-                            "metricEvalDetailType": "BASELINE_TYPE",
-                            "baselineCondition": "GREATER_THAN_BASELINE",
-                            "baselineName": "Default Baseline",
-                            "compareValue": 3,
-                            "baselineUnit": "STANDARD_DEVIATIONS",
-                        },
-                    },
-                    "triggerEnabled": "false",
-                    "minimumTriggers": 10,
-                },
-            ],
+            "conditions": [_compile_condition(c) for c in entry["conditions"]],
             "evalMatchingCriteria": None,
         },
         "warningCriteria": None,
     }
-    return new_data
+    return entry["suffix"], json.dumps(eval_criterias)
+
+
+# Compiled once at import; never mutated afterwards
+COMPILED_DB_RULES = {key: _compile_rule(entry) for key, entry in DB_RULE_CATALOG.items()}
+
+
+def render_db_health_rule(rule_key, data):
+    """
+    Returns the JSON payload (str) for one rule type applied to `data`, a base
+    payload without evalCriterias. Only the small varying part is serialised;
+    the precompiled criteria are spliced in as-is.
+    """
+    suffix, criteria_json = COMPILED_DB_RULES[rule_key]
+    head = {k: v for k, v in data.items() if k != "evalCriterias"}
+    head["name"] = data["name"] + suffix
+    return json.dumps(head)[:-1] + ', "evalCriterias": ' + criteria_json + "}"
+
+
+def build_db_health_rule(rule_key, data):
+    """Dict form of render_db_health_rule; `data` itself is left untouched."""
+    return json.loads(render_db_health_rule(rule_key, data))
+
+
+def get_db_calls_per_min(data=None):
+    """Template for DB calls per min."""
+    return build_db_health_rule("calls_per_min", data)
+
+def get_db_conn_per_min(data=None):
+    """Template for DB connections per min."""
+    return build_db_health_rule("conn_per_min", data)
 
 def get_db_exec_time(data=None):
     """Template for DB time spent in executions."""
-    new_data = data.copy()
-    new_data["name"] += " - DB Time Spent in Executions"
-    new_data["evalCriterias"] = {
-        "criticalCriteria": {
-            "conditionAggregationType": "ALL",
-            "conditionExpression": None,
-            "conditions": [
-                {
-                    "name": "Query Execution Time",
-                    "shortName": "A",
-                    "evaluateToTrueOnNoData": "false",
-                    "evalDetail": {
-                        "evalDetailType": "SINGLE_METRIC",
-                        "metricAggregateFunction": "VALUE",
-                        "metricPath": "DB|KPI|Time Spent in Executions (s)",
-                        "metricEvalDetail": {
-                            "metricEvalDetailType": "SPECIFIC_TYPE",
-                            "compareCondition": "GREATER_THAN_SPECIFIC_VALUE",
-                            "compareValue": 3000,
-                        },
-                    },
-                    "triggerEnabled": "true",
-                    "minimumTriggers": 15,
-                },
-                {
-                    "name": "Condition 2",
-                    "shortName": "B",
-                    "evaluateToTrueOnNoData": "false",
-                    "evalDetail": {
-                        "evalDetailType": "SINGLE_METRIC",
-                        "metricAggregateFunction": "VALUE",
-                        "metricPath": "DB|KPI|Time Spent in Executions (s)",
-                        "metricEvalDetail": {
-                            "metricEvalDetailType": "BASELINE_TYPE",
-                            "baselineCondition": "GREATER_THAN_BASELINE",
-                            "baselineName": "Daily Trend - Last 30 days",
-                            "compareValue": 4,
-                            "baselineUnit": "STANDARD_DEVIATIONS",
-                        },
-                    },
-                    "triggerEnabled": "false",
-                    "minimumTriggers": 15,
-                },
-            ],
-            "evalMatchingCriteria": None,
-        },
-        "warningCriteria": None,
-    }
-    return new_data
+    return build_db_health_rule("exec_time", data)
 
 def get_gc_block(data=None):
     """Template for DB gc current block receive time."""
-    new_data = data.copy()
-    new_data["name"] += " - DB gc current block receive time"
-    new_data["evalCriterias"] = {
-        "criticalCriteria": {
-            "conditionAggregationType": "ALL",
-            "conditionExpression": None,
-            "conditions": [
-                {
-                    "name": "gc current block receive time HIGH",
-                    "shortName": "A",
-                    "evaluateToTrueOnNoData": "false",
-                    "evalDetail": {
-                        "evalDetailType": "SINGLE_METRIC",
-                        "metricAggregateFunction": "VALUE",
-                        "metricPath": "DB|Server Statistic|gc current block receive time",
-                        "metricEvalDetail": {
-                            "metricEvalDetailType": "SPECIFIC_TYPE",
-                            "compareCondition": "GREATER_THAN_SPECIFIC_VALUE",
-                            "compareValue": 12000,
-                        },
-                    },
-                    "triggerEnabled": "true",
-                    "minimumTriggers": 15,
-                },
-                {
-                    "name": "Condition 2",
-                    "shortName": "B",
-                    "evaluateToTrueOnNoData": "false",
-                    "evalDetail": {
-                        "evalDetailType": "SINGLE_METRIC",
-                        "metricAggregateFunction": "VALUE",
-                        "metricPath": "DB|Server Statistic|gc current block receive time",
-                        "metricEvalDetail": {
-                            "metricEvalDetailType": "BASELINE_TYPE",
-                            "baselineCondition": "GREATER_THAN_BASELINE",
-                            "baselineName": "Default Baseline",
-                            "compareValue": 4,
-                            "baselineUnit": "STANDARD_DEVIATIONS",
-                        },
-                    },
-                    "triggerEnabled": "false",
-                    "minimumTriggers": 15,
-                },
-            ],
-            "evalMatchingCriteria": None,
-        },
-        "warningCriteria": None,
-    }
-    return new_data
-
+    return build_db_health_rule("gc_block", data)
 
 def get_connections(data=None):
     """Template for DB connections."""
-    new_data = data.copy()
-    new_data["name"] += " - Drop in connections"
-    new_data["evalCriterias"] = {
-        "criticalCriteria": {
-            "conditionAggregationType": "ALL",
-            "conditionExpression": None,
-            "conditions": [
-                {
-                    "name": "Drop in connections",
-                    "shortName": "A",
-                    "evaluateToTrueOnNoData": "false",
-                    "evalDetail": {
-                        "evalDetailType": "SINGLE_METRIC",
-                        "metricAggregateFunction": "VALUE",
-                        "metricPath": "DB|KPI|Number of Connections",
-                        "metricEvalDetail": {
-                            "metricEvalDetailType": "SPECIFIC_TYPE",
-                            "compareCondition": "LESS_THAN_SPECIFIC_VALUE",
-                            "compareValue": 1,
-                        },
-                    },
-                    "triggerEnabled": "true",
-                    "minimumTriggers": 10,
-                }
-            ],
-            "evalMatchingCriteria": None,
-        },
-        "warningCriteria": None,
-    }
-    return new_data
+    return build_db_health_rule("connections", data)
 
 def get_availability(data=None):
     """Template for DB availability."""
-    new_data = data.copy()
-    new_data["name"] += " - DBAvailablity"
-    new_data["evalCriterias"] = {
-        "criticalCriteria": {
-            "conditionAggregationType": "ALL",
-            "conditionExpression": None,
-            "conditions": [
-                {
-                    "name": "DBAvailablity",
-                    "shortName": "A",
-                    "evaluateToTrueOnNoData": "false",
-                    "evalDetail": {
-                        "evalDetailType": "SINGLE_METRIC",
-                        "metricAggregateFunction": "VALUE",
-                        "metricPath": "DB|KPI|DB Availability",
-                        "metricEvalDetail": {
-                            "metricEvalDetailType": "SPECIFIC_TYPE",
-                            "compareCondition": "LESS_THAN_SPECIFIC_VALUE",
-                            "compareValue": 1,
-                        },
-                    },
-                    "triggerEnabled": "true",
-                    "minimumTriggers": 10,
-                }
-            ],
-            "evalMatchingCriteria": None,
-        },
-        "warningCriteria": None,
-    }
-    return new_data
+    return build_db_health_rule("availability", data)
 
 class AppDPolicyActionBuilder:
 
-    def __init__( self, business_name, db_type, application_name, appd_env, databases, user_email, account_name, client_secret, client_id ):
+    def __init__( self, business_name, db_type, application_name, appd_env, databases, user_email, account_name, client_secret, client_id, max_workers=1, group_size=0, base_url=None ):
         """
         Initializes the AppDPolicyActionBuilder with basic parameters for health rules and actions.
         
@@ -390,6 +328,9 @@ class AppDPolicyActionBuilder:
         :param env: The environment (e.g., Production, Development).
         :param tier: The application tier in AppDynamics.
         :param user_email: The email address for action notifications.
+        :param max_workers: Number of health rules posted in parallel.
+        :param group_size: When > 1, pack about this many databases into each
+                           SPECIFIC_DATABASES rule instead of one rule per database.
         """
         self.business_name = business_name
         self.db_type = db_type
@@ -401,11 +342,24 @@ class AppDPolicyActionBuilder:
         self.client_secret = client_secret
         self.client_id = client_id
         self.token= ""
+        self.token_refresh_at = 0
+        self._token_lock = threading.Lock()
         self.headers = HEADERS_TEMPLATE
         self.health_rules = []
         self.policies = []
         self.actions = []
-        self.base_url = f'https://cvs-ent-{appd_env.lower()}-01.saas.appdynamics.com/controller/'
+        # APPD_BASE_URL (or base_url) points at another controller, e.g. mock_controller.py
+        base_url = base_url or os.getenv("APPD_BASE_URL", "").strip()
+        self.base_url = base_url.rstrip("/") + "/" if base_url else f'https://cvs-ent-{appd_env.lower()}-01.saas.appdynamics.com/controller/'
+        self.max_workers = max(1, int(max_workers))
+        # One keep-alive pool for the token, health rules, actions and policies
+        self.session = build_session(self.max_workers)
+        self.health_rule_results = []
+        self.group_size = int(group_size or 0)
+        self.health_rules_url = f'{self.base_url}alerting/rest/v1/applications/15/health-rules'
+        self._existing_rules = None
+        self._existing_rules_lock = threading.Lock()
+        self.pruned_rules = []
 
     def populate_params(self):
 
@@ -419,11 +373,13 @@ class AppDPolicyActionBuilder:
         return populated_params
     
 
-    def generate_access_token(self):
+    def generate_access_token(self, force_refresh=False):
 
-        """Retrieve the access token using client credentials."""
-        base_url = f"https://cvs-ent-{self.appd_env.lower()}-01.saas.appdynamics.com/controller/"
-        url = f"{base_url}api/oauth/access_token"
+        """
+        Retrieve the access token using client credentials. A cached token is
+        reused until shortly before it expires; force_refresh replaces it.
+        """
+        url = f"{self.base_url}api/oauth/access_token"
         payload = {
             "grant_type": "client_credentials",
             "client_id": f"{self.client_id}@{self.account_name}",
@@ -433,89 +389,277 @@ class AppDPolicyActionBuilder:
             "Content-Type": "application/x-www-form-urlencoded",
         }
 
-        response = requests.post(url, data=payload, headers=headers)
-        response.raise_for_status()  # Raise an error for bad status codes
-        token_data = response.json()
-        self.token = token_data["access_token"]
-        self.headers = {k: v.format(token=self.token) for k, v in HEADERS_TEMPLATE.items()}
+        def fetch():
+            response = self.session.post(url, data=payload, headers=headers)
+            response.raise_for_status()  # Raise an error for bad status codes
+            token_data = response.json()
+            return token_data["access_token"], token_data.get("expires_in")
+
+        # Reuse a cached token for this account/client when it is still valid
+        with self._token_lock:
+            if force_refresh:
+                TOKEN_CACHE.invalidate(self.account_name, self.client_id, self.token)
+            entry = TOKEN_CACHE.get_or_fetch(self.account_name, self.client_id, fetch)
+            self.token = entry["access_token"]
+            self.token_refresh_at = TOKEN_CACHE.refresh_at(entry)
+            self.headers = {k: v.format(token=self.token) for k, v in HEADERS_TEMPLATE.items()}
+
+    def _request(self, method, url, **kwargs):
+        """
+        Sends a controller call with the current token, refreshing it shortly
+        before it expires and retrying once with a fresh token on a 401.
+        """
+        if self.token_refresh_at <= time.time():
+            self.generate_access_token()
+        sent_token = self.token
+        response = self.session.request(method, url, headers=self.headers, **kwargs)
+        if response.status_code == 401:
+            log.info(f"401 from {url}; retrying once with a fresh access token")
+            if self.token == sent_token:
+                self.generate_access_token(force_refresh=True)
+            response = self.session.request(method, url, headers=self.headers, **kwargs)
+        return response
+
+    def post(self, url, data=None, headers=None):
+        """Session-style POST for post_request(); `headers` is ignored in favour of the token's."""
+        return self._request("POST", url, data=data)
+
+    def discover_databases(self, cache_path=db_inventory.DEFAULT_CACHE_PATH,
+                           ttl=db_inventory.DEFAULT_TTL, force=False):
+        """
+        Replaces the hand-listed databases with the controller's database
+        collectors of this builder's db_type. Requires an access token.
+        """
+        inventory = db_inventory.refresh_inventory(
+            self.session, self.base_url, self.headers, cache_path, ttl, force
+        )
+        self.databases = db_inventory.databases_for_type(inventory, self.db_type)
+        print(f"Discovered {len(self.databases)} {self.db_type or 'database'} collector(s)")
+        return self.databases
 
     def create_payload(self, health_rule_name):
-   
-        payload = BASE_PAYLOAD_TEMPLATE.copy()
+        """
+        Base payload shared by every rule type. Built fresh (no shared nested
+        dicts with BASE_PAYLOAD_TEMPLATE) so per-database edits cannot leak.
+        """
+        payload = {k: v for k, v in BASE_PAYLOAD_TEMPLATE.items() if k != "affects"}
         payload["name"] = health_rule_name
-        payload["affects"]["databaseType"] = self.db_type
-        if len(self.databases) > 0:
-            payload["affects"]["affectedDatabases"]["databaseScope"] = "SPECIFIC_DATABASES"
-            payload["affects"]["affectedDatabases"]["databases"] = self.databases
-        else:
-            payload["affects"]["affectedDatabases"]["databaseScope"] = "ALL_DATABASES"
-
+        affected = {"databaseScope": "SPECIFIC_DATABASES" if self.databases else "ALL_DATABASES"}
+        if self.databases:
+            affected["databases"] = self.databases
+        payload["affects"] = {
+            "affectedEntityType": "DATABASES",
+            "databaseType": self.db_type,
+            "affectedDatabases": affected,
+        }
         return payload
-    
-    def process_health_rule(self, health_rule_name, original_payload, health_rules, get_payload_func, success_msg, failed_msg):
- 
-        if len(self.databases) > 0:
+
+    def process_health_rule(self, health_rule_name, original_payload, health_rules, rule_key):
+        """
+        Appends one payload per database (or one for ALL_DATABASES) for the
+        catalog rule `rule_key`. Each database gets its own small `affects`
+        dict; the compiled criteria are shared.
+        """
+        label = DB_RULE_CATALOG[rule_key]["label"]
+        success_msg = f'******* SUCCESSFULLY CREATED {label} ********'
+        failed_msg = f'******* FAILED CREATING {label} ********'
+        suffix = COMPILED_DB_RULES[rule_key][0]
+
+        if len(self.databases) > 0 and self.group_size > 1:
+            affects = original_payload["affects"]
+            for index, group in group_databases(self.databases, self.group_size):
+                data = dict(original_payload)
+                data["name"] = f"{health_rule_name}-group-{index:03d}"
+                data["affects"] = {
+                    **affects,
+                    "affectedDatabases": {"databaseScope": "SPECIFIC_DATABASES", "databases": group},
+                }
+                health_rules.append({
+                    'name': data["name"] + suffix,
+                    'hr_payload': render_db_health_rule(rule_key, data),
+                    'database': f'group-{index:03d}',
+                    'databases': [db["serverName"] for db in group],
+                    # Existing group rules are updated in place when their members change
+                    'upsert': True,
+                    'group_prefix': f"{health_rule_name}-group-",
+                    'success_msg': success_msg,
+                    'failed_msg': failed_msg
+                })
+        elif len(self.databases) > 0:
+            affects = original_payload["affects"]
             for server in self.databases:
                 server_name = server["serverName"]
-                original_payload["name"] = health_rule_name + "-" + server_name
-                original_payload["affects"]["affectedDatabases"]["databases"] = [server]
-
-                # Generate new payload
-                new_payload = get_payload_func(data=original_payload)
-
-                # Append to health_rules list
+                data = dict(original_payload)
+                data["name"] = health_rule_name + "-" + server_name
+                data["affects"] = {
+                    **affects,
+                    "affectedDatabases": {"databaseScope": "SPECIFIC_DATABASES", "databases": [server]},
+                }
                 health_rules.append({
-                    'hr_payload': json.dumps(new_payload),
+                    'name': data["name"] + suffix,
+                    'hr_payload': render_db_health_rule(rule_key, data),
+                    'database': server_name,
                     'success_msg': success_msg,
                     'failed_msg': failed_msg
                 })
         else:
             # Handle the case for all databases
-            new_payload = get_payload_func(data=original_payload)
-            print(f"print nepayayload line *****474****: {new_payload}")
-
-
             health_rules.append({
-                'hr_payload': json.dumps(new_payload),
+                'name': original_payload["name"] + suffix,
+                'hr_payload': render_db_health_rule(rule_key, original_payload),
+                'database': 'ALL_DATABASES',
                 'success_msg': success_msg,
                 'failed_msg': failed_msg
             })
 
-    def create_health_rules(self, health_rules):
-
-        health_rules_name_list = []
-
-        for rule in health_rules:
-            # Parse the health rule name from the payload
-            rule_name = json.loads(rule['hr_payload'])
-            health_rules_name_list.append(rule_name['name'])
-        
-            print(f'******** Creating {rule_name["name"]} ********')
-            print('Payload:', rule['hr_payload'])
+    def _existing_health_rules(self):
+        """{name: id} of the application's health rules, fetched once per builder."""
+        with self._existing_rules_lock:
+            if self._existing_rules is None:
+                response = self._request("GET", self.health_rules_url)
+                response.raise_for_status()
+                self._existing_rules = {hr["name"]: hr["id"] for hr in response.json()}
+            return self._existing_rules
 
-            # Send the health rule creation request
-            appd_api_response = requests.post(
-                f'{self.base_url}/alerting/rest/v1/applications/15/health-rules',
+    def _upsert_group_rule(self, rule, rule_name, hr_id):
+        """
+        Rewrites an existing grouped rule only when its database list changed.
+        Returns a result record.
+        """
+        url = f"{self.health_rules_url}/{hr_id}"
+        result = {'name': rule_name, 'database': rule['database'], 'databases': rule['databases']}
+        try:
+            current = self._request("GET", url)
+            current.raise_for_status()
+            current_dbs = (
+                current.json().get("affects", {}).get("affectedDatabases", {}).get("databases") or []
+            )
+            if sorted(db.get("serverName") for db in current_dbs) == sorted(rule['databases']):
+                print(f'******** {rule_name} unchanged ********')
+                return {**result, 'success': True, 'status': current.status_code, 'unchanged': True}
+
+            print(f'******** Updating {rule_name} ********')
+            response = self._request("PUT", url, data=rule['hr_payload'])
+        except requests.RequestException as e:
+            print(f"{rule['failed_msg']}: {e}")
+            return {**result, 'success': False, 'error': str(e)}
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Response: %s", response.text)
+        print(rule['success_msg'] if response.ok else rule['failed_msg'])
+        return {**result, 'success': response.ok, 'status': response.status_code}
+
+    def _post_health_rule(self, rule):
+        """Posts one health rule and returns its result record."""
+        rule_name = rule.get('name') or json.loads(rule['hr_payload'])['name']
+        if rule.get('upsert'):
+            try:
+                hr_id = self._existing_health_rules().get(rule_name)
+            except requests.RequestException as e:
+                print(f"Could not list existing health rules: {e}")
+                hr_id = None
+            if hr_id is not None:
+                return self._upsert_group_rule(rule, rule_name, hr_id)
+
+        print(f'******** Creating {rule_name} ********')
+        log.debug("Payload: %s", rule['hr_payload'])
+
+        try:
+            appd_api_response = self._request(
+                "POST",
+                self.health_rules_url,
                 data=rule['hr_payload'],
-                headers=self.headers
             )
+        except requests.RequestException as e:
+            print(f"{rule['failed_msg']}: {e}")
+            return {'name': rule_name, 'database': rule.get('database'), 'success': False, 'error': str(e)}
+
+        # Response body only at debug; success/failure message always
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Response: %s", appd_api_response.text)
+        if appd_api_response.status_code == 201:
+            print(rule['success_msg'])
+        else:
+            print(rule['failed_msg'])
+        return {
+            'name': rule_name,
+            'database': rule.get('database'),
+            'success': appd_api_response.status_code == 201,
+            'status': appd_api_response.status_code,
+        }
 
-            # Print response and success/failure message
-            print('Response:', appd_api_response.text)
-            if appd_api_response.status_code == 201:
-                print(rule['success_msg'])
+    def create_health_rules(self, health_rules):
+        """
+        Posts every health rule, fanning out across databases and rule types on
+        max_workers threads. Returns the rule names in input order; per-rule
+        results are kept in self.health_rule_results.
+        """
+        health_rules_name_list = [
+            rule.get('name') or json.loads(rule['hr_payload'])['name'] for rule in health_rules
+        ]
+
+        workers = min(self.max_workers, len(health_rules)) or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            self.health_rule_results = list(executor.map(self._post_health_rule, health_rules))
+
+        prefixes = {rule['group_prefix'] for rule in health_rules if rule.get('group_prefix')}
+        if prefixes:
+            if all(result['success'] for result in self.health_rule_results):
+                self.prune_group_rules(prefixes, set(health_rules_name_list))
             else:
-                print(rule['failed_msg'])
+                print("Some group rules failed; keeping the old groups until a clean run")
         return health_rules_name_list
+
+    def prune_group_rules(self, prefixes, keep):
+        """
+        Deletes grouped rules ("<prefix>NNN...") that are not in `keep`. When the
+        bucket count changes, databases move to new groups and the old group
+        rules would otherwise keep alerting for them. Returns the pruned names.
+        """
+        with self._existing_rules_lock:
+            self._existing_rules = None  # re-list: this run just created rules
+        existing = self._existing_health_rules()
+        stale = sorted(
+            name for name in existing
+            if name not in keep and any(
+                name.startswith(prefix) and name[len(prefix):len(prefix) + 3].isdigit()
+                for prefix in prefixes
+            )
+        )
+        for name in stale:
+            response = self._request("DELETE", f"{self.health_rules_url}/{existing[name]}")
+            if response.ok:
+                print(f'******** Deleted stale group rule {name} ********')
+                self.pruned_rules.append(name)
+            else:
+                print(f'******** FAILED deleting stale group rule {name} ({response.status_code}) ********')
+        return self.pruned_rules
+
+    def summarize_by_database(self):
+        """Returns {database: {"created": n, "failed": n, "failed_rules": [...]}}."""
+        summary = {}
+        for result in self.health_rule_results:
+            # Grouped rules count towards every database they cover
+            for database in result.get('databases') or [result['database']]:
+                entry = summary.setdefault(
+                    database, {'created': 0, 'failed': 0, 'failed_rules': []}
+                )
+                if result['success']:
+                    entry['created'] += 1
+                else:
+                    entry['failed'] += 1
+                    entry['failed_rules'].append(result['name'])
+        return summary
+
     def post_appd_action(self, payload):
         url = self.base_url+'alerting/rest/v1/applications/15/actions'
-        print(f"*******line 511**** paylod: {payload}")
-        return post_request( url, self.headers, payload )
+        log.debug("Action payload: %s", payload)
+        return post_request( url, self.headers, payload, self )
     
 
     def post_appd_policy(self, payload):
         url = self.base_url+'alerting/rest/v1/applications/15/policies'
-        return post_request( url, self.headers, payload )
+        return post_request( url, self.headers, payload, self )
 
 def get_secrets(account_name: str, secrets_file_path: str):
     account_name_upper = account_name.upper()
@@ -544,90 +688,56 @@ def main():
     secrets_file_path = os.getenv("SECRETS_PATH", "").strip()
     account_name = os.getenv("APPD_CON", "").strip()
     user_email = os.getenv("USER_EMAIL", "").strip().split(",")
-
-    print(f"usr lsit of emails: {user_email}")
-    print(f"type: {type(user_email)}")
+    max_workers = int(os.getenv("DB_HR_WORKERS", "").strip() or 8)
+    group_size = int(os.getenv("DB_GROUP_SIZE", "").strip() or 0)
+    discover = os.getenv("DB_DISCOVER", "").strip().lower() == "true"
+    inventory_cache = os.getenv("DB_INVENTORY_CACHE", "").strip() or db_inventory.DEFAULT_CACHE_PATH
+    inventory_ttl = int(os.getenv("DB_INVENTORY_TTL", "").strip() or db_inventory.DEFAULT_TTL)
+    inventory_refresh = os.getenv("DB_INVENTORY_REFRESH", "").strip().lower() == "true"
+
+    configure_logging()
+    log.debug("User emails: %s", user_email)
     client_id, client_secret = get_secrets(account_name, secrets_file_path)
 
-    appd_obj=AppDPolicyActionBuilder(business_name, db_type, application_name, appd_env, databases, user_email, account_name, client_secret, client_id )
-    print(f"client id fetched: {client_id}")
+    appd_obj=AppDPolicyActionBuilder(business_name, db_type, application_name, appd_env, databases, user_email, account_name, client_secret, client_id, max_workers, group_size )
+    log.debug("Client id fetched for %s", account_name)
     appd_obj.generate_access_token()
 
+    if discover:
+        appd_obj.discover_databases(inventory_cache, inventory_ttl, inventory_refresh)
+
     health_rule_name = f"{business_name} | {appd_env} | {db_type}"
 
     original_payload = appd_obj.create_payload(health_rule_name)
     
     health_rules = []
 
-    # DB Calls Per Minute
-    appd_obj.process_health_rule(
-        health_rule_name=health_rule_name,
-        original_payload=original_payload,
-        health_rules=health_rules,
-        get_payload_func=get_db_conn_per_min,
-        success_msg='******* SUCCESSFULLY CREATED DB CALLS PER MINUTE ********',
-        failed_msg='******* FAILED CREATING DB CALLS PER MINUTE ********'
-    )
-
-    # DB Time Spent in Executions
-    appd_obj.process_health_rule(
-        health_rule_name=health_rule_name,
-        original_payload=original_payload,
-        health_rules=health_rules,
-        get_payload_func=get_db_exec_time,
-        success_msg='******* SUCCESSFULLY CREATED DROP IN CONNECTIONS ********',
-        failed_msg='******* FAILED CREATING DROP IN CONNECTIONS ********'
-    )
-    # DB Get Connections per minute
-
-
-    # DB GC Current Block Receive Time
-    appd_obj.process_health_rule(
-        health_rule_name=health_rule_name,
-        original_payload=original_payload,
-        health_rules=health_rules,
-        get_payload_func=get_gc_block,
-        success_msg='******* SUCCESSFULLY CREATED DB AVAILABILITY ********',
-        failed_msg='******* FAILED CREATING DB AVAILABILITY ********'
-    )
-
-    # DB Availability
-
-    appd_obj.process_health_rule(
-        health_rule_name=health_rule_name,
-        original_payload=original_payload,
-        health_rules=health_rules,
-        get_payload_func=get_connections,
-        success_msg='******* SUCCESSFULLY CREATED DB EXECUTION TIME ********',
-        failed_msg='******* FAILED CREATING DB EXECUTION TIME ********'
-    )
-    # Db avaialibity 
-    appd_obj.process_health_rule(
-        health_rule_name=health_rule_name,
-        original_payload=original_payload,
-        health_rules=health_rules,
-        get_payload_func=get_availability,
-        success_msg='******* SUCCESSFULLY CREATED DB EXECUTION TIME ********',
-        failed_msg='******* FAILED CREATING DB EXECUTION TIME ********'
-    )
-    
+    for rule_key in DEFAULT_DB_RULES:
+        appd_obj.process_health_rule(
+            health_rule_name=health_rule_name,
+            original_payload=original_payload,
+            health_rules=health_rules,
+            rule_key=rule_key,
+        )
 
     health_rules_name_list = appd_obj.create_health_rules(
         health_rules=health_rules
     )
+    for database, counts in appd_obj.summarize_by_database().items():
+        print(f"{database}: {counts['created']} created, {counts['failed']} failed {counts['failed_rules'] or ''}")
     action_payload = render_template_json("useremailaction.j2",{'user_email':user_email})
-    print(f"printing action payload: {action_payload}")
+    log.debug("Action payload: %s", action_payload)
 
     policy_params =  appd_obj.populate_params()
     if health_rules_name_list and isinstance(health_rules_name_list, list):
         policy_params.update({'health_rules': health_rules_name_list})
-        print(f"*********line 604******* {policy_params}")
+        log.debug("Policy params: %s", LazyJson(policy_params))
     else:
         print("Error: health_rules_name_list is not valid. Skipping policy update.")
     policy_payload = render_template_json("databasepolicy.j2", policy_params)
-    print( "calling action function ")
+    log.debug("Posting action")
     appd_obj.post_appd_action( action_payload )
-    print( "calling policy function ")
+    log.debug("Posting policy")
     appd_obj.post_appd_policy(policy_payload)
     
     exit(0)
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+COLLECTORS_PATH = "rest/databases/collectors"
+DEFAULT_CACHE_PATH = ".db_inventory.json"
+DEFAULT_TTL = 3600
+
+
+def _collector_record(item):
+    """Flattens one Database Visibility collector into the fields db_hr needs."""
+    config = item.get("config", item)
+    return {
+        "id": config.get("id"),
+        "name": config.get("name"),
+        "type": (config.get("type") or "").upper(),
+        "hostname": config.get("hostname"),
+        "enabled": config.get("enabled", True),
+    }
+
+
+def fetch_collectors(session, base_url, headers):
+    """Returns {collector_id: record} for every database collector on the controller."""
+    response = session.get(f"{base_url}{COLLECTORS_PATH}", headers=headers)
+    response.raise_for_status()
+    collectors = {}
+    for item in response.json():
+        record = _collector_record(item)
+        if record["id"] is not None and record["name"]:
+            collectors[str(record["id"])] = record
+    return collectors
+
+
+def load_inventory(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_inventory(path, inventory):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(inventory, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def refresh_inventory(session, base_url, headers, cache_path=DEFAULT_CACHE_PATH,
+                      ttl=DEFAULT_TTL, force=False):
+    """
+    Returns the collector inventory for a controller: a TTL-cached full listing.
+
+    While the cached inventory is younger than `ttl` seconds no request is
+    made. After that (or with force=True) the whole collector listing is
+    fetched again and replaces the cache; the controller has no "changed
+    since" query, so there is no cheaper delta to ask for. Collectors added,
+    removed or changed since the previous listing are logged.
+    """
+    cached = load_inventory(cache_path)
+    if cached and cached.get("base_url") != base_url:
+        cached = None
+    if cached and not force and time.time() - cached.get("fetched_at", 0) < ttl:
+        log.info(f"Using cached database inventory ({len(cached['collectors'])} collectors)")
+        return cached
+
+    old = (cached or {}).get("collectors", {})
+    collectors = fetch_collectors(session, base_url, headers)
+
+    added = sorted(collectors.keys() - old.keys())
+    removed = sorted(old.keys() - collectors.keys())
+    changed = sorted(k for k in collectors.keys() & old.keys() if collectors[k] != old[k])
+    if added or removed or changed:
+        log.info(
+            "Database inventory changes: "
+            f"+{[collectors[k]['name'] for k in added]} "
+            f"-{[old[k]['name'] for k in removed]} "
+            f"~{[collectors[k]['name'] for k in changed]}"
+        )
+
+    inventory = {"base_url": base_url, "fetched_at": time.time(), "collectors": collectors}
+    save_inventory(cache_path, inventory)
+    return inventory
+
+
+def databases_for_type(inventory, db_type=None):
+    """
+    Turns an inventory into db_hr's database list, keeping enabled collectors
+    of `db_type` (case-insensitive; all types when empty).
+    """
+    wanted = (db_type or "").upper()
+    return [
+        {"serverName": record["name"], "collectorConfigName": record["name"]}
+        for record in sorted(inventory["collectors"].values(), key=lambda r: r["name"])
+        if record.get("enabled", True) and (not wanted or record["type"] == wanted)
+    ]
@@ -0,0 +1,334 @@
+import os
+import re
+import sys
+import json
+import time
+import heapq
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.util import Finalize
+
+import batch
+import main as onboarding
+from apis import AppDynamics, controller_base_url
+from journal import Journal
+from metrics import METRICS
+from ratelimit import RateLimiter
+from log_config import flush_logging, stop_logging
+
+log = onboarding.log
+
+# ─── Partitioning ──────────────────────────────────────────────────────────────
+
+def partition_key(entry, settings):
+    """
+    (account, base_url) an entry onboards against. Entries name their account
+    with APPD_CON and may point at another controller with APPD_BASE_URL;
+    both fall back to the run's settings.
+    """
+    account = str(entry.get("APPD_CON") or settings.account_name).strip()
+    base_url = str(entry.get("APPD_BASE_URL") or "").strip() or None
+    return account, base_url
+
+
+def _entry_key(entry, settings):
+    # Malformed lines go with the default account so they still get a result line
+    return partition_key(entry, settings) if "_error" not in entry else (settings.account_name, None)
+
+
+def _slug(account, controller):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{account}-{controller}").strip("_")
+
+
+def _journal_path(base_path, account, controller):
+    """Per-partition journal file, stable across reruns of the same manifest."""
+    return f"{base_path}.{_slug(account, controller)}"
+
+
+def spool_partitions(entries, settings, work_dir):
+    """
+    Streams (line_number, entry) pairs into one spool file per partition_key()
+    under `work_dir`, keeping manifest order inside each partition. Only the
+    open files are held in memory, never the entries.
+
+    Returns {(account, base_url): {"spool": path, "results": path, "entries": n}}
+    in order of first appearance.
+    """
+    partitions, files = {}, {}
+    try:
+        for line_no, entry in entries:
+            key = _entry_key(entry, settings)
+            part = partitions.get(key)
+            if part is None:
+                name = f"{len(partitions):03d}-{_slug(key[0], controller_base_url(*key))}"
+                part = partitions[key] = {
+                    "spool":   os.path.join(work_dir, f"{name}.spool.jsonl"),
+                    "results": os.path.join(work_dir, f"{name}.results.jsonl"),
+                    "entries": 0,
+                }
+                files[key] = open(part["spool"], "w")
+            files[key].write(json.dumps({"line": line_no, "entry": entry}) + "\n")
+            part["entries"] += 1
+    finally:
+        for f in files.values():
+            f.close()
+    return partitions
+
+
+def _read_spool(path):
+    with open(path, "r") as f:
+        for line in f:
+            item = json.loads(line)
+            yield item["line"], item["entry"]
+
+
+def _finish_unrun(spool_path, results_path, error):
+    """
+    Appends an error line for every spooled entry that has no result yet.
+    run_batch writes whole chunks in manifest order, so the lines already in
+    `results_path` are a prefix of the spool.
+    """
+    with open(results_path, "a+") as f:
+        f.seek(0)
+        done = sum(1 for _ in f)
+        for index, (line_no, _) in enumerate(_read_spool(spool_path)):
+            if index >= done:
+                f.write(json.dumps({"line": line_no, "status": "error", "error": error}) + "\n")
+
+
+def controller_shares(partitions, processes):
+    """
+    How many partitions run against each partition's controller at once.
+    APPD_RATE_LIMITS and APPD_MAX_CONCURRENCY are per-controller budgets, so
+    each partition's limiter gets 1/share of them.
+    """
+    per_controller = {}
+    for account, base_url in partitions:
+        controller = controller_base_url(account, base_url)
+        per_controller[controller] = per_controller.get(controller, 0) + 1
+    return {
+        key: min(per_controller[controller_base_url(*key)], processes)
+        for key in partitions
+    }
+
+# ─── Partition worker ──────────────────────────────────────────────────────────
+
+def _init_worker():
+    """
+    Runs once in each worker process. Forked workers already have a listener
+    (log_config restarts it after fork); spawned ones configure their own.
+    Either way the listener is drained when the process exits.
+    """
+    onboarding.setup_logging()
+    Finalize(None, stop_logging, exitpriority=10)
+
+
+def run_partition(account, base_url, credentials, spool_path, results_path, config, settings,
+                  workers, chunk_size, journal_path=None, share=1):
+    """
+    Onboards one partition in a worker process: its own client, pooled session,
+    token and rate limiter, the limiter holding 1/share of the controller's
+    budget. Reads the partition's entries from `spool_path` and streams its
+    result lines to `results_path` chunk by chunk; entries a failure kept from
+    running get an error line. With `journal_path` the partition resumes from
+    its own journal file. Returns the partition's report.
+    """
+    controller = controller_base_url(account, base_url)
+    report = {
+        "account":    account,
+        "controller": controller,
+        "pid":        os.getpid(),
+    }
+    # Partitions journal separately so concurrent processes never share a file
+    journal = Journal(_journal_path(journal_path, account, controller)) if journal_path else None
+    METRICS.reset()
+
+    start = time.perf_counter()
+    try:
+        client_id, client_secret = credentials
+        if not client_id or not client_secret:
+            raise ValueError(f"No credentials for account {account!r} in the secrets file")
+        appd = AppDynamics(
+            settings.appd_env, client_id, account, client_secret,
+            max_workers=settings.hr_workers, base_url=base_url, journal=journal,
+            rate_limiter=RateLimiter.from_env(share), pool_size=workers * settings.hr_workers,
+        )
+        with open(results_path, "w") as out:
+            batch.run_batch(appd, config, _read_spool(spool_path), out, workers, settings, chunk_size)
+        report["rate_limiter"] = appd.rate_limiter.stats()
+    except Exception as e:
+        log.error(f"Partition {account} on {controller} failed: {e}")
+        report["error"] = str(e)
+        _finish_unrun(spool_path, results_path, str(e))
+    finally:
+        if journal is not None:
+            journal.close()
+        # The worker exits through os._exit, so queued records must be written now
+        flush_logging()
+
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    report["metrics"] = METRICS.summary()
+    return report
+
+
+def _read_results(path, index):
+    with open(path, "r") as f:
+        for line in f:
+            result = json.loads(line)
+            yield result["line"], index, result
+
+
+def merge_results(partitions, reports, out):
+    """
+    Merges the partitions' results files into `out` in manifest order, one
+    line at a time, tagging each line with its account and controller.
+    Fills in the partition reports' counts and returns the overall counts.
+    """
+    keys = list(partitions)
+    streams = [_read_results(partitions[key]["results"], index) for index, key in enumerate(keys)]
+    counts = {}
+    for _, index, result in heapq.merge(*streams, key=lambda item: item[0]):
+        report = reports[keys[index]]
+        result["account"] = report["account"]
+        result["controller"] = report["controller"]
+        out.write(json.dumps(result) + "\n")
+        part_counts = report.setdefault("counts", {})
+        part_counts[result["status"]] = part_counts.get(result["status"], 0) + 1
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    out.flush()
+    return counts
+
+# ─── Fan-out driver ────────────────────────────────────────────────────────────
+
+def run_fanout(entries, secrets, config, settings, out, processes=None,
+               workers=batch.DEFAULT_BATCH_WORKERS, chunk_size=batch.DEFAULT_CHUNK_SIZE,
+               work_dir=None):
+    """
+    Partitions (line_number, entry) pairs by account and controller and runs
+    each partition in its own process. Result lines are written to `out` in
+    manifest order. Returns the merged report.
+
+    The manifest is spooled to one file per partition under `work_dir` (a
+    temporary directory by default) and each worker streams its results to
+    its own file there, so neither side holds the manifest or the results in
+    memory. The files are removed once merged into `out`; if the run dies
+    first they stay behind with every result written so far.
+
+    Only batch onboarding is fanned out. updates.py and db_hr.py act on one
+    application per run, configured from the environment, and have no
+    manifest to partition; run them once per account.
+
+    APPD_JOURNAL, when set, is the base name of one journal file per partition.
+    """
+    own_dir = work_dir is None
+    work_dir = tempfile.mkdtemp(prefix="fanout-") if own_dir else work_dir
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        report = _run_fanout(entries, secrets, config, settings, out, processes,
+                             workers, chunk_size, work_dir)
+    except BaseException:
+        log.error(f"Fan-out aborted; spooled entries and partial results are in {work_dir}")
+        raise
+    if own_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    else:
+        _remove_parts(work_dir)
+    return report
+
+
+def _remove_parts(work_dir):
+    for name in os.listdir(work_dir):
+        if name.endswith((".spool.jsonl", ".results.jsonl")):
+            os.remove(os.path.join(work_dir, name))
+    try:
+        os.rmdir(work_dir)
+    except OSError:
+        pass
+
+
+def _run_fanout(entries, secrets, config, settings, out, processes, workers, chunk_size, work_dir):
+    partitions = spool_partitions(entries, settings, work_dir)
+    processes = max(1, min(int(processes or os.cpu_count() or 1), len(partitions) or 1))
+    shares = controller_shares(partitions, processes)
+    log.info(f"Fanning out {sum(p['entries'] for p in partitions.values())} entries over "
+             f"{len(partitions)} partition(s) in {processes} process(es)")
+
+    journal_path = os.getenv("APPD_JOURNAL", "").strip() or None
+    start = time.perf_counter()
+    reports = {}
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as executor:
+        futures = {
+            executor.submit(
+                run_partition, account, base_url,
+                onboarding.secrets_for_account(secrets, account),
+                part["spool"], part["results"], config, settings, workers, chunk_size,
+                journal_path, shares[account, base_url],
+            ): (account, base_url)
+            for (account, base_url), part in partitions.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            part = partitions[key]
+            try:
+                report = future.result()
+            except Exception as e:
+                # The worker process itself died (e.g. killed or unpicklable result)
+                report = {"account": key[0], "controller": controller_base_url(*key), "error": str(e)}
+                log.error(f"Partition {report['account']} on {report['controller']} crashed: {e}")
+                _finish_unrun(part["spool"], part["results"], str(e))
+            report["entries"] = part["entries"]
+            log.info(f"Partition {report['account']} on {report['controller']} finished"
+                     f"{' with error: ' + report['error'] if 'error' in report else ''}")
+            reports[key] = report
+
+    counts = merge_results(partitions, reports, out)
+    ordered = sorted(reports.values(), key=lambda r: (r["account"], r["controller"]))
+    return {
+        "partitions": ordered,
+        "counts":     counts,
+        "requests":   sum(r.get("metrics", {}).get("requests", 0) for r in ordered),
+        "retries":    sum(r.get("metrics", {}).get("retries", 0) for r in ordered),
+        "seconds":    round(time.perf_counter() - start, 3),
+    }
+
+
+def main(manifest_path=None):
+    onboarding.setup_logging()
+    settings = onboarding.load_settings()
+    manifest_path = manifest_path or os.getenv("MANIFEST_PATH", "").strip() or batch.DEFAULT_MANIFEST_PATH
+    results_path = os.getenv("RESULTS_PATH", "").strip()
+    report_path = os.getenv("REPORT_PATH", "").strip()
+    processes = int(os.getenv("FANOUT_PROCESSES", "").strip() or 0) or None
+    workers = int(os.getenv("BATCH_WORKERS", "").strip() or batch.DEFAULT_BATCH_WORKERS)
+    chunk_size = int(os.getenv("BATCH_CHUNK", "").strip() or batch.DEFAULT_CHUNK_SIZE)
+    print(f"Fan-out onboarding from {manifest_path}", "\n")
+
+    config = onboarding.load_config()
+    # Read once here; each worker only receives its own account's credentials
+    with open(settings.secrets_file_path, "r") as f:
+        secrets = json.load(f)
+
+    out = open(results_path, "w") if results_path else sys.stdout
+    try:
+        report = run_fanout(
+            batch.iter_manifest(manifest_path), secrets, config, settings, out,
+            processes, workers, chunk_size,
+            # Next to the results, so a crashed run's partial results are easy to find
+            work_dir=f"{results_path}.parts" if results_path else None,
+        )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    log.info(f"Fan-out finished in {report['seconds']}s: {report['counts']} "
+             f"({report['requests']} controller requests, {report['retries']} retries)")
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        log.info(f"Wrote fan-out report to {report_path}")
+    return 0 if set(report["counts"]) <= {"ok", "skipped"} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,42 @@
+import os
+import json
+import fcntl
+from contextlib import contextmanager
+
+# JSON files shared between processes on one host (token and lookup caches)
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Holds an exclusive flock on `path`.lock for the duration of the block, so
+    processes sharing the file read-modify-write it one at a time. A no-op
+    when `path` is empty (the cache is memory-only).
+    """
+    if not path:
+        yield
+        return
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_json(path):
+    """The file's JSON object, or {} when it is missing or unreadable."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_json(path, data):
+    """Atomically replaces `path` with `data`, readable by the owner only."""
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
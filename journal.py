@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+
+def step_id(controller, appd_id, endpoint, name, payload):
+    """
+    Stable id of one create step: the same entity with the same payload on the
+    same controller and application always maps to the same id, across runs.
+    """
+    encoded = json.dumps(
+        [controller, str(appd_id), endpoint, name, payload],
+        sort_keys=True, default=str, separators=(",", ":"),
+    )
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+def entity_key(controller, appd_id, endpoint, name):
+    return f"{controller}|{appd_id}|{endpoint}|{name}"
+
+
+class Journal:
+    """
+    Append-only journal of completed onboarding steps.
+
+    Every completed step is written as one JSON line, flushed and fsync'd
+    before record() returns, so a crash loses at most the step in flight.
+    Opening an existing journal replays it, and a rerun then skips every step
+    already done. Without a path the journal lives in memory only and just
+    dedupes identical steps within the run.
+
+    Deleting an entity appends a "forget" line, so a later create of the same
+    entity is not skipped.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._done = {}          # step id -> entity key
+        self._lock = threading.Lock()
+        self._step_locks = {}
+        self._file = None
+        if path:
+            needs_newline = self._replay()
+            self._file = open(path, "a", encoding="utf-8")
+            if needs_newline:
+                # Terminate a line torn by a crash so the next record starts clean
+                self._file.write("\n")
+
+    def _replay(self):
+        """Loads completed steps from the file. Returns True when it ends mid-line."""
+        try:
+            f = open(self.path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return False
+        last_line = ""
+        with f:
+            for line in f:
+                last_line = line
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a torn final write from a crashed run
+                if "forget" in record:
+                    self._drop(record["forget"])
+                elif "step" in record:
+                    self._done[record["step"]] = record.get("entity")
+        log.info(f"Resuming from journal {self.path}: {len(self._done)} completed step(s)")
+        return bool(last_line) and not last_line.endswith("\n")
+
+    def _drop(self, entity):
+        for step in [s for s, e in self._done.items() if e == entity]:
+            del self._done[step]
+
+    def _append(self, record):
+        if self._file is None:
+            return
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def is_done(self, step):
+        with self._lock:
+            return step in self._done
+
+    def record(self, step, entity, **info):
+        """Marks a step as completed and makes that durable before returning."""
+        with self._lock:
+            self._done[step] = entity
+            self._append({"step": step, "entity": entity, "ts": round(time.time(), 3), **info})
+
+    def forget(self, entity):
+        """Forgets every completed step for an entity (after it was deleted)."""
+        with self._lock:
+            if any(e == entity for e in self._done.values()):
+                self._drop(entity)
+                self._append({"forget": entity, "ts": round(time.time(), 3)})
+
+    @contextmanager
+    def claim(self, step):
+        """
+        Serialises identical steps: the block runs with the step's lock held and
+        receives whether the step is already done, so a concurrent duplicate
+        waits for the first and then sees it completed.
+        """
+        with self._lock:
+            step_lock = self._step_locks.setdefault(step, threading.Lock())
+        with step_lock:
+            yield self.is_done(step)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """
+    Process-wide journal, opened on first use. APPD_JOURNAL names the file;
+    reuse the same path to resume a run and use a fresh one to start over.
+    """
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = Journal(os.getenv("APPD_JOURNAL", "").strip() or None)
+        return _journal
@@ -0,0 +1,208 @@
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+DEFAULT_LEVEL = "INFO"
+TEXT_FORMAT = "%(asctime)s %(levelname)-8s %(message)s"
+
+# Attributes every LogRecord has; anything else was passed via `extra=`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class LazyJson:
+    """
+    Log argument that serialises `value` only when the record is emitted:
+    log.debug("Payload:\\n%s", LazyJson(payload, indent=2)) costs nothing
+    while debug is off. When it is on, DeferredQueueHandler deep-copies
+    `value` as the record is queued and the listener thread serialises the
+    copy, so the caller may mutate `value` right after the call.
+    """
+
+    __slots__ = ("value", "indent")
+
+    def __init__(self, value, indent=None):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self):
+        return json.dumps(self.value, indent=self.indent, default=str)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    One compact JSON object per record: ts, level, logger, message, any
+    `extra=` fields, and the traceback when there is one.
+    """
+
+    def format(self, record):
+        entry = {
+            "ts":      datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level":   record.levelname,
+            "logger":  record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+
+# Arguments that cannot change after the call and are safe to format later
+_IMMUTABLE = (str, bytes, int, float, bool, type(None))
+
+
+def _snapshot(arg):
+    if isinstance(arg, _IMMUTABLE):
+        return arg
+    try:
+        if isinstance(arg, LazyJson):
+            # Copy the value the caller still owns; serialising is what is deferred
+            return LazyJson(copy.deepcopy(arg.value), arg.indent)
+        return copy.deepcopy(arg)
+    except Exception:
+        return str(arg) if isinstance(arg, LazyJson) else repr(arg)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that defers only LazyJson arguments to the listener thread.
+
+    Records without one are rendered here, as the stock QueueHandler does, so
+    the log shows arguments as they were at the call even if the caller
+    mutates them right after. Records with a LazyJson keep their arguments,
+    all deep-copied (a LazyJson's value included), and are rendered by the
+    listener: the copy happens here, the JSON serialisation there. Tracebacks
+    are always rendered here.
+    """
+
+    _formatter = logging.Formatter()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        args = record.args
+        if isinstance(args, tuple) and any(isinstance(a, LazyJson) for a in args):
+            record.args = tuple(_snapshot(a) for a in args)
+        else:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = self._formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _Flush:
+    """Queue marker: the listener sets `done` once every earlier record is written."""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class _Listener(QueueListener):
+    def handle(self, record):
+        if isinstance(record, _Flush):
+            for handler in self.handlers:
+                handler.flush()
+            record.done.set()
+            return
+        super().handle(record)
+
+
+_listener = None
+_lock = threading.Lock()
+
+
+def configure_logging(level=None, fmt=None, path=None, adopt=()):
+    """
+    Routes every record through one queue to one background emitter.
+
+    The root logger gets a DeferredQueueHandler; a QueueListener thread
+    formats records and writes them to `path` (stderr by default), so callers
+    never block on I/O. LOG_LEVEL, LOG_FORMAT ("text" or "json") and LOG_FILE
+    supply the defaults. Loggers in `adopt` (e.g. the external `logger`
+    module's) lose their own handlers and propagate to root, so each record
+    is emitted exactly once.
+
+    Safe to call more than once: only the first call installs handlers.
+    """
+    with _lock:
+        for logger in adopt:
+            if logger is None:
+                continue
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+            logger.propagate = True
+            logger.setLevel(logging.NOTSET)
+
+        if _listener is not None:
+            return _listener
+
+        level = (level or os.getenv("LOG_LEVEL", "").strip() or DEFAULT_LEVEL).upper()
+        fmt = (fmt or os.getenv("LOG_FORMAT", "").strip() or "text").lower()
+        path = path or os.getenv("LOG_FILE", "").strip() or None
+
+        sink = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stderr)
+        sink.setFormatter(JsonLinesFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+        logging.getLogger().setLevel(level)
+        _install(sink)
+        # Drain the queue before the interpreter exits
+        atexit.register(stop_logging)
+        return _listener
+
+
+def _install(*handlers):
+    global _listener
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(records))
+    _listener = _Listener(records, *handlers)
+    _listener.start()
+
+
+def _after_fork_in_child():
+    """A forked worker (e.g. fanout's process pool) gets its own queue and listener thread."""
+    global _lock
+    _lock = threading.Lock()
+    if _listener is not None:
+        _install(*_listener.handlers)
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def flush_logging(timeout=10.0):
+    """
+    Blocks until every record queued so far is written. Worker processes
+    call this before handing back their results: they exit through
+    os._exit, so atexit never drains their queue.
+    """
+    listener = _listener
+    if listener is None:
+        return True
+    marker = _Flush()
+    listener.queue.put(marker)
+    return marker.done.wait(timeout)
+
+
+def stop_logging():
+    """Flushes queued records and stops the background emitter."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
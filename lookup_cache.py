@@ -0,0 +1,124 @@
+import os
+import time
+import logging
+import threading
+
+from file_store import file_lock, read_json, write_json
+
+log = logging.getLogger(__name__)
+
+# Application ids, tier types and node lists almost never change
+DEFAULT_TTL = 24 * 3600
+
+
+class LookupCache:
+    """
+    TTL cache for controller lookups: application ids, tiers and nodes.
+
+    Entries are keyed by (controller, kind, *parts), e.g.
+    (base_url, "tier", appd_id, tier_name). They live in memory and, when
+    `path` is set, in a JSON file shared by later runs and other processes;
+    file access is serialised with flock like the token cache.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @staticmethod
+    def _key(controller, kind, *parts):
+        return "|".join(str(p) for p in (controller, kind, *parts))
+
+    @staticmethod
+    def _is_fresh(entry):
+        return bool(entry) and entry["expires_at"] > time.time()
+
+    def _write_file(self, data):
+        # Expired entries are dropped whenever the file is rewritten
+        write_json(self.path, {k: v for k, v in data.items() if self._is_fresh(v)})
+
+    def _update_file(self, change):
+        if not self.path:
+            return
+        with file_lock(self.path):
+            data = read_json(self.path)
+            change(data)
+            self._write_file(data)
+
+    def get(self, controller, kind, *parts):
+        """Returns the cached value, or None when missing or expired."""
+        key = self._key(controller, kind, *parts)
+        entry = self._entries.get(key)
+        if self._is_fresh(entry):
+            return entry["value"]
+        if self.path:
+            with file_lock(self.path):
+                entry = read_json(self.path).get(key)
+            if self._is_fresh(entry):
+                self._entries[key] = entry
+                return entry["value"]
+        return None
+
+    def put(self, controller, kind, *parts, value):
+        key = self._key(controller, kind, *parts)
+        entry = {"value": value, "expires_at": time.time() + self.ttl}
+        self._entries[key] = entry
+        self._update_file(lambda data: data.__setitem__(key, entry))
+        return value
+
+    def _drop(self, predicate):
+        """Removes every entry for which predicate(key, entry) is true."""
+        def drop(entries):
+            for key in [k for k, e in entries.items() if predicate(k, e)]:
+                entries.pop(key, None)
+
+        with self._lock:
+            drop(self._entries)
+        self._update_file(drop)
+
+    def invalidate(self, controller, kind=None, *parts):
+        """
+        Drops every entry whose key starts with (controller, kind, *parts), so
+        invalidate(url, "tier", appd_id) forgets all cached tiers of one app.
+        """
+        prefix = self._key(controller, *([kind] if kind else []), *parts)
+        self._drop(lambda key, _: key == prefix or key.startswith(prefix + "|"))
+
+    def invalidate_application(self, controller, appd_id):
+        """Forgets an application id and everything cached under it (after a 404)."""
+        log.info(f"Dropping cached lookups for application {appd_id} on {controller}")
+        app_prefix = self._key(controller, "app_id") + "|"
+        self.invalidate(controller, "tier", appd_id)
+        self.invalidate(controller, "tiers", appd_id)
+        self.invalidate(controller, "nodes", appd_id)
+        self._drop(lambda key, entry: key.startswith(app_prefix) and entry["value"] == appd_id)
+
+    def get_or_fetch(self, controller, kind, parts, fetch, refresh=False):
+        """
+        Returns the cached value for (controller, kind, *parts), calling fetch()
+        only when nothing fresh is cached or refresh is set. Concurrent callers
+        for the same key wait for a single fetch. Empty results are not cached.
+        """
+        key = self._key(controller, kind, *parts)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            if not refresh:
+                value = self.get(controller, kind, *parts)
+                if value is not None:
+                    return value
+            value = fetch()
+            if value or value == 0:
+                self.put(controller, kind, *parts, value=value)
+            return value
+
+
+# Process-wide cache; APPD_LOOKUP_CACHE enables the on-disk store shared across runs
+LOOKUP_CACHE = LookupCache(
+    path=os.getenv("APPD_LOOKUP_CACHE", "").strip() or None,
+    ttl=int(os.getenv("APPD_LOOKUP_TTL", "").strip() or DEFAULT_TTL),
+)
@@ -1,54 +1,87 @@
 import os
 import sys
+import csv
 import json
+import hashlib
 import logging
-from pathlib import Path
+from collections import namedtuple
 from logger import logger as custom_logger
 from apis import AppDynamics
-from jinja2 import Environment, FileSystemLoader, StrictUndefined, TemplateNotFound
+from render import render_template_json
+from metrics import METRICS
+from log_config import configure_logging
+import reconcile
+import dag
 
 # ─── Configure logging ─────────────────────────────────────────────────────────
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)-8s %(message)s"
-)
 log = custom_logger if custom_logger else logging.getLogger(__name__)
 
-# ─── Load Jinja2 templates ─────────────────────────────────────────────────────
-template_env = Environment(
-    loader=FileSystemLoader(
-        searchpath=Path(__file__).parent.parent / "templates"
-    ),
-    undefined=StrictUndefined,
-    keep_trailing_newline=True,
-    lstrip_blocks=True,
-    trim_blocks=True,
-)
+
+def setup_logging():
+    """
+    One queue-backed emitter for every logger; the custom logger's own handler
+    is detached so each line is written once (LOG_LEVEL, LOG_FORMAT, LOG_FILE).
+    Called by the entry points, never at import.
+    """
+    configure_logging(adopt=[custom_logger])
 
 # ─── Environment variables ─────────────────────────────────────────────────────
-appd_env               = os.getenv("APPD_ENV", "").strip()
-BusinessName           = os.getenv("BusinessName", "").strip().upper()
-ApplicationName        = os.getenv("ApplicationName", "").strip()
-appd_tier              = os.getenv("APPD_TIER", "").strip()
-email_list             = os.getenv("USER_EMAIL", "").strip()
-user_email             = [e.strip() for e in email_list.split(",") if e.strip()]
-account_name           = os.getenv("APPD_CON", "").strip()
-secrets_file_path      = os.getenv("SECRETS_PATH", "").strip()
-critical_value         = os.getenv("CRITICAL_VALUE", "").strip() or None
-warning_value          = os.getenv("WARNING_VALUE", "").strip() or None
-update_flag            = os.getenv("UPDATE", "").strip().lower() == "true"
-healthrule_name        = os.getenv("HEALTHRULE_NAME", "").strip()
-monitoring             = os.getenv("Synthetic", "").strip().lower()
-create_healthrule_flag = os.getenv("CREATE_HEALTHRULE", "").strip().lower() == "true"
+# Read by load_settings() at run time, never at import, so tooling and batch
+# workers can import this module without an environment.
+Settings = namedtuple("Settings", [
+    "appd_env", "BusinessName", "ApplicationName", "appd_tier", "email_list",
+    "user_email", "account_name", "secrets_file_path", "critical_value",
+    "warning_value", "update_flag", "healthrule_name", "monitoring",
+    "create_healthrule_flag", "hr_workers", "reconcile_mode",
+    "reconcile_prune_prefix", "thresholds_csv", "metrics_path", "prom_textfile",
+    "lookup_refresh",
+])
+
+
+def load_settings(environ=None):
+    """Reads the onboarding settings from the environment (os.environ by default)."""
+    env = os.environ if environ is None else environ
+
+    def get(name):
+        return (env.get(name) or "").strip()
+
+    email_list = get("USER_EMAIL")
+    return Settings(
+        appd_env               = get("APPD_ENV"),
+        BusinessName           = get("BusinessName").upper(),
+        ApplicationName        = get("ApplicationName"),
+        appd_tier              = get("APPD_TIER"),
+        email_list             = email_list,
+        user_email             = [e.strip() for e in email_list.split(",") if e.strip()],
+        account_name           = get("APPD_CON"),
+        secrets_file_path      = get("SECRETS_PATH"),
+        critical_value         = get("CRITICAL_VALUE") or None,
+        warning_value          = get("WARNING_VALUE") or None,
+        update_flag            = get("UPDATE").lower() == "true",
+        healthrule_name        = get("HEALTHRULE_NAME"),
+        monitoring             = get("Synthetic").lower(),
+        create_healthrule_flag = get("CREATE_HEALTHRULE").lower() == "true",
+        hr_workers             = int(get("HR_WORKERS") or 1),
+        reconcile_mode         = get("RECONCILE").lower(),          # "", "plan" or "apply"
+        reconcile_prune_prefix = get("RECONCILE_PRUNE_PREFIX") or None,
+        thresholds_csv         = get("THRESHOLDS_CSV"),
+        metrics_path           = get("METRICS_PATH"),               # JSON summary
+        prom_textfile          = get("PROM_TEXTFILE"),              # node_exporter textfile
+        lookup_refresh         = get("LOOKUP_REFRESH").lower() == "true",  # bypass cached app/tier ids
+    )
 
 # ─── Helpers ───────────────────────────────────────────────────────────────────
 
-def get_secrets(account_name: str):
-    """Reads CLIENT_ID and SECRET from the secrets file."""
+def secrets_for_account(secrets: dict, account_name: str):
+    """Picks an account's CLIENT_ID and SECRET out of the loaded secrets file."""
     key = account_name.upper().replace("-", "_")
+    return secrets.get(f"{key}_CLIENT_ID"), secrets.get(f"{key}_SECRET")
+
+def get_secrets(account_name: str, secrets_file_path: str):
+    """Reads CLIENT_ID and SECRET from the secrets file."""
     with open(secrets_file_path, "r") as f:
         data = json.load(f)
-    return data.get(f"{key}_CLIENT_ID"), data.get(f"{key}_SECRET")
+    return secrets_for_account(data, account_name)
 
 def load_config():
     """Loads config.json from the project root."""
@@ -63,14 +96,24 @@ def load_config():
         log.error("Malformed config.json: %s", err)
     sys.exit(1)
 
-def render_template_json(template_name, params):
-    """Renders Jinja2 template to a Python dict."""
-    try:
-        raw = template_env.get_template(template_name).render(params)
-        return json.loads(raw)
-    except TemplateNotFound as e:
-        log.error("Template not found: %s", e)
-        sys.exit(1)
+def load_threshold_csv(path):
+    """
+    Reads bulk threshold updates from a CSV with the columns
+    name, critical, warning and (optionally) condition. Blank cells mean "leave as is".
+    """
+    updates = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            name = (row.get("name") or "").strip()
+            if not name:
+                continue
+            updates.append({
+                "name":      name,
+                "critical":  (row.get("critical") or "").strip() or None,
+                "warning":   (row.get("warning") or "").strip() or None,
+                "condition": (row.get("condition") or "").strip() or None,
+            })
+    return updates
 
 def select_healthrule_templates(config, tier_type, monitoring):
     if monitoring == "synthetic":
@@ -88,8 +131,9 @@ def create_healthrules(appd, appd_id, config, tier_type, monitoring, params):
     Create or confirm health rules. Returns list of created/existing names.
     """
     templates = select_healthrule_templates(config, tier_type, monitoring)
-    payloads = [render_template_json(t, params) for t in templates]
-    results = appd.create_health_rules(appd_id, payloads)
+    with METRICS.phase("health_rules"):
+        payloads = [render_template_json(t, params) for t in templates]
+        results = appd.create_health_rules(appd_id, payloads)
 
     hr_names = []
     for r in results:
@@ -103,103 +147,200 @@ def create_healthrules(appd, appd_id, config, tier_type, monitoring, params):
 
     return hr_names
 
-def create_actions(appd, appd_id, config, params):
-    """
-    Create base actions. Logs successes and duplicates.
-    """
-    for tmpl in config["base_actions"]:
-        payload = render_template_json(tmpl, params)
-        res = appd.post_appd_action(appd_id, payload)
-        if res.get("success") and res.get("data", {}).get("name"):
-            log.info("Action '%s' created or already existed", res["data"]["name"])
-        else:
-            msg = res.get("message") or res.get("error")
-            log.warning("Action failed: %s", msg)
+def _prefetch(appd, appd_id):
+    # One GET per entity type up front; existing names then skip their POSTs
+    with METRICS.phase("prefetch"):
+        appd.prefetch_entities(appd_id)
+
+
+def _create_action(appd, appd_id, tmpl, params):
+    with METRICS.phase("actions"):
+        res = appd.post_appd_action(appd_id, render_template_json(tmpl, params))
+    if res.get("success") and res.get("data", {}).get("name"):
+        log.info("Action '%s' created or already existed", res["data"]["name"])
+    else:
+        log.warning("Action failed: %s", res.get("message") or res.get("error"))
+    return res
+
+
+def _create_healthrule(appd, appd_id, tmpl, params):
+    with METRICS.phase("health_rules"):
+        res = appd.post_appd_hr(appd_id, render_template_json(tmpl, params))
+    if res.get("success") and res.get("data", {}).get("name"):
+        log.info("Health rule '%s' created or already existed", res["data"]["name"])
+    else:
+        log.warning("Health rule failed: %s", res.get("message") or res.get("error"))
+    return res
+
 
+def _healthrule_names(hr_results):
+    """Names of the health rules that exist, deduplicated in order."""
+    names = []
+    for res in hr_results:
+        name = res.get("data", {}).get("name") if res and res.get("success") else None
+        if name and name not in names:
+            names.append(name)
+    return names
 
-def _invoke_dynamic_policies(appd, appd_id, config, tier_type, monitoring, params):
+
+def _create_policy(appd, appd_id, tmpl, params, hr_results):
     """
-    1) Ensures health rules exist & collects their names (deduped)
-    2) Renders each policy with that name list injected
-    3) Posts the policy
+    Renders one policy with the names of this tier's health rules injected and
+    posts it. Returns None (skipped) when none of the health rules exist.
     """
-    # 1) Create/confirm health rules & get their names
-    hr_names = create_healthrules(appd, appd_id, config, tier_type, monitoring, params)
-
-    # Deduplicate while preserving order
-    seen = set()
-    unique_hr_names = []
-    for name in hr_names:
-        if name not in seen:
-            seen.add(name)
-            unique_hr_names.append(name)
-
-    if not unique_hr_names:
+    hr_names = _healthrule_names(hr_results)
+    if not hr_names:
         log.warning("No valid health rules found. Skipping policy creation.")
-        return
-
-    params["healthrule_names"] = unique_hr_names
-    log.info("Using health rules for policy creation: %s", unique_hr_names)
+        return None
 
-    # 2) Render & post each policy
-    for tmpl in config.get("policies", []):
-        policy = render_template_json(tmpl, params)
+    with METRICS.phase("policies"):
+        policy = render_template_json(tmpl, {**params, "healthrule_names": hr_names})
         name = policy.get("name", "<unknown>")
         log.info("Attempting to create policy '%s'...", name)
-
         res = appd.create_policy_with_dynamic_healthrules(appd_id, policy)
 
-        # 3) Log outcome
-        if res.get("success"):
-            log.info("Policy '%s' created or updated successfully", name)
-        else:
-            msg = res.get("message") or res.get("error")
-            log.warning("Policy '%s' failed: %s", name, msg)
+    if res.get("success"):
+        log.info("Policy '%s' created or updated successfully", name)
+    else:
+        log.warning("Policy '%s' failed: %s", name, res.get("message") or res.get("error"))
+    return res
+
+
+def add_onboarding_steps(graph, appd, appd_id, config, tier_type, monitoring, params):
+    """
+    Adds one tier's onboarding to a dag.Graph:
+      - one prefetch step per application, shared by all of its tiers
+      - one step per action and per health rule, after the prefetch
+      - one step per policy, after this tier's actions and health rules only
+    so tiers and entity types overlap instead of running phase by phase.
+    Returns the tier's step keys: {"actions": [...], "health_rules": [...], "policies": [...]}.
+
+    Step keys include a fingerprint of `params`: two entries for the same tier
+    with different emails or thresholds get their own steps, and only truly
+    identical entries share them.
+    """
+    fingerprint = hashlib.sha1(
+        json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()[:12]
+    tier = (appd_id, params["appd_tier"] or params["ApplicationName"], fingerprint)
+    prefetch = graph.add(("prefetch", appd_id), lambda _: _prefetch(appd, appd_id))
+
+    actions = [
+        graph.add(("action", *tier, tmpl),
+                  lambda _, tmpl=tmpl: _create_action(appd, appd_id, tmpl, params), [prefetch])
+        for tmpl in config["base_actions"]
+    ]
+    health_rules = [
+        graph.add(("health_rule", *tier, tmpl),
+                  lambda _, tmpl=tmpl: _create_healthrule(appd, appd_id, tmpl, params), [prefetch])
+        for tmpl in select_healthrule_templates(config, tier_type, monitoring)
+    ]
+
+    def policy_step(tmpl):
+        def run(inputs):
+            return _create_policy(appd, appd_id, tmpl, params, [inputs[k] for k in health_rules])
+        return run
+
+    policies = [
+        graph.add(("policy", *tier, tmpl), policy_step(tmpl), actions + health_rules)
+        for tmpl in config.get("policies", [])
+    ]
+    return {"actions": actions, "health_rules": health_rules, "policies": policies}
+
+
+def summarize_steps(keys, results):
+    """
+    Per-tier outcome of add_onboarding_steps after graph.run(): the action and
+    policy results, the health rule names and the number of failed steps.
+    """
+    def outcomes(kind):
+        return [results[k] for k in keys[kind]]
 
+    failed = sum(
+        1 for kind in keys for r in outcomes(kind)
+        if r.status != "ok" or (r.value is not None and not r.value.get("success"))
+    )
+    return {
+        "actions":      [r.value for r in outcomes("actions") if r.value is not None],
+        "health_rules": _healthrule_names(r.value for r in outcomes("health_rules")),
+        "policies":     [r.value for r in outcomes("policies") if r.value is not None],
+        "failed":       failed,
+    }
 
 
 # ─── Main Flow ────────────────────────────────────────────────────────────────
 
-def main():
+def main(settings=None):
+    setup_logging()
+    settings = settings or load_settings()
+    monitoring = settings.monitoring
+
     # 1) Load config & secrets
     config = load_config()
-    client_id, client_secret = get_secrets(account_name)
+    client_id, client_secret = get_secrets(settings.account_name, settings.secrets_file_path)
 
     # 2) Instantiate client & resolve IDs
-    appd = AppDynamics(appd_env, client_id, account_name, client_secret)
-    appd_id = appd.get_appID(ApplicationName)
-
-    # 3) Determine tier_type for non-synthetic runs
-    tier_type = None
-    if monitoring != "synthetic" and not update_flag:
-        if not appd_tier:
-            log.error("APPD_TIER is required for this operation.")
-            sys.exit(1)
-        tiers = appd.get_appd_tier(appd_id, appd_tier)
-        if not tiers:
-            log.error("Tier '%s' not found in app %s", appd_tier, ApplicationName)
-            sys.exit(1)
-        tier_type = tiers[0]["type"]
+    appd = AppDynamics(
+        settings.appd_env, client_id, settings.account_name, client_secret,
+        max_workers=settings.hr_workers,
+    )
+    with METRICS.phase("lookup"):
+        appd_id = appd.get_appID(settings.ApplicationName, refresh=settings.lookup_refresh)
+
+        # 3) Determine tier_type for non-synthetic runs
+        tier_type = None
+        if monitoring != "synthetic" and not settings.update_flag:
+            if not settings.appd_tier:
+                log.error("APPD_TIER is required for this operation.")
+                sys.exit(1)
+            tiers = appd.get_appd_tier(appd_id, settings.appd_tier, refresh=settings.lookup_refresh)
+            if not tiers:
+                log.error("Tier '%s' not found in app %s", settings.appd_tier, settings.ApplicationName)
+                sys.exit(1)
+            tier_type = tiers[0]["type"]
 
         # 4) Build template params
     params = {
-        "appd_env":        appd_env,
-        "BusinessName":    BusinessName,
-        "ApplicationName": ApplicationName,
-        "appd_tier":       appd_tier,
-        "user_email":      user_email,
-        "critical_value":  critical_value,
-        "warning_value":   warning_value,
-        "update":          update_flag,
-        "healthrule_name": healthrule_name,
+        "appd_env":        settings.appd_env,
+        "BusinessName":    settings.BusinessName,
+        "ApplicationName": settings.ApplicationName,
+        "appd_tier":       settings.appd_tier,
+        "user_email":      settings.user_email,
+        "critical_value":  settings.critical_value,
+        "warning_value":   settings.warning_value,
+        "update":          settings.update_flag,
+        "healthrule_name": settings.healthrule_name,
     }
 
     # 5) Onboarding vs. update
     try:
-        if monitoring == "synthetic" or tier_type in config.get("supported_tier_types", []):
-            # Actions + Policies (health rules handled inside _invoke_dynamic_policies)
-            create_actions(appd, appd_id, config, params)
-            _invoke_dynamic_policies(appd, appd_id, config, tier_type, monitoring, params)
+        if settings.reconcile_mode in ("plan", "apply") and (
+            monitoring == "synthetic" or tier_type in config.get("supported_tier_types", [])
+        ):
+            # Diff rendered templates against the controller; only "apply" writes
+            with METRICS.phase("reconcile"):
+                steps, results = reconcile.reconcile(
+                    appd, appd_id, config,
+                    select_healthrule_templates(config, tier_type, monitoring),
+                    params,
+                    apply_changes=settings.reconcile_mode == "apply",
+                    prune_prefix=settings.reconcile_prune_prefix,
+                    max_workers=settings.hr_workers,
+                )
+            print(reconcile.format_plan(steps), "\n")
+            if results and not all(r.get("success") for r in results):
+                log.warning("Reconcile finished with %d failed step(s)",
+                            sum(1 for r in results if not r.get("success")))
+                return 1
+        elif monitoring == "synthetic" or tier_type in config.get("supported_tier_types", []):
+            # Prefetch, then actions and health rules side by side; each policy
+            # starts once its own actions and health rules are done
+            graph = dag.Graph()
+            keys = add_onboarding_steps(graph, appd, appd_id, config, tier_type, monitoring, params)
+            summary = summarize_steps(keys, graph.run(max_workers=settings.hr_workers))
+            log.info("Onboarded %s: %d action(s), %d health rule(s), %d policy(ies), %d failed",
+                     settings.appd_tier or settings.ApplicationName, len(summary["actions"]),
+                     len(summary["health_rules"]), len(summary["policies"]), summary["failed"])
         else:
             log.warning("Skipping unsupported tier type: %s", tier_type)
     except Exception as e:
@@ -207,12 +348,26 @@ def main():
         return 1
     
     # 6) Threshold update path
-    if update_flag and healthrule_name:
+    if settings.update_flag and settings.thresholds_csv:
+        updates = load_threshold_csv(settings.thresholds_csv)
+        with METRICS.phase("thresholds"):
+            results = appd.bulk_update_health_rule_thresholds(
+                appd_id, updates, max_workers=settings.hr_workers
+            )
+        failed = [r for r in results if not r.get("success")]
+        log.info("Updated thresholds for %d of %d health rule(s)",
+                 len(results) - len(failed), len(results))
+        for r in failed:
+            log.warning("%s: %s", r.get("name"), r.get("message") or r.get("error"))
+        if failed:
+            return 1
+
+    elif settings.update_flag and settings.healthrule_name:
         res = appd.update_health_rule_thresholds(
             appd_id,
-            healthrule_name,
-            critical_value,
-            warning_value
+            settings.healthrule_name,
+            settings.critical_value,
+            settings.warning_value
         )
         if res.get("success"):
             log.info(res["message"])
@@ -220,8 +375,8 @@ def main():
             log.warning(res.get("message") or res.get("error"))
 
     # 7) One-off health-rule creation
-    elif create_healthrule_flag:
-        if not appd_tier:
+    elif settings.create_healthrule_flag:
+        if not settings.appd_tier:
             log.error("APPD_TIER is required for one-off creation.")
             return 1
         params["healthrule_names"] = create_healthrules(appd, appd_id, config, tier_type, monitoring, params)
@@ -233,12 +388,18 @@ def main():
 # ─── Entry Point ──────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
+    settings = load_settings()
     banner = (
-        f"Updating '{healthrule_name}' thresholds..."
-        if update_flag else
+        f"Updating '{settings.healthrule_name}' thresholds..."
+        if settings.update_flag else
         "Onboarding synthetic health rules/actions/policies..."
-        if monitoring == "synthetic" else
-        f"Onboarding {appd_tier} ({monitoring}) for {ApplicationName}"
+        if settings.monitoring == "synthetic" else
+        f"Onboarding {settings.appd_tier} ({settings.monitoring}) for {settings.ApplicationName}"
     )
     print(banner, "\n")
-    sys.exit(main())
+    try:
+        exit_code = main(settings)
+    finally:
+        # Written even when main() exits early, so failed runs are measurable too
+        METRICS.write(settings.metrics_path, settings.prom_textfile)
+    sys.exit(exit_code)
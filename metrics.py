@@ -0,0 +1,240 @@
+import os
+import re
+import json
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# Prometheus histogram buckets for request latency, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PERCENTILES = (50, 95, 99)
+
+_ID_SEGMENT = re.compile(r"^\d+$")
+
+
+def endpoint_key(url):
+    """
+    Collapses a controller URL into a low-cardinality endpoint label:
+    ".../controller/rest/applications/My%20App/tiers/web/?output=json"
+    becomes "rest/applications/{app}/tiers/{tier}".
+    """
+    path = url.split("?", 1)[0]
+    if "/controller/" in path:
+        path = path.split("/controller/", 1)[1]
+    parts = [p for p in path.split("/") if p]
+    key = []
+    for index, part in enumerate(parts):
+        previous = parts[index - 1] if index else ""
+        if previous == "applications":
+            key.append("{app}")
+        elif previous in ("tiers", "nodes"):
+            key.append("{tier}" if previous == "tiers" else "{node}")
+        elif _ID_SEGMENT.match(part):
+            key.append("{id}")
+        else:
+            key.append(part)
+    return "/".join(key)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not samples:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(samples)))
+    return samples[rank - 1]
+
+
+class Metrics:
+    """
+    Thread-safe counters for one run.
+
+    Controller calls are recorded per (method, endpoint): request count,
+    retries, every response status seen (including throttled attempts) and
+    the wall time of each call. Phases ("actions", "health_rules", ...) record
+    how long each onboarding step took, summed over every tier.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self._requests = {}
+        self._phases = {}
+
+    def _endpoint(self, method, url):
+        key = (method.upper(), endpoint_key(url))
+        entry = self._requests.get(key)
+        if entry is None:
+            entry = self._requests[key] = {"count": 0, "retries": 0, "errors": 0,
+                                           "statuses": {}, "latencies": []}
+        return entry
+
+    def observe_request(self, method, url, seconds, statuses, retries=0, error=False):
+        """
+        Records one logical call. `statuses` lists the status of every attempt
+        made for it; `retries` counts the attempts beyond the first.
+        """
+        with self._lock:
+            entry = self._endpoint(method, url)
+            entry["count"] += 1
+            entry["retries"] += retries
+            entry["errors"] += int(error)
+            entry["latencies"].append(seconds)
+            for status in statuses:
+                entry["statuses"][status] = entry["statuses"].get(status, 0) + 1
+
+    @contextmanager
+    def phase(self, name):
+        """Times the enclosed block and adds it to the `name` phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                entry = self._phases.setdefault(name, {"count": 0, "seconds": 0.0})
+                entry["count"] += 1
+                entry["seconds"] += elapsed
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self._requests.clear()
+            self._phases.clear()
+
+    # ─── Export ────────────────────────────────────────────────────────────────
+
+    def summary(self):
+        """JSON-serialisable snapshot, endpoints sorted by total time spent."""
+        with self._lock:
+            requests = {key: {**entry, "latencies": sorted(entry["latencies"]),
+                              "statuses": dict(entry["statuses"])}
+                        for key, entry in self._requests.items()}
+            phases = {name: dict(entry) for name, entry in self._phases.items()}
+
+        endpoints = []
+        for (method, endpoint), entry in requests.items():
+            latencies = entry["latencies"]
+            total = sum(latencies)
+            endpoints.append({
+                "method":        method,
+                "endpoint":      endpoint,
+                "count":         entry["count"],
+                "retries":       entry["retries"],
+                "errors":        entry["errors"],
+                "statuses":      {str(s): n for s, n in sorted(entry["statuses"].items(), key=str)},
+                "total_seconds": round(total, 6),
+                "mean_seconds":  round(total / len(latencies), 6) if latencies else None,
+                **{f"p{pct}_seconds": round(percentile(latencies, pct), 6) if latencies else None
+                   for pct in PERCENTILES},
+                "max_seconds":   round(latencies[-1], 6) if latencies else None,
+            })
+        endpoints.sort(key=lambda e: e["total_seconds"], reverse=True)
+
+        return {
+            "started_at":       self.started_at,
+            "duration_seconds": round(time.time() - self.started_at, 6),
+            "requests":         sum(e["count"] for e in endpoints),
+            "retries":          sum(e["retries"] for e in endpoints),
+            "endpoints":        endpoints,
+            "phases": {
+                name: {"count": entry["count"], "seconds": round(entry["seconds"], 6)}
+                for name, entry in sorted(phases.items())
+            },
+        }
+
+    def prometheus(self, prefix="appd"):
+        """Renders the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            requests = {key: {**entry, "latencies": list(entry["latencies"]),
+                              "statuses": dict(entry["statuses"])}
+                        for key, entry in self._requests.items()}
+            phases = {name: dict(entry) for name, entry in self._phases.items()}
+
+        def labels(**values):
+            return ",".join(f'{k}="{_escape(v)}"' for k, v in values.items())
+
+        lines = [
+            f"# HELP {prefix}_requests_total Controller calls by endpoint.",
+            f"# TYPE {prefix}_requests_total counter",
+        ]
+        for (method, endpoint), entry in sorted(requests.items()):
+            lines.append(f"{prefix}_requests_total{{{labels(method=method, endpoint=endpoint)}}} {entry['count']}")
+
+        lines += [
+            f"# HELP {prefix}_responses_total Responses by endpoint and status, including retried attempts.",
+            f"# TYPE {prefix}_responses_total counter",
+        ]
+        for (method, endpoint), entry in sorted(requests.items()):
+            for status, count in sorted(entry["statuses"].items(), key=str):
+                lines.append(
+                    f"{prefix}_responses_total"
+                    f"{{{labels(method=method, endpoint=endpoint, status=status)}}} {count}"
+                )
+
+        lines += [
+            f"# HELP {prefix}_request_retries_total Attempts beyond the first, by endpoint.",
+            f"# TYPE {prefix}_request_retries_total counter",
+        ]
+        for (method, endpoint), entry in sorted(requests.items()):
+            lines.append(
+                f"{prefix}_request_retries_total{{{labels(method=method, endpoint=endpoint)}}} {entry['retries']}"
+            )
+
+        lines += [
+            f"# HELP {prefix}_request_duration_seconds Wall time of controller calls, retries included.",
+            f"# TYPE {prefix}_request_duration_seconds histogram",
+        ]
+        for (method, endpoint), entry in sorted(requests.items()):
+            base = labels(method=method, endpoint=endpoint)
+            latencies = entry["latencies"]
+            for bound in LATENCY_BUCKETS:
+                count = sum(1 for s in latencies if s <= bound)
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{{base},le="{bound}"}} {count}')
+            lines.append(f'{prefix}_request_duration_seconds_bucket{{{base},le="+Inf"}} {len(latencies)}')
+            lines.append(f"{prefix}_request_duration_seconds_sum{{{base}}} {sum(latencies):.6f}")
+            lines.append(f"{prefix}_request_duration_seconds_count{{{base}}} {len(latencies)}")
+
+        lines += [
+            f"# HELP {prefix}_phase_duration_seconds_total Time spent per onboarding phase.",
+            f"# TYPE {prefix}_phase_duration_seconds_total counter",
+        ]
+        for name, entry in sorted(phases.items()):
+            lines.append(f"{prefix}_phase_duration_seconds_total{{{labels(phase=name)}}} {entry['seconds']:.6f}")
+        lines += [
+            f"# HELP {prefix}_phase_runs_total Number of times each onboarding phase ran.",
+            f"# TYPE {prefix}_phase_runs_total counter",
+        ]
+        for name, entry in sorted(phases.items()):
+            lines.append(f"{prefix}_phase_runs_total{{{labels(phase=name)}}} {entry['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path=None, prom_path=None):
+        """
+        Writes the JSON summary and/or the Prometheus textfile. Files are
+        replaced atomically so a node_exporter scrape never sees half a file.
+        """
+        if json_path:
+            _write_atomic(json_path, json.dumps(self.summary(), indent=2))
+            log.info(f"Wrote metrics summary to {json_path}")
+        if prom_path:
+            _write_atomic(prom_path, self.prometheus())
+            log.info(f"Wrote Prometheus metrics to {prom_path}")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# Process-wide registry shared by every client and phase timer
+METRICS = Metrics()
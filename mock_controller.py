@@ -0,0 +1,405 @@
+"""
+Local stand-in for an AppDynamics SaaS controller.
+
+Implements the endpoints used by apis.AppDynamics and db_hr.py with in-memory
+state, so onboarding can be run and benchmarked offline:
+
+    python mock_controller.py --port 8090 --latency lognormal:0.15:0.4 \\
+        --error-rate 0.01 --rate-limit 50
+    APPD_BASE_URL=http://127.0.0.1:8090/controller/ python main.py
+
+The database monitoring application db_hr.py posts to (id 15) is registered
+on start, so db_hr.py runs against the mock as is.
+
+Latency, random 5xx errors and 429 throttling are configurable.
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+import itertools
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ALERTING_ENDPOINTS = ("health-rules", "actions", "policies")
+# db_hr.py posts to this fixed application (the controller's database monitoring app)
+DB_APP_ID = 15
+DB_APP_NAME = "Database Monitoring"
+
+
+class LatencyModel:
+    """
+    Per-request delay in seconds, parsed from a spec string:
+    "0" or "fixed:0.1", "uniform:0.05:0.25", "lognormal:<median>:<sigma>".
+    """
+
+    def __init__(self, spec="0"):
+        parts = str(spec).split(":")
+        if len(parts) == 1:
+            parts = ["fixed", parts[0]]
+        self.kind = parts[0]
+        self.args = [float(p) for p in parts[1:]]
+        if self.kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency model: {spec}")
+
+    def sample(self):
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return random.uniform(self.args[0], self.args[1])
+        median, sigma = self.args
+        return random.lognormvariate(0, sigma) * median
+
+
+class Throttle:
+    """Token bucket shared by all requests; None rate disables throttling."""
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate or 0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Returns 0 when the request may proceed, else seconds until a token frees up."""
+        if not self.rate:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class ControllerState:
+    """
+    In-memory applications, tiers, nodes, collectors and alerting entities.
+
+    Seed applications may fix their "id"; generated ids skip the fixed ones.
+    Unless `db_app_id` is None (or the seed already uses that id), the
+    database monitoring application db_hr.py posts to is registered too.
+    """
+
+    def __init__(self, seed=None, auto_create=True, default_tier_type="Application Server",
+                 db_app_id=DB_APP_ID):
+        self.lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._reserved = set()
+        self.ids = iter(self._next_id, None)
+        self.auto_create = auto_create
+        self.default_tier_type = default_tier_type
+        self.applications = {}   # name -> app dict
+        self.entities = {}       # (app_id, endpoint) -> {id: entity}
+        self.collectors = []
+        self.tokens = set()
+        seed_apps = (seed or {}).get("applications", [])
+        # Reserve every fixed id first so generated ones never collide with them
+        self._reserved.update(int(app["id"]) for app in seed_apps if app.get("id") is not None)
+        for app in seed_apps:
+            self.add_application(app["name"], app.get("tiers", {}), app.get("nodes", []), app.get("id"))
+        if db_app_id is not None and self.app_by_id(db_app_id) is None:
+            self._reserved.add(int(db_app_id))
+            self.add_application(DB_APP_NAME, app_id=db_app_id)
+        for collector in (seed or {}).get("collectors", []):
+            self.collectors.append({"config": {"id": next(self.ids), **collector}})
+
+    def _next_id(self):
+        while True:
+            value = next(self._counter)
+            if value not in self._reserved:
+                return value
+
+    def add_application(self, name, tiers=None, nodes=None, app_id=None):
+        if app_id is None:
+            app_id = next(self.ids)
+        else:
+            app_id = int(app_id)
+            self._reserved.add(app_id)
+        app = {"id": app_id, "name": name, "tiers": {}, "nodes": list(nodes or [])}
+        for tier_name, tier_type in (tiers or {}).items():
+            app["tiers"][tier_name] = {"id": next(self.ids), "name": tier_name, "type": tier_type}
+        self.applications[name] = app
+        return app
+
+    def app_by_name(self, name):
+        with self.lock:
+            app = self.applications.get(name)
+            if app is None and self.auto_create:
+                app = self.add_application(name)
+            return app
+
+    def app_by_id(self, app_id):
+        with self.lock:
+            return next((a for a in self.applications.values() if str(a["id"]) == str(app_id)), None)
+
+    def tier(self, app, tier_name):
+        with self.lock:
+            tier = app["tiers"].get(tier_name)
+            if tier is None and self.auto_create:
+                tier = {"id": next(self.ids), "name": tier_name, "type": self.default_tier_type}
+                app["tiers"][tier_name] = tier
+            return tier
+
+    def table(self, app_id, endpoint):
+        return self.entities.setdefault((str(app_id), endpoint), {})
+
+
+def endpoint_key(path):
+    """Collapses ids and names in a request path so counters group by endpoint."""
+    path = urllib.parse.urlparse(path).path
+    for pattern, replacement in _ENDPOINT_PATTERNS:
+        path = pattern.sub(replacement, path)
+    return path
+
+
+_ENDPOINT_PATTERNS = (
+    (re.compile(r"(/rest/applications/)[^/]+"), r"\1{app}"),
+    (re.compile(r"(/tiers/)[^/]+"), r"\1{tier}"),
+    (re.compile(r"(/alerting/rest/v1/applications/)[^/]+"), r"\1{app}"),
+    (re.compile(r"/(health-rules|actions|policies)/[^/]+"), r"/\1/{id}"),
+)
+
+
+class MockControllerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockAppDynamics/1.0"
+
+    # ─── Plumbing ─────────────────────────────────────────────────────────────
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body=None, headers=None):
+        data = b"" if body is None else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+        self.server.count(self.command, self.path, status)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _json_body(self):
+        return json.loads(self.body) if self.body else None
+
+    def _dispatch(self):
+        server = self.server
+        path = urllib.parse.urlparse(self.path).path
+        parts = [urllib.parse.unquote(p) for p in path.strip("/").split("/")]
+        # Always drain the body first so keep-alive connections stay in sync
+        self.body = self._read_body()
+
+        if parts[:1] == ["_stats"]:
+            return self._send(200, server.stats())
+
+        wait = server.throttle.allow()
+        if wait:
+            return self._send(429, {"message": "Too many requests"},
+                              {"Retry-After": f"{max(1, round(wait))}"})
+
+        time.sleep(server.latency.sample())
+
+        if server.error_rate and random.random() < server.error_rate:
+            return self._send(500, {"message": "Injected error"})
+
+        if parts[:1] != ["controller"]:
+            return self._send(404, {"message": "Not found"})
+        parts = parts[1:]
+
+        if parts == ["api", "oauth", "access_token"] and self.command == "POST":
+            return self._token()
+
+        if server.require_auth and not self._authorised():
+            return self._send(401, {"message": "Invalid token"})
+
+        if parts[:1] == ["rest"]:
+            return self._rest(parts[1:])
+        if parts[:4] == ["alerting", "rest", "v1", "applications"] and len(parts) >= 6:
+            return self._alerting(parts[4], parts[5], parts[6] if len(parts) > 6 else None)
+        return self._send(404, {"message": "Not found"})
+
+    def _authorised(self):
+        auth = self.headers.get("Authorization", "")
+        return auth.startswith("Bearer ") and auth[7:] in self.server.state.tokens
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def do_PUT(self):
+        self._dispatch()
+
+    def do_DELETE(self):
+        self._dispatch()
+
+    # ─── Endpoints ────────────────────────────────────────────────────────────
+    def _token(self):
+        token = f"mock-{next(self.server.state.ids)}"
+        self.server.state.tokens.add(token)
+        return self._send(200, {"access_token": token, "expires_in": self.server.token_ttl})
+
+    def _rest(self, parts):
+        state = self.server.state
+        if self.command != "GET":
+            return self._send(405, {"message": "Method not allowed"})
+        if parts == ["databases", "collectors"]:
+            return self._send(200, state.collectors)
+        if parts[:1] != ["applications"] or len(parts) < 2:
+            return self._send(404, {"message": "Not found"})
+
+        if len(parts) == 2:
+            app = state.app_by_name(parts[1])
+            if app is None:
+                return self._send(404, {"message": f"Application {parts[1]} not found"})
+            return self._send(200, [{"id": app["id"], "name": app["name"]}])
+
+        app = state.app_by_id(parts[1])
+        if app is None:
+            return self._send(404, {"message": f"Application {parts[1]} not found"})
+        if parts[2] == "nodes":
+            return self._send(200, app["nodes"])
+        if parts[2] == "tiers" and len(parts) == 3:
+            return self._send(200, list(app["tiers"].values()))
+        if parts[2] == "tiers" and len(parts) >= 4 and parts[3]:
+            tier = state.tier(app, parts[3])
+            if tier is None:
+                return self._send(404, {"message": f"Tier {parts[3]} not found"})
+            return self._send(200, [tier])
+        return self._send(404, {"message": "Not found"})
+
+    def _alerting(self, app_id, endpoint, entity_id):
+        state = self.server.state
+        payload = self._json_body() if self.command in ("POST", "PUT") else None
+        if endpoint not in ALERTING_ENDPOINTS or state.app_by_id(app_id) is None:
+            return self._send(404, {"message": "Not found"})
+        # State changes under the lock; the response is written after releasing it
+        with state.lock:
+            status, body = self._alerting_locked(state.table(app_id, endpoint), endpoint, entity_id, payload)
+        return self._send(status, body)
+
+    def _alerting_locked(self, table, endpoint, entity_id, payload):
+        state = self.server.state
+        if entity_id is None:
+            if self.command == "GET":
+                return 200, [
+                    {"id": e["id"], "name": e["name"], "enabled": e.get("enabled", True)}
+                    for e in table.values()
+                ]
+            if self.command == "POST":
+                payload = payload or {}
+                if any(e["name"] == payload.get("name") for e in table.values()):
+                    return 409, {"message": f"{endpoint} with given name already exists."}
+                new_id = next(state.ids)
+                table[new_id] = {**payload, "id": new_id}
+                return 201, table[new_id]
+            return 405, {"message": "Method not allowed"}
+
+        entity = table.get(int(entity_id)) if str(entity_id).isdigit() else None
+        if entity is None:
+            return 404, {"message": f"{endpoint} {entity_id} not found"}
+        if self.command == "GET":
+            return 200, entity
+        if self.command == "PUT":
+            table[entity["id"]] = {**(payload or {}), "id": entity["id"]}
+            return 200, table[entity["id"]]
+        if self.command == "DELETE":
+            del table[entity["id"]]
+            return 204, None
+        return 405, {"message": "Method not allowed"}
+
+
+class MockController(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency="0", error_rate=0.0,
+                 rate_limit=None, burst=None, seed=None, auto_create=True,
+                 require_auth=True, token_ttl=3600, verbose=False, db_app_id=DB_APP_ID):
+        super().__init__((host, port), MockControllerHandler)
+        self.state = ControllerState(seed, auto_create, db_app_id=db_app_id)
+        self.latency = latency if isinstance(latency, LatencyModel) else LatencyModel(latency)
+        self.error_rate = error_rate
+        self.throttle = Throttle(rate_limit, burst)
+        self.require_auth = require_auth
+        self.token_ttl = token_ttl
+        self.verbose = verbose
+        self._counts = {}
+        self._counts_lock = threading.Lock()
+
+    @property
+    def url(self):
+        """Base URL to pass as APPD_BASE_URL / base_url."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/controller/"
+
+    def count(self, method, path, status):
+        key = f"{method} {endpoint_key(path)} {status}"
+        with self._counts_lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def stats(self):
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def start(self):
+        """Serves on a daemon thread and returns self."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock AppDynamics controller")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", default="0",
+                        help='"0.1", "uniform:0.05:0.25" or "lognormal:<median>:<sigma>"')
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Probability of an injected 500 per request")
+    parser.add_argument("--rate-limit", type=float, default=None,
+                        help="Requests per second before answering 429")
+    parser.add_argument("--burst", type=float, default=None)
+    parser.add_argument("--seed", help='JSON file with applications/tiers/nodes/collectors; '
+                                       'applications may set their "id"')
+    parser.add_argument("--db-app-id", type=int, default=DB_APP_ID,
+                        help="Id of the database monitoring application db_hr.py posts to "
+                             "(0 to leave it out)")
+    parser.add_argument("--no-auto-create", action="store_true",
+                        help="404 on unknown applications and tiers instead of creating them")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    seed = None
+    if args.seed:
+        with open(args.seed) as f:
+            seed = json.load(f)
+
+    server = MockController(
+        args.host, args.port, args.latency, args.error_rate, args.rate_limit,
+        args.burst, seed, not args.no_auto_create, verbose=args.verbose,
+        db_app_id=args.db_app_id or None,
+    )
+    print(f"Mock controller listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import os
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+log = logging.getLogger(__name__)
+
+# Rate buckets: writes per alerting endpoint, everything else shares "reads".
+# None is capped unless a rate is configured (APPD_RATE_LIMITS), e.g.
+# "health-rules=10,actions=10,policies=10,reads=20"; by default the AIMD
+# concurrency limit and Retry-After handling do the throttling.
+RATE_BUCKETS = ("health-rules", "actions", "policies", "reads")
+THROTTLE_STATUSES = (429, 503)
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it. Returns seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on requests in flight: each success grows the limit by
+    1/limit (about +1 per round of requests), each throttle halves it.
+    """
+
+    def __init__(self, max_limit=16, min_limit=1, initial=None, decrease=0.5):
+        self.max_limit = max(1, int(max_limit))
+        self.min_limit = max(1, int(min_limit))
+        self.limit = float(initial or self.max_limit)
+        self.decrease = decrease
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= max(self.min_limit, int(self.limit)):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / max(1.0, self.limit))
+            self._cond.notify_all()
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Client-side throttle for controller calls.
+
+    An AIMD concurrency limit backs off on 429/503, and those responses are
+    retried after the server's Retry-After delay (or exponential backoff with
+    jitter). Static per-bucket caps are opt-in: `rates` maps bucket names
+    (writes per endpoint, or the shared "reads") to requests per second, and
+    buckets without a rate are not capped.
+    """
+
+    def __init__(self, rates=None, max_concurrency=16, max_retries=5,
+                 backoff_factor=0.5, max_backoff=60.0):
+        self.buckets = {name: TokenBucket(rate) for name, rate in (rates or {}).items() if rate}
+        self.concurrency = AdaptiveConcurrency(max_limit=max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "throttled": 0, "retried": 0, "bucket_wait_seconds": 0.0}
+
+    @classmethod
+    def from_env(cls, share=1):
+        """
+        Reads APPD_RATE_LIMITS ("health-rules=10,actions=5,reads=20") and
+        APPD_MAX_CONCURRENCY. Without APPD_RATE_LIMITS nothing is capped.
+
+        Both are budgets for one controller: with `share` clients running
+        against the same controller at once, each gets 1/share of them.
+        """
+        share = max(1, int(share))
+        rates = {}
+        for item in os.getenv("APPD_RATE_LIMITS", "").split(","):
+            if "=" in item:
+                name, rate = item.split("=", 1)
+                rates[name.strip()] = float(rate) / share
+        max_concurrency = int(os.getenv("APPD_MAX_CONCURRENCY", "").strip() or 16)
+        return cls(rates=rates, max_concurrency=max(1, max_concurrency // share))
+
+    def bucket_for(self, method, url):
+        if method.upper() != "GET":
+            path = url.split("?", 1)[0]
+            for name in RATE_BUCKETS:
+                if name != "reads" and f"/{name}" in path:
+                    return name
+        return "reads"
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def stats(self):
+        """Snapshot of the request/throttle/retry counters and the current concurrency limit."""
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot["concurrency_limit"] = round(self.concurrency.limit, 2)
+        return snapshot
+
+    def _backoff(self, attempt):
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    def send(self, send, method, url):
+        """
+        Calls send() -> Response under the bucket and concurrency limits, retrying
+        throttled (429/503) responses. The last response is returned either way.
+        """
+        bucket = self.buckets.get(self.bucket_for(method, url))
+        attempt = 0
+        while True:
+            if bucket is not None:
+                self._count("bucket_wait_seconds", bucket.acquire())
+            self.concurrency.acquire()
+            throttled = False
+            try:
+                response = send()
+                throttled = response.status_code in THROTTLE_STATUSES
+            finally:
+                self.concurrency.release(throttled)
+            self._count("requests")
+
+            if not throttled:
+                return response
+            self._count("throttled")
+            if attempt >= self.max_retries:
+                log.warning(f"Giving up on {method} {url} after {attempt} throttled retries")
+                return response
+
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = self._backoff(attempt)
+            delay = min(delay, self.max_backoff)
+            log.info(
+                f"Throttled ({response.status_code}) on {method} {url}; "
+                f"retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})"
+            )
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+            self._count("retried")
@@ -0,0 +1,213 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from render import render_template_json
+
+log = logging.getLogger(__name__)
+
+# Creation order; deletes run in reverse so policies go before what they reference
+ENTITY_ORDER = ("actions", "health-rules", "policies")
+ENTITY_NAMES = {"actions": "action", "health-rules": "health rule", "policies": "policy"}
+
+# Controller-assigned fields that never appear in templates
+IGNORED_KEYS = frozenset(["id", "version", "createdBy", "createdOn", "modifiedBy", "modifiedOn"])
+
+
+# ─── Normalisation & diff ──────────────────────────────────────────────────────
+
+def normalize(value):
+    """
+    Canonical form for comparing template output with controller state:
+    "true"/"false" strings become bools, numbers become floats, None values and
+    controller-assigned keys are dropped, and lists of scalars are sorted.
+    """
+    if isinstance(value, dict):
+        return {
+            k: normalize(v)
+            for k, v in value.items()
+            if k not in IGNORED_KEYS and v is not None
+        }
+    if isinstance(value, list):
+        items = [normalize(v) for v in value]
+        if all(isinstance(v, (str, int, float, bool)) for v in items):
+            return sorted(items, key=lambda v: (type(v).__name__, v))
+        return items
+    if isinstance(value, str) and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def diff(desired, current, path=""):
+    """
+    Lists the paths where `current` differs from `desired`, both normalised.
+    Only keys present in `desired` are compared, so defaults the controller
+    fills in on its side do not show up as drift.
+    """
+    if isinstance(desired, dict) and isinstance(current, dict):
+        changes = []
+        for key, want in desired.items():
+            sub = f"{path}.{key}" if path else key
+            if key not in current:
+                changes.append(f"{sub}: missing -> {want!r}")
+            else:
+                changes.extend(diff(want, current[key], sub))
+        return changes
+    if isinstance(desired, list) and isinstance(current, list):
+        if len(desired) != len(current):
+            return [f"{path}: {len(current)} items -> {len(desired)} items"]
+        changes = []
+        for idx, (want, have) in enumerate(zip(desired, current)):
+            changes.extend(diff(want, have, f"{path}[{idx}]"))
+        return changes
+    if desired != current:
+        return [f"{path}: {current!r} -> {desired!r}"]
+    return []
+
+
+# ─── Desired & current state ───────────────────────────────────────────────────
+
+def desired_state(config, healthrule_templates, params):
+    """
+    Renders the actions, health rules and policies the tier should have.
+    Returns {endpoint: {name: payload}}.
+    """
+    state = {endpoint: {} for endpoint in ENTITY_ORDER}
+    for tmpl in config.get("base_actions", []):
+        payload = render_template_json(tmpl, params)
+        state["actions"][payload["name"]] = payload
+    for tmpl in healthrule_templates:
+        payload = render_template_json(tmpl, params)
+        state["health-rules"][payload["name"]] = payload
+
+    policy_params = {**params, "healthrule_names": list(state["health-rules"])}
+    for tmpl in config.get("policies", []):
+        payload = render_template_json(tmpl, policy_params)
+        state["policies"][payload["name"]] = payload
+    return state
+
+
+def current_state(appd, appd_id, desired, prune_prefix=None, max_workers=8):
+    """
+    Fetches the controller's version of every desired entity, plus entities
+    whose name starts with `prune_prefix` when pruning is enabled.
+    Returns {endpoint: {name: {"id": id, "detail": dict}}}.
+    """
+    def relevant(endpoint):
+        # Streamed, so only the (endpoint, name, id) of entities we care about is kept
+        return [
+            (endpoint, item.name, item.id)
+            for item in appd.iter_entities(appd_id, endpoint)
+            if item.name in desired[endpoint]
+            or (prune_prefix and item.name.startswith(prune_prefix))
+        ]
+
+    with ThreadPoolExecutor(max_workers=len(ENTITY_ORDER)) as executor:
+        wanted = [entry for entries in executor.map(relevant, ENTITY_ORDER) for entry in entries]
+
+    def fetch(entry):
+        endpoint, name, entity_id = entry
+        return endpoint, name, entity_id, appd._get_entity(endpoint, appd_id, entity_id)
+
+    state = {endpoint: {} for endpoint in ENTITY_ORDER}
+    if wanted:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(wanted)))) as executor:
+            for endpoint, name, entity_id, detail in executor.map(fetch, wanted):
+                state[endpoint][name] = {"id": entity_id, "detail": detail}
+    return state
+
+
+# ─── Plan & apply ──────────────────────────────────────────────────────────────
+
+def plan(desired, current, prune=False):
+    """
+    Computes the steps that bring the controller in line with `desired`.
+    Each step is {"op", "endpoint", "name", "id", "payload", "changes"} with op
+    one of create, update or delete. Unchanged entities produce no step.
+    """
+    steps = []
+    for endpoint in ENTITY_ORDER:
+        for name, payload in desired[endpoint].items():
+            existing = current[endpoint].get(name)
+            if existing is None:
+                steps.append({"op": "create", "endpoint": endpoint, "name": name,
+                              "id": None, "payload": payload, "changes": []})
+                continue
+            changes = diff(normalize(payload), normalize(existing["detail"]))
+            if changes:
+                steps.append({"op": "update", "endpoint": endpoint, "name": name,
+                              "id": existing["id"], "payload": payload, "changes": changes})
+
+    if prune:
+        for endpoint in reversed(ENTITY_ORDER):
+            for name, existing in current[endpoint].items():
+                if name not in desired[endpoint]:
+                    steps.append({"op": "delete", "endpoint": endpoint, "name": name,
+                                  "id": existing["id"], "payload": None, "changes": []})
+    return steps
+
+
+def format_plan(steps):
+    """Human-readable plan, one line per step plus indented change paths."""
+    if not steps:
+        return "No changes. Controller matches the rendered templates."
+    symbols = {"create": "+", "update": "~", "delete": "-"}
+    lines = []
+    for step in steps:
+        lines.append(f"{symbols[step['op']]} {ENTITY_NAMES[step['endpoint']]} '{step['name']}'")
+        lines.extend(f"    {change}" for change in step["changes"])
+    counts = {op: sum(1 for s in steps if s["op"] == op) for op in symbols}
+    lines.append(
+        f"Plan: {counts['create']} to create, {counts['update']} to update, "
+        f"{counts['delete']} to delete."
+    )
+    return "\n".join(lines)
+
+
+def _apply_step(appd, appd_id, step):
+    endpoint, entity_name = step["endpoint"], ENTITY_NAMES[step["endpoint"]]
+    if step["op"] == "create":
+        # The plan was computed from live state, so the run journal must not veto it
+        result = appd._post(endpoint, appd_id, step["payload"], entity_name, use_journal=False)
+    elif step["op"] == "update":
+        result = appd._put(endpoint, appd_id, step["id"], step["payload"], entity_name)
+    else:
+        result = appd._delete(endpoint, appd_id, step["id"], entity_name, step["name"])
+    return {"op": step["op"], "endpoint": endpoint, "name": step["name"], **result}
+
+
+def apply(appd, appd_id, steps, max_workers=8):
+    """
+    Executes a plan. Writes for one entity type run in parallel; types run in
+    dependency order (actions, health rules, policies for create/update, the
+    reverse for deletes). Returns one result per step, in plan order.
+    """
+    phases = [("create", "update", e) for e in ENTITY_ORDER]
+    phases += [("delete", e) for e in reversed(ENTITY_ORDER)]
+
+    results = {}
+    for phase in phases:
+        ops, endpoint = phase[:-1], phase[-1]
+        batch = [(i, s) for i, s in enumerate(steps) if s["endpoint"] == endpoint and s["op"] in ops]
+        if not batch:
+            continue
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batch)))) as executor:
+            for (i, _), result in zip(batch, executor.map(lambda b: _apply_step(appd, appd_id, b[1]), batch)):
+                results[i] = result
+    return [results[i] for i in range(len(steps))]
+
+
+def reconcile(appd, appd_id, config, healthrule_templates, params,
+              apply_changes=False, prune_prefix=None, max_workers=8):
+    """
+    Renders desired state, fetches current state and returns (steps, results).
+    With apply_changes=False only the plan is computed and results is None.
+    """
+    desired = desired_state(config, healthrule_templates, params)
+    current = current_state(appd, appd_id, desired, prune_prefix, max_workers)
+    steps = plan(desired, current, prune=bool(prune_prefix))
+    log.info("Reconcile plan for %s:\n%s", appd_id, format_plan(steps))
+    if not apply_changes:
+        return steps, None
+    return steps, apply(appd, appd_id, steps, max_workers)
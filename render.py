@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import stat
+import logging
+import threading
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+# TEMPLATES_PATH overrides this; read on first render. JINJA_CACHE_DIR moves the
+# bytecode cache out of Jinja's default per-user directory.
+DEFAULT_TEMPLATES_PATH = Path(__file__).parent.parent / "templates"
+
+_template_env = None
+_template_env_lock = threading.Lock()
+
+
+def _private_dir(path):
+    """
+    Creates `path` with mode 0700, or accepts an existing one only if it is
+    ours and nobody else can write to it: cached bytecode is executed as is.
+    """
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    info = path.lstat()
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise OSError(f"{path} is not a directory owned by this user")
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise OSError(f"{path} is writable by other users")
+    return path
+
+
+def _bytecode_cache(cache_dir=None):
+    """
+    Compiled templates are stored on disk so new processes skip the Jinja
+    compile step. Without `cache_dir` Jinja picks its own per-user 0700
+    directory under the temp dir.
+    """
+    from jinja2 import FileSystemBytecodeCache
+
+    try:
+        if cache_dir is None:
+            return FileSystemBytecodeCache()
+        return FileSystemBytecodeCache(str(_private_dir(cache_dir)))
+    except (OSError, RuntimeError) as err:
+        # Jinja raises RuntimeError when its default directory is unsafe
+        log.warning("Jinja bytecode cache disabled (%s): %s", cache_dir or "default", err)
+        return None
+
+
+# ─── Load Jinja2 templates ─────────────────────────────────────────────────────
+
+def get_template_env():
+    """
+    The shared Jinja2 environment, built on first use. Jinja2 itself is only
+    imported here, so importing this module stays cheap for callers that
+    never render. The environment keeps every compiled template for the life
+    of the process: templates do not change during a run, so auto_reload's
+    mtime check on each lookup is turned off.
+    """
+    global _template_env
+    if _template_env is None:
+        with _template_env_lock:
+            if _template_env is None:
+                from jinja2 import Environment, FileSystemLoader, StrictUndefined
+
+                templates_path = Path(os.getenv("TEMPLATES_PATH", "").strip() or DEFAULT_TEMPLATES_PATH)
+                cache_dir = os.getenv("JINJA_CACHE_DIR", "").strip()
+                _template_env = Environment(
+                    loader=FileSystemLoader(searchpath=templates_path),
+                    undefined=StrictUndefined,
+                    keep_trailing_newline=True,
+                    lstrip_blocks=True,
+                    trim_blocks=True,
+                    bytecode_cache=_bytecode_cache(Path(cache_dir) if cache_dir else None),
+                    auto_reload=False,
+                    cache_size=-1,
+                )
+    return _template_env
+
+
+def render_template_json(template_name, params):
+    """
+    Renders a Jinja2 JSON template to a Python dict.
+
+    Only the compiled template is cached; every call renders and returns a
+    new dict, which the caller is free to mutate.
+    """
+    from jinja2 import TemplateNotFound
+
+    try:
+        raw = get_template_env().get_template(template_name).render(params)
+    except TemplateNotFound as e:
+        log.error("Template not found: %s", e)
+        sys.exit(1)
+    return json.loads(raw)
+
+
+def clear_render_cache():
+    """Drops the environment and its compiled templates; the next render rebuilds them."""
+    global _template_env
+    with _template_env_lock:
+        _template_env = None
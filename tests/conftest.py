@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench  # noqa: E402
+import render  # noqa: E402
+from apis import AppDynamics  # noqa: E402
+from lookup_cache import LookupCache  # noqa: E402
+from journal import Journal  # noqa: E402
+from mock_controller import MockController  # noqa: E402
+from ratelimit import RateLimiter  # noqa: E402
+from token_cache import TOKEN_CACHE  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_token():
+    """Every test starts without a cached token from an earlier mock controller."""
+    TOKEN_CACHE.invalidate("test", "client")
+    yield
+    TOKEN_CACHE.invalidate("test", "client")
+
+
+@pytest.fixture
+def controller():
+    server = MockController().start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_client(controller):
+    """Builds clients against the mock controller with private caches."""
+    def make(max_workers=4, **kwargs):
+        kwargs.setdefault("rate_limiter", RateLimiter(max_concurrency=max(16, max_workers)))
+        kwargs.setdefault("lookup_cache", LookupCache())
+        kwargs.setdefault("journal", Journal())
+        kwargs.setdefault("base_url", controller.url)
+        return AppDynamics("TEST", "client", "test", "secret", max_workers=max_workers, **kwargs)
+    return make
+
+
+@pytest.fixture
+def onboarding_config(tmp_path, monkeypatch):
+    """bench's synthetic templates on disk; returns the matching config."""
+    config = bench.write_fixtures(tmp_path)
+    monkeypatch.setenv("TEMPLATES_PATH", str(tmp_path / "templates"))
+    monkeypatch.setenv("JINJA_CACHE_DIR", str(tmp_path / "jinja-cache"))
+    monkeypatch.setattr(render, "_template_env", None)
+    return config
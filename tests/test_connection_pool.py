@@ -0,0 +1,32 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_controller import LatencyModel
+from ratelimit import RateLimiter
+
+
+def _pool_maxsize(client):
+    return client.session.get_adapter(client.base_url)._pool_maxsize
+
+
+def test_pool_covers_every_thread_the_limiter_lets_through(make_client):
+    assert _pool_maxsize(make_client(max_workers=4)) == 10
+    assert _pool_maxsize(make_client(max_workers=4, pool_size=32,
+                                     rate_limiter=RateLimiter(max_concurrency=64))) == 32
+    # The limiter never has more than 16 requests in flight, so 16 connections do
+    assert _pool_maxsize(make_client(max_workers=4, pool_size=32,
+                                     rate_limiter=RateLimiter(max_concurrency=16))) == 16
+
+
+def test_batch_concurrency_does_not_overflow_the_pool(make_client, controller, caplog):
+    app_ids = [controller.state.add_application(f"app-{i}", tiers={"web": "Application Server"})["id"]
+               for i in range(64)]
+    # Slow enough that every thread has a request in flight at once
+    controller.latency = LatencyModel("0.05")
+    client = make_client(max_workers=4, pool_size=32, rate_limiter=RateLimiter(max_concurrency=32))
+
+    with caplog.at_level(logging.WARNING, logger="urllib3.connectionpool"):
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            list(executor.map(client.get_appd_tiers, app_ids))
+
+    assert not [r for r in caplog.records if "Connection pool is full" in r.getMessage()]
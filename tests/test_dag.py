@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from dag import Graph
+
+
+def test_nodes_run_after_their_dependencies_and_receive_their_values():
+    graph = Graph()
+    graph.add("a", lambda _: 1)
+    graph.add("b", lambda _: 2)
+    graph.add("sum", lambda inputs: inputs["a"] + inputs["b"], ["a", "b"])
+
+    results = graph.run(max_workers=4)
+
+    assert results["sum"].status == "ok"
+    assert results["sum"].value == 3
+
+
+def test_independent_nodes_overlap():
+    barrier = threading.Barrier(3, timeout=5)
+    graph = Graph()
+    for key in "abc":
+        graph.add(key, lambda _: barrier.wait())
+
+    results = graph.run(max_workers=3)
+
+    assert {r.status for r in results.values()} == {"ok"}
+
+
+def test_failure_skips_everything_downstream_only():
+    graph = Graph()
+    graph.add("ok", lambda _: "fine")
+    graph.add("boom", lambda _: 1 / 0)
+    graph.add("child", lambda _: "never", ["boom"])
+    graph.add("grandchild", lambda _: "never", ["child", "ok"])
+    graph.add("sibling", lambda inputs: inputs["ok"], ["ok"])
+
+    results = graph.run()
+
+    assert results["boom"].status == "error"
+    assert "division by zero" in results["boom"].error
+    assert results["child"].status == "skipped"
+    assert results["grandchild"].status == "skipped"
+    assert "'boom'" in results["child"].error
+    assert results["sibling"].value == "fine"
+
+
+def test_unknown_dependency_is_rejected():
+    graph = Graph()
+    with pytest.raises(ValueError):
+        graph.add("child", lambda _: None, ["missing"])
+
+
+def test_critical_path_follows_the_longest_chain():
+    graph = Graph()
+    graph.add("a", lambda _: None)
+    graph.add("b", lambda _: None, ["a"])
+    graph.add("c", lambda _: None)
+    results = graph.run()
+    results = {**results,
+               "a": results["a"]._replace(seconds=1.0),
+               "b": results["b"]._replace(seconds=2.0),
+               "c": results["c"]._replace(seconds=2.5)}
+
+    assert graph.critical_path(results) == (3.0, ["a", "b"])
+
+
+def test_graph_of_controller_calls(make_client, controller):
+    client = make_client(max_workers=4)
+    app_id = client.get_appID("dag")
+    graph = Graph()
+    prefetch = graph.add("prefetch", lambda _: client.prefetch_entities(app_id))
+    rules = [
+        graph.add(("hr", i), lambda _, i=i: client.post_appd_hr(app_id, {"name": f"hr-{i}"}), [prefetch])
+        for i in range(6)
+    ]
+    graph.add("policy", lambda inputs: client.post_appd_policy(app_id, {
+        "name": "policy",
+        "healthRules": [inputs[k]["data"]["name"] for k in rules],
+    }), rules)
+
+    results = graph.run(max_workers=8)
+
+    assert all(r.status == "ok" for r in results.values())
+    policies = list(controller.state.table(app_id, "policies").values())
+    assert [p["healthRules"] for p in policies] == [[f"hr-{i}" for i in range(6)]]
+
+
+def test_controller_failure_skips_dependent_steps(make_client, controller):
+    client = make_client()
+    graph = Graph()
+    # Unknown application: the lookup raises, so nothing downstream is posted
+    graph.add("app", lambda _: client.get_appd_tiers(999999))
+    graph.add("policy", lambda inputs: client.post_appd_policy(999999, {"name": "p"}), ["app"])
+
+    results = graph.run()
+
+    assert results["app"].status == "error"
+    assert results["policy"].status == "skipped"
+    assert not any("POST" in key and "policies" in key for key in controller.stats())
@@ -0,0 +1,49 @@
+from db_hr import DEFAULT_DB_RULES, AppDPolicyActionBuilder, group_databases
+
+
+def _builder(controller, databases):
+    builder = AppDPolicyActionBuilder(
+        "B", "MYSQL", "App", "TEST", ",".join(databases), ["a@b.c"], "test", "secret", "client",
+        max_workers=4, group_size=2, base_url=controller.url,
+    )
+    builder.generate_access_token()
+    return builder
+
+
+def _onboard(builder):
+    name = "B | TEST | MYSQL"
+    payload = builder.create_payload(name)
+    rules = []
+    for rule_key in DEFAULT_DB_RULES:
+        builder.process_health_rule(name, payload, rules, rule_key)
+    return builder.create_health_rules(rules)
+
+
+def _rule_names(controller):
+    return {e["name"] for e in controller.state.table("15", "health-rules").values()}
+
+
+def test_group_membership_is_stable_below_a_power_of_two():
+    dbs = [{"serverName": f"db{i}"} for i in range(5)]
+    before = dict((db["serverName"], i) for i, group in group_databases(dbs, 2) for db in group)
+    after = dict((db["serverName"], i) for i, group in group_databases(dbs + [{"serverName": "db5"}], 2)
+                 for db in group)
+    assert all(after[name] == index for name, index in before.items())
+
+
+def test_stale_group_rules_are_pruned_when_the_bucket_count_changes(controller):
+    first = _onboard(_builder(controller, [f"db{i}" for i in range(9)]))
+    assert _rule_names(controller) == set(first)
+
+    # 9 -> 3 databases: 8 buckets become 2, so groups 002-007 would keep alerting
+    builder = _builder(controller, ["db0", "db1", "db2"])
+    second = _onboard(builder)
+
+    assert builder.pruned_rules
+    assert set(builder.pruned_rules) == set(first) - set(second)
+    assert _rule_names(controller) == set(second)
+    covered = [db["serverName"]
+               for rule in controller.state.table("15", "health-rules").values()
+               if rule["name"].endswith("DBAvailablity")
+               for db in rule["affects"]["affectedDatabases"]["databases"]]
+    assert sorted(covered) == ["db0", "db1", "db2"]
@@ -0,0 +1,40 @@
+import requests
+
+import db_inventory
+
+
+def _refresh(controller, path, **kwargs):
+    controller.state.tokens.add("inventory")
+    headers = {"Authorization": "Bearer inventory"}
+    return db_inventory.refresh_inventory(requests.Session(), controller.url, headers, str(path), **kwargs)
+
+
+def _collectors_requests(controller):
+    return sum(n for key, n in controller.stats().items() if "databases/collectors" in key)
+
+
+def test_inventory_is_cached_until_the_ttl_then_fetched_in_full(controller, tmp_path):
+    path = tmp_path / "inventory.json"
+    controller.state.collectors[:] = [
+        {"config": {"id": 1, "name": "orders", "type": "oracle"}},
+        {"config": {"id": 2, "name": "billing", "type": "mysql"}},
+    ]
+
+    first = _refresh(controller, path)
+    assert sorted(r["name"] for r in first["collectors"].values()) == ["billing", "orders"]
+    assert _refresh(controller, path) == first
+    assert _collectors_requests(controller) == 1
+
+    controller.state.collectors[:] = [
+        {"config": {"id": 1, "name": "orders", "type": "oracle", "enabled": False}},
+        {"config": {"id": 3, "name": "ledger", "type": "oracle"}},
+    ]
+    refreshed = _refresh(controller, path, ttl=0)
+
+    # The refresh is the controller's current listing, nothing kept from the cache
+    assert _collectors_requests(controller) == 2
+    assert {k: r["name"] for k, r in refreshed["collectors"].items()} == {"1": "orders", "3": "ledger"}
+    assert not refreshed["collectors"]["1"]["enabled"]
+    assert db_inventory.databases_for_type(refreshed, "oracle") == [
+        {"serverName": "ledger", "collectorConfigName": "ledger"}
+    ]
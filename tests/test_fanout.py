@@ -0,0 +1,97 @@
+import io
+import json
+import os
+
+import pytest
+
+# fanout drives main.py, which logs through the deployment's external `logger` module
+pytest.importorskip("logger")
+
+import fanout  # noqa: E402
+import main as onboarding  # noqa: E402
+from mock_controller import MockController  # noqa: E402
+from ratelimit import RateLimiter  # noqa: E402
+
+SECRETS = {"ACCT_A_CLIENT_ID": "a", "ACCT_A_SECRET": "s", "ACCT_B_CLIENT_ID": "b", "ACCT_B_SECRET": "s"}
+
+
+@pytest.fixture
+def controllers(monkeypatch):
+    # Workers are forked; keep their token and lookup caches off disk
+    monkeypatch.setenv("APPD_TOKEN_CACHE", "")
+    monkeypatch.setenv("APPD_LOOKUP_CACHE", "")
+    monkeypatch.delenv("APPD_JOURNAL", raising=False)
+    servers = [MockController().start(), MockController().start()]
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _entry(account, server, tier):
+    return {"APPD_CON": account, "APPD_BASE_URL": server.url, "ApplicationName": f"App-{account}",
+            "APPD_TIER": tier, "BusinessName": "b", "USER_EMAIL": "a@example.com"}
+
+
+def _settings():
+    return onboarding.load_settings({"APPD_ENV": "TEST", "APPD_CON": "acct-a"})
+
+
+def test_partitions_on_one_controller_split_its_budget(tmp_path, monkeypatch):
+    entries = [(1, {"APPD_CON": "acct-a", "APPD_BASE_URL": "http://c1/controller/"}),
+               (2, {"APPD_CON": "acct-b", "APPD_BASE_URL": "http://c1/controller/"}),
+               (3, {"APPD_CON": "acct-a", "APPD_BASE_URL": "http://c2/controller/"}),
+               (4, {"APPD_CON": "acct-a", "APPD_BASE_URL": "http://c1/controller/"})]
+
+    partitions = fanout.spool_partitions(iter(entries), _settings(), str(tmp_path))
+
+    assert [p["entries"] for p in partitions.values()] == [2, 1, 1]
+    assert [n for n, _ in fanout._read_spool(partitions["acct-a", "http://c1/controller/"]["spool"])] == [1, 4]
+    shares = fanout.controller_shares(partitions, processes=4)
+    assert shares == {("acct-a", "http://c1/controller/"): 2, ("acct-b", "http://c1/controller/"): 2,
+                      ("acct-a", "http://c2/controller/"): 1}
+    assert set(fanout.controller_shares(partitions, processes=1).values()) == {1}
+
+    monkeypatch.setenv("APPD_RATE_LIMITS", "health-rules=10,reads=20")
+    monkeypatch.setenv("APPD_MAX_CONCURRENCY", "16")
+    limiter = RateLimiter.from_env(share=2)
+    assert {name: bucket.rate for name, bucket in limiter.buckets.items()} == {"health-rules": 5, "reads": 10}
+    assert limiter.concurrency.max_limit == 8
+
+
+def test_unrun_entries_are_appended_after_the_written_prefix(tmp_path):
+    spool, results = tmp_path / "p.spool.jsonl", tmp_path / "p.results.jsonl"
+    spool.write_text("".join(json.dumps({"line": n, "entry": {}}) + "\n" for n in (2, 5, 9)))
+    results.write_text(json.dumps({"line": 2, "status": "ok"}) + "\n")
+
+    fanout._finish_unrun(str(spool), str(results), "boom")
+
+    lines = [json.loads(line) for line in results.read_text().splitlines()]
+    assert [(line["line"], line["status"]) for line in lines] == [(2, "ok"), (5, "error"), (9, "error")]
+
+
+def test_fanout_streams_partitions_and_merges_in_manifest_order(controllers, onboarding_config, tmp_path):
+    first, second = controllers
+    for account, server in (("acct-a", first), ("acct-b", second)):
+        server.state.add_application(f"App-{account}", tiers={"t0": "Application Server",
+                                                               "t1": "Application Server"})
+    entries = [(1, _entry("acct-a", first, "t0")), (2, _entry("acct-b", second, "t0")),
+               (3, _entry("acct-a", first, "t1")), (4, _entry("nocreds", first, "t0")),
+               (5, _entry("acct-b", second, "t1"))]
+    work_dir = tmp_path / "results.jsonl.parts"
+    out = io.StringIO()
+
+    report = fanout.run_fanout(iter(entries), SECRETS, onboarding_config, _settings(), out,
+                               processes=3, work_dir=str(work_dir))
+
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [line["line"] for line in lines] == [1, 2, 3, 4, 5]
+    assert [line["status"] for line in lines] == ["ok", "ok", "ok", "error", "ok"]
+    assert [line["account"] for line in lines] == ["acct-a", "acct-b", "acct-a", "nocreds", "acct-b"]
+    assert "No credentials" in lines[3]["error"]
+    assert report["counts"] == {"ok": 4, "error": 1}
+    assert {r["account"]: r["counts"] for r in report["partitions"]} == {
+        "acct-a": {"ok": 2}, "acct-b": {"ok": 2}, "nocreds": {"error": 1}}
+    # Each partition ran in a worker process, not in the parent
+    assert all(r["pid"] != os.getpid() for r in report["partitions"])
+    assert not work_dir.exists()
@@ -0,0 +1,39 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from file_store import file_lock, read_json, write_json
+from lookup_cache import LookupCache
+from token_cache import TokenCache
+
+
+def _increment(path, times):
+    for _ in range(times):
+        with file_lock(path):
+            data = read_json(path)
+            data["count"] = data.get("count", 0) + 1
+            write_json(path, data)
+
+
+def test_locked_updates_from_several_processes_are_not_lost(tmp_path):
+    path = str(tmp_path / "store.json")
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(_increment, [path] * 4, [50] * 4))
+
+    assert read_json(path) == {"count": 200}
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+def test_missing_or_corrupt_files_read_as_empty(tmp_path):
+    assert read_json(str(tmp_path / "missing.json")) == {}
+    (tmp_path / "bad.json").write_text("{not json")
+    assert read_json(str(tmp_path / "bad.json")) == {}
+
+
+def test_both_caches_share_their_file_between_instances(tmp_path):
+    tokens = str(tmp_path / "tokens.json")
+    TokenCache(tokens).put("acct", "client", "abc", expires_in=3600)
+    assert TokenCache(tokens).get("acct", "client")["access_token"] == "abc"
+
+    lookups = str(tmp_path / "lookups.json")
+    LookupCache(lookups).put("http://c/", "app_id", "app", value=7)
+    assert LookupCache(lookups).get("http://c/", "app_id", "app") == 7
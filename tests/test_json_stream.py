@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from apis import iter_json_array
+
+DOCUMENT = json.dumps([
+    1.5, -0.25, 12345, 6.02e23, 1e-7, True, False, None, "héllo, wörld ]",
+    {"id": 7, "name": "cpu", "nested": [1, 2.5, {"x": "y"}]}, [], {}, 0, "",
+], ensure_ascii=False)
+
+
+def _chunks(text, size, as_bytes=True):
+    data = text.encode("utf-8") if as_bytes else text
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 5, 7, 16, 10_000])
+def test_elements_survive_any_chunk_size(size):
+    assert list(iter_json_array(_chunks(DOCUMENT, size))) == json.loads(DOCUMENT)
+
+
+@pytest.mark.parametrize("size", [1, 3])
+@pytest.mark.parametrize("text", ["[1.5]", "[1.5, 2]", "[ 10 , 1e5 ]", "[-1]", "[true,null]"])
+def test_numbers_split_across_chunks_wait_for_the_delimiter(text, size):
+    assert list(iter_json_array(_chunks(text, size, as_bytes=False))) == json.loads(text)
+
+
+def test_empty_body_and_empty_array():
+    assert list(iter_json_array([])) == []
+    assert list(iter_json_array([b"[", b" ]"])) == []
+
+
+@pytest.mark.parametrize("text", ["[1.5", "[1, 2", "[1 2]", "{}"])
+def test_malformed_arrays_raise(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(_chunks(text, 1)))
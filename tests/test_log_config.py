@@ -0,0 +1,89 @@
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from log_config import LazyJson, configure_logging, flush_logging, stop_logging
+
+log = logging.getLogger("tests.log_config")
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "run.log"
+    configure_logging(level="DEBUG", fmt="json", path=str(path))
+    yield path
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(logging.WARNING)
+
+
+def _records(path):
+    flush_logging()
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_arguments_are_rendered_as_they_were_at_the_call(log_file):
+    params = {"tier": "web"}
+    log.info("params %s", params)
+    params["tier"] = "db"
+
+    assert _records(log_file)[-1]["message"] == "params {'tier': 'web'}"
+
+
+def test_lazy_json_defers_but_snapshots_the_other_arguments(log_file):
+    rendered = []
+
+    class Spy(LazyJson):
+        __slots__ = ()
+
+        def __str__(self):
+            rendered.append(True)
+            return super().__str__()
+
+    names = ["a"]
+    logging.getLogger("tests.quiet").setLevel(logging.INFO)
+    logging.getLogger("tests.quiet").debug("%s", Spy({"big": 1}))
+    assert rendered == []
+
+    log.debug("%s %s", names, Spy({"big": 1}))
+    names.append("b")
+    assert _records(log_file)[-1]["message"] == "['a'] {\"big\": 1}"
+    assert rendered
+
+
+def test_lazy_json_value_may_be_mutated_after_the_call(log_file):
+    payload = {"name": "cpu", "tiers": ["web"]}
+    log.debug("POST body preview:\n%s", LazyJson(payload))
+    payload["name"] = "changed"
+    payload["tiers"].append("db")
+
+    assert _records(log_file)[-1]["message"] == 'POST body preview:\n{"name": "cpu", "tiers": ["web"]}'
+
+
+def test_exception_text_is_kept(log_file):
+    try:
+        raise ZeroDivisionError("boom")
+    except ZeroDivisionError:
+        log.exception("failed")
+    record = _records(log_file)[-1]
+    assert record["message"] == "failed"
+    assert "ZeroDivisionError: boom" in record["exc"]
+
+
+def _log_lines(worker, count):
+    for index in range(count):
+        log.warning("worker %s line %s", worker, index)
+    # Mirrors fanout.run_partition: drain before handing the result back
+    flush_logging()
+    return worker
+
+
+def test_forked_workers_write_every_record(log_file):
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert sorted(executor.map(_log_lines, [1, 2], [3000, 3000])) == [1, 2]
+
+    assert len(_records(log_file)) == 6000
@@ -0,0 +1,60 @@
+import pytest
+
+from lookup_cache import LookupCache
+
+
+def _recreate(controller, name):
+    """Deletes the application on the controller and creates it again under a new id."""
+    with controller.state.lock:
+        del controller.state.applications[name]
+    return controller.state.add_application(name, tiers={"web": "Application Server"})["id"]
+
+
+@pytest.fixture
+def stale(make_client, controller):
+    """A client whose cached id for 'app' no longer exists on the controller."""
+    controller.state.add_application("app", tiers={"web": "Application Server"})
+    cache = LookupCache()
+    client = make_client(lookup_cache=cache)
+    old_id = client.get_appID("app")
+    client.get_appd_tiers(old_id)
+    client.prefetch_entities(old_id)
+    new_id = _recreate(controller, "app")
+    return client, cache, old_id, new_id
+
+
+def _forgotten(client, cache, old_id):
+    return (cache.get(client.base_url, "app_id", "app") is None
+            and cache.get(client.base_url, "tiers", old_id) is None
+            and not any(key[0] == old_id for key in client._entity_index))
+
+
+def test_post_404_drops_the_cached_application(stale):
+    client, cache, old_id, new_id = stale
+
+    result = client.post_appd_action(old_id, {"name": "mail", "actionType": "EMAIL"})
+
+    assert not result["success"] and result["status"] == 404
+    assert _forgotten(client, cache, old_id)
+    assert client.get_appID("app") == new_id
+
+
+def test_put_404_drops_the_cached_application(stale):
+    client, cache, old_id, new_id = stale
+
+    result = client._put("health-rules", old_id, 1, {"name": "cpu"}, "health rule")
+
+    assert not result["success"] and result["status"] == 404
+    assert _forgotten(client, cache, old_id)
+    assert client.get_appID("app") == new_id
+
+
+def test_tier_404_drops_the_cached_application(stale):
+    client, cache, old_id, new_id = stale
+
+    with pytest.raises(Exception):
+        client.get_appd_tier(old_id, "web")
+
+    assert _forgotten(client, cache, old_id)
+    assert client.get_appID("app") == new_id
+
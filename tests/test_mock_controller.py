@@ -0,0 +1,26 @@
+from mock_controller import DB_APP_ID, ControllerState
+
+
+def test_db_hr_application_is_registered_by_default():
+    state = ControllerState()
+    assert state.app_by_id(DB_APP_ID) is not None
+    assert state.app_by_id(DB_APP_ID)["name"] == "Database Monitoring"
+    assert ControllerState(db_app_id=None).app_by_id(DB_APP_ID) is None
+
+
+def test_seed_applications_keep_their_ids_and_generated_ids_skip_them():
+    seed = {"applications": [{"name": "orders", "id": 3, "tiers": {"web": "Application Server"}},
+                             {"name": "billing"}]}
+    state = ControllerState(seed)
+
+    assert state.applications["orders"]["id"] == 3
+    generated = [state.add_application(f"app-{i}")["id"] for i in range(20)]
+    ids = [app["id"] for app in state.applications.values()]
+    assert len(ids) == len(set(ids))
+    assert 3 not in generated and DB_APP_ID not in generated
+
+
+def test_seed_can_take_the_db_application_id():
+    state = ControllerState({"applications": [{"name": "dbmon", "id": DB_APP_ID}]})
+    assert state.app_by_id(DB_APP_ID)["name"] == "dbmon"
+    assert "Database Monitoring" not in state.applications
@@ -0,0 +1,57 @@
+import io
+import json
+
+import pytest
+
+# main.py logs through the deployment's external `logger` module
+pytest.importorskip("logger")
+
+import batch  # noqa: E402
+import main as onboarding  # noqa: E402
+
+
+def _entries(*overrides):
+    base = {"APPD_ENV": "TEST", "BusinessName": "ONE", "ApplicationName": "app",
+            "APPD_TIER": "web", "USER_EMAIL": "a@example.com"}
+    return [(line_no, {**base, **override}) for line_no, override in enumerate(overrides, start=1)]
+
+
+def _run(make_client, config, entries):
+    out = io.StringIO()
+    settings = onboarding.load_settings({})
+    batch.run_batch(make_client(), config, entries, out, workers=2, settings=settings)
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_entries_for_the_same_tier_keep_their_own_params(make_client, controller, onboarding_config):
+    controller.state.add_application("app", tiers={"web": "Application Server"})
+
+    first, second = _run(make_client, onboarding_config, _entries({}, {"BusinessName": "TWO"}))
+
+    assert first["status"] == second["status"] == "ok"
+    assert all(name.startswith("ONE.") for name in first["health_rules"])
+    assert all(name.startswith("TWO.") for name in second["health_rules"])
+    app_id = controller.state.applications["app"]["id"]
+    names = {e["name"] for e in controller.state.table(app_id, "health-rules").values()}
+    assert set(first["health_rules"]) | set(second["health_rules"]) == names
+
+
+def test_identical_entries_share_their_steps(make_client, controller, onboarding_config):
+    controller.state.add_application("app", tiers={"web": "Application Server"})
+
+    first, second = _run(make_client, onboarding_config, _entries({}, {}))
+
+    assert first["health_rules"] == second["health_rules"]
+    posts = sum(n for key, n in controller.stats().items() if key.startswith("POST") and "health-rules" in key)
+    assert posts == len(onboarding_config["base_healthrules"])
+
+
+def test_non_string_manifest_values_do_not_abort_the_batch(make_client, controller, onboarding_config):
+    controller.state.add_application("42", tiers={"7": "Application Server"})
+    numeric = {"ApplicationName": 42, "APPD_TIER": 7, "BusinessName": None, "USER_EMAIL": ["a@example.com", 3]}
+
+    numbers, after = _run(make_client, onboarding_config, _entries(numeric, {}))
+
+    assert (numbers["ApplicationName"], numbers["appd_tier"], numbers["status"]) == ("42", "7", "ok")
+    # The rest of the manifest still gets its result lines
+    assert (after["ApplicationName"], after["status"]) == ("app", "ok")
@@ -0,0 +1,62 @@
+import time
+
+from mock_controller import MockController
+from ratelimit import RateLimiter
+
+
+class _Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+def test_no_static_caps_by_default(monkeypatch):
+    monkeypatch.delenv("APPD_RATE_LIMITS", raising=False)
+    limiter = RateLimiter.from_env()
+    assert limiter.buckets == {}
+
+    start = time.perf_counter()
+    for _ in range(200):
+        limiter.send(lambda: _Response(201), "POST", "http://c/controller/alerting/rest/v1/applications/1/actions")
+    assert time.perf_counter() - start < 0.5
+    assert limiter.stats()["bucket_wait_seconds"] == 0
+
+
+def test_configured_caps_apply(monkeypatch):
+    monkeypatch.setenv("APPD_RATE_LIMITS", "actions=20")
+    limiter = RateLimiter.from_env()
+    assert set(limiter.buckets) == {"actions"}
+
+    start = time.perf_counter()
+    for _ in range(30):
+        limiter.send(lambda: _Response(201), "POST", "http://c/controller/alerting/rest/v1/applications/1/actions")
+    # 20 burst, then 10 more at 20/s
+    assert time.perf_counter() - start >= 0.4
+    # Other buckets stay uncapped
+    limiter.send(lambda: _Response(200), "GET", "http://c/controller/rest/applications")
+
+
+def test_throttled_calls_are_retried_after_retry_after(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    responses = iter([_Response(429, {"Retry-After": "1"}), _Response(503), _Response(200)])
+    limiter = RateLimiter()
+
+    assert limiter.send(lambda: next(responses), "GET", "http://c/controller/rest/applications").status_code == 200
+    stats = limiter.stats()
+    assert (stats["throttled"], stats["retried"]) == (2, 2)
+    assert stats["concurrency_limit"] < 16
+
+
+def test_server_side_limit_is_absorbed(make_client):
+    server = MockController(rate_limit=50, burst=5).start()
+    try:
+        client = make_client(base_url=server.url)
+        app_id = client.get_appID("throttled")
+        for i in range(20):
+            assert client.post_appd_action(app_id, {"name": f"a{i}"})["success"]
+    finally:
+        server.shutdown()
+        server.server_close()
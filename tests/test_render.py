@@ -0,0 +1,44 @@
+import bench
+import render
+
+
+def test_renders_are_independent_dicts(onboarding_config):
+    template = onboarding_config["jvm_healthrules"][0]
+    params = bench.template_params("app", "web")
+
+    first = render.render_template_json(template, params)
+    first["name"] = "changed"
+    second = render.render_template_json(template, params)
+
+    assert second["name"] == "BENCH.app.BENCH.web | Bench HR 0"
+    assert first is not second
+
+
+def test_compiled_templates_are_reused_until_cleared(onboarding_config):
+    template = onboarding_config["jvm_healthrules"][0]
+    env = render.get_template_env()
+    assert env.get_template(template) is env.get_template(template)
+
+    render.clear_render_cache()
+    assert render.get_template_env() is not env
+
+
+def test_bytecode_cache_dir_is_private(tmp_path):
+    cache = render._bytecode_cache(tmp_path / "jinja-cache")
+    assert cache is not None
+    assert (tmp_path / "jinja-cache").stat().st_mode & 0o777 == 0o700
+
+
+def test_bytecode_cache_refuses_a_directory_others_can_write(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    assert render._bytecode_cache(shared) is None
+
+
+def test_default_bytecode_cache_is_jinjas_per_user_directory():
+    from jinja2 import FileSystemBytecodeCache
+
+    cache = render._bytecode_cache()
+    assert isinstance(cache, FileSystemBytecodeCache)
+    assert cache.directory != "/tmp/appd-jinja-cache"
@@ -0,0 +1,64 @@
+import pytest
+
+
+def _seed(client, app_id):
+    client.post_appd_action(app_id, {"name": "mail", "actionType": "EMAIL"})
+    client.post_appd_hr(app_id, {"name": "cpu"})
+    client.post_appd_policy(app_id, {"name": "page"})
+
+
+def _fail_listing(client, monkeypatch, failing):
+    iter_entities = client.iter_entities
+
+    def flaky(appd_id, endpoint, page_size=None):
+        if endpoint == failing:
+            raise ConnectionError("controller returned 503")
+        return iter_entities(appd_id, endpoint, page_size)
+
+    monkeypatch.setattr(client, "iter_entities", flaky)
+
+
+NAMES = {"policies": ["page"], "actions": ["mail"], "health-rules": ["cpu", "gone"]}
+
+
+def test_delete_entities_deletes_and_skips_missing(make_client):
+    client = make_client()
+    app_id = client.get_appID("teardown")
+    _seed(client, app_id)
+
+    results = {(r["endpoint"], r["name"]): r for r in client.delete_entities(app_id, NAMES)}
+
+    assert all(r["success"] for r in results.values())
+    assert results[("health-rules", "gone")]["skipped"]
+    assert not results[("policies", "page")].get("skipped")
+    assert list(client.iter_entities(app_id, "policies")) == []
+
+
+def test_failed_policy_listing_fails_the_teardown(make_client, monkeypatch):
+    client = make_client()
+    app_id = client.get_appID("teardown")
+    _seed(client, app_id)
+    # An index built before the teardown must not stand in for the failed listing
+    client.prefetch_entities(app_id)
+    _fail_listing(client, monkeypatch, "policies")
+
+    results = client.delete_entities(app_id, NAMES)
+
+    assert not any(r["success"] for r in results)
+    assert not any(r.get("skipped") for r in results)
+    assert {r["error"] for r in results if r["endpoint"] != "policies"} == {
+        "not attempted: listing policies failed"
+    }
+    # Nothing was deleted behind the policies' back
+    monkeypatch.undo()
+    assert [e.name for e in client.iter_entities(app_id, "actions")] == ["mail"]
+
+
+def test_failed_listing_raises_from_id_lookup(make_client, monkeypatch):
+    client = make_client()
+    app_id = client.get_appID("teardown")
+    _seed(client, app_id)
+    _fail_listing(client, monkeypatch, "actions")
+
+    with pytest.raises(RuntimeError):
+        client.get_appd_action_ids(app_id, ["mail"], refresh=True)
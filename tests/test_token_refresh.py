@@ -0,0 +1,67 @@
+import time
+import asyncio
+
+from apis_async import AsyncAppDynamics
+from db_hr import AppDPolicyActionBuilder
+from token_cache import TOKEN_CACHE, TokenCache
+
+
+def _revoke(controller):
+    controller.state.tokens.clear()
+
+
+def _token_posts(controller):
+    return sum(n for key, n in controller.stats().items() if "oauth" in key)
+
+
+def test_short_lived_tokens_are_reused():
+    cache = TokenCache(refresh_margin=60)
+    entry = cache.put("acct", "id", "t", expires_in=30)
+
+    assert cache.refresh_at(entry) == entry["expires_at"] - 7.5
+    assert cache.get("acct", "id") is entry
+
+
+def test_legacy_entries_without_lifetime_use_the_margin():
+    cache = TokenCache(refresh_margin=60)
+    entry = {"access_token": "t", "expires_at": time.time() + 600}
+    assert cache.refresh_at(entry) == entry["expires_at"] - 60
+
+
+def test_sync_client_retries_once_on_401(make_client, controller):
+    client = make_client()
+    _revoke(controller)
+
+    assert client.get_appID("refresh") == client.get_appID("refresh", refresh=True)
+    assert _token_posts(controller) == 2
+
+
+def test_async_client_refreshes_and_retries_on_401(controller):
+    async def run():
+        async with AsyncAppDynamics("TEST", "client", "test", "secret",
+                                    base_url=controller.url) as appd:
+            first = await appd.get_appID("refresh")
+            _revoke(controller)
+            second = await appd.get_appID("refresh")
+            # Token expired: nothing fresh cached and past the refresh point
+            TOKEN_CACHE.invalidate("test", "client")
+            appd.token_refresh_at = 0
+            third = await appd.get_appID("refresh")
+            return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first == second == third
+    assert _token_posts(controller) == 3
+
+
+def test_db_builder_retries_once_on_401(controller):
+    controller.state.applications["db"] = {"id": 15, "name": "db", "tiers": {}, "nodes": []}
+    builder = AppDPolicyActionBuilder(
+        "B", "MYSQL", "App", "TEST", "db1", ["a@b.c"], "test", "secret", "client",
+        base_url=controller.url,
+    )
+    builder.generate_access_token()
+    _revoke(controller)
+
+    assert builder._existing_health_rules() == {}
+    assert _token_posts(controller) == 2
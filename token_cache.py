@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+import threading
+
+from file_store import file_lock, read_json, write_json
+
+log = logging.getLogger(__name__)
+
+# Refresh this many seconds before the controller-reported expiry...
+REFRESH_MARGIN = 60
+# ...but never more than this fraction of the token's lifetime, so short-lived
+# tokens are still used instead of being refetched on every request
+MAX_REFRESH_FRACTION = 0.25
+# Used when the token response carries no expires_in
+DEFAULT_EXPIRES_IN = 300
+
+
+class TokenCache:
+    """
+    OAuth access-token cache keyed by (account_name, client_id).
+
+    Tokens live in memory and, when `path` is set, in a JSON file shared by
+    every process on the host. File access is serialised with flock so a
+    burst of jobs fetches one token instead of one each.
+    """
+
+    def __init__(self, path=None, refresh_margin=REFRESH_MARGIN):
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @staticmethod
+    def _key(account_name, client_id):
+        return f"{account_name}|{client_id}"
+
+    def refresh_at(self, entry):
+        """When to replace the token: refresh_margin before expiry, clamped to its lifetime."""
+        lifetime = entry.get("lifetime")
+        margin = self.refresh_margin if not lifetime else min(self.refresh_margin,
+                                                              lifetime * MAX_REFRESH_FRACTION)
+        return entry["expires_at"] - margin
+
+    def _is_fresh(self, entry):
+        return bool(entry) and self.refresh_at(entry) > time.time()
+
+    @staticmethod
+    def _entry(access_token, expires_in):
+        lifetime = int(expires_in or DEFAULT_EXPIRES_IN)
+        return {"access_token": access_token, "expires_at": time.time() + lifetime, "lifetime": lifetime}
+
+    def get(self, account_name, client_id):
+        """Returns a cached token that is not about to expire, else None."""
+        key = self._key(account_name, client_id)
+        entry = self._tokens.get(key)
+        if self._is_fresh(entry):
+            return entry
+        if self.path:
+            with file_lock(self.path):
+                entry = read_json(self.path).get(key)
+            if self._is_fresh(entry):
+                self._tokens[key] = entry
+                return entry
+        return None
+
+    def put(self, account_name, client_id, access_token, expires_in=None):
+        key = self._key(account_name, client_id)
+        entry = self._entry(access_token, expires_in)
+        self._tokens[key] = entry
+        if self.path:
+            with file_lock(self.path):
+                data = read_json(self.path)
+                data[key] = entry
+                write_json(self.path, data)
+        return entry
+
+    def invalidate(self, account_name, client_id, access_token=None):
+        """
+        Drops the cached token. When access_token is given, only drops it if it
+        is still the cached one, so a token another thread just refreshed survives.
+        """
+        key = self._key(account_name, client_id)
+        entry = self._tokens.get(key)
+        if entry and (access_token is None or entry["access_token"] == access_token):
+            self._tokens.pop(key, None)
+        if self.path:
+            with file_lock(self.path):
+                data = read_json(self.path)
+                entry = data.get(key)
+                if entry and (access_token is None or entry["access_token"] == access_token):
+                    data.pop(key)
+                    write_json(self.path, data)
+
+    def get_or_fetch(self, account_name, client_id, fetch):
+        """
+        Returns a fresh {"access_token", "expires_at", "lifetime"} entry, calling
+        fetch() -> (access_token, expires_in) only when nothing usable is cached.
+        Concurrent callers for the same key, in this process or others sharing
+        the file, wait for a single fetch.
+        """
+        key = self._key(account_name, client_id)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            entry = self._tokens.get(key)
+            if self._is_fresh(entry):
+                return entry
+            with file_lock(self.path):
+                if self.path:
+                    entry = read_json(self.path).get(key)
+                    if self._is_fresh(entry):
+                        self._tokens[key] = entry
+                        return entry
+                access_token, expires_in = fetch()
+                entry = self._entry(access_token, expires_in)
+                self._tokens[key] = entry
+                if self.path:
+                    data = read_json(self.path)
+                    data[key] = entry
+                    write_json(self.path, data)
+                log.info(f"Fetched new access token for {account_name} (expires in {expires_in}s)")
+                return entry
+
+
+# Process-wide cache; APPD_TOKEN_CACHE enables the shared on-disk store
+TOKEN_CACHE = TokenCache(path=os.getenv("APPD_TOKEN_CACHE", "").strip() or None)
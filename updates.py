@@ -1,45 +1,41 @@
 import os
 from sys import exit
-from pathlib import Path
-from jinja2.exceptions import TemplateNotFound
 import json
 import urllib.parse
 from logger import logger
+from log_config import configure_logging
 from apis import AppDynamics
-from jinja2 import Environment, FileSystemLoader, StrictUndefined, TemplateNotFound
-from pathlib import Path
+from render import render_template_json
 from copy import deepcopy
 
 log = logger
 
-# Load all available Jinja2 templates to be called for later rendering
-template_env = Environment(
-    loader=FileSystemLoader(
-        searchpath=Path(__file__).parent.parent.joinpath("templates"),
-    ),
-    undefined=StrictUndefined,
-    keep_trailing_newline=True,
-    lstrip_blocks=True,
-    trim_blocks=True,
-)
-
-# Fetch and trim environment variables
-appd_env = os.getenv("APP_ENV", "").strip()
-BusinessName = os.getenv("BusinessName", "").strip()
-ApplicationName = os.getenv("ApplicationName", "").strip()
-appd_tier = os.getenv("APPD_TIER", "").strip()
-email_list = os.getenv("USER_EMAIL", "").strip()
-user_email = [email.strip() for email in email_list.split(",") if email.strip()]
-account_name = os.getenv("APPD_CON", "").strip()
-secrets_file_path = os.getenv("SECRETS_PATH", "").strip()
-critical_value = os.getenv("CRITICAL_VALUE", "").strip()
-warning_value = os.getenv("WARNING_VALUE", "").strip()
-update_flag = os.getenv("UPDATE", "").strip().lower() == "true"
-healthrule_name = os.getenv("HEALTHRULE_NAME", "").strip()
+# Parallel DELETEs per teardown phase
+DELETE_WORKERS = 8
+
+# Fetch and trim environment variables (at run time, not import)
+def load_params():
+    """Parameters dictionary to pass to templates, read from the environment."""
+    email_list = os.getenv("USER_EMAIL", "").strip()
+    critical_value = os.getenv("CRITICAL_VALUE", "").strip()
+    warning_value = os.getenv("WARNING_VALUE", "").strip()
+    return {
+        "appd_env": os.getenv("APP_ENV", "").strip(),
+        "BusinessName": os.getenv("BusinessName", "").strip(),
+        "ApplicationName": os.getenv("ApplicationName", "").strip(),
+        "appd_tier": os.getenv("APPD_TIER", "").strip(),
+        "user_email": [email.strip() for email in email_list.split(",") if email.strip()],
+        "account_name": os.getenv("APPD_CON", "").strip(),
+        "critical_value": critical_value if critical_value else None,
+        "warning_value": warning_value if warning_value else None,
+        "update": os.getenv("UPDATE", "").strip().lower() == "true",
+        "delete": os.getenv("DELETE", "").strip().lower() == "true",
+        "healthrule_name": os.getenv("HEALTHRULE_NAME", "").strip()
+    }
 
 # load secrets
 
-def get_secrets(account_name: str):
+def get_secrets(account_name: str, secrets_file_path: str):
     account_name_upper = account_name.upper()
     formatted_account_name = account_name_upper.replace('-', '_')
     print(secrets_file_path)
@@ -73,23 +69,12 @@ def load_config():
         print("Corrupted or Malformed JSON in config")
         print(error)
 
-def render_template_json(template, params):
-    """
-    Accepts a template filename and parameters to pass to the template
-    when rendering. Produces a rendered template as a string.
-    
-    """
-    try:
-        appd_obj = template_env.get_template(template).render(params)
-        appd_obj_json = json.loads(appd_obj)
-        json_string = json.dumps(appd_obj_json, indent=2)
-        return json_string
+def get_tier_type(appd, appd_id, appd_tier):
+    return appd.get_appd_tier(appd_id, appd_tier)[0]["type"]
 
-    except TemplateNotFound as e:
-        exit(f"{e.__class__.__name__} : templates/{e}")
-
-def get_delete_policy_names():
+def get_delete_policy_names(config, params, tier_type):
     policy_names = []
+    appd_tier = params["appd_tier"]
 
     policy_params = deepcopy(params)
     policy_params["healthrules"] = ["dummy_name"]  ## Dummy healthrule names to render policy
@@ -98,8 +83,8 @@ def get_delete_policy_names():
         # Create Linux specific policies
         for i in config["jvm_policy"]:
             try:
-                linux_policy_json = render_template_json(i, policy_params)
-                policy_names.append(json.loads(linux_policy_json).get("name").strip())
+                linux_policy = render_template_json(i, policy_params)
+                policy_names.append(linux_policy.get("name").strip())
             except Exception as e:
                 log.warning(f"Failed to render template jvm_policy for {appd_tier}: {e}")
                 continue  # Skip to next action
@@ -108,8 +93,8 @@ def get_delete_policy_names():
         # Create Windows specific policies
         for i in config["clr_policy"]:
             try:
-                windows_policy_json = render_template_json(i, policy_params)
-                policy_names.append(json.loads(windows_policy_json).get("name").strip())
+                windows_policy = render_template_json(i, policy_params)
+                policy_names.append(windows_policy.get("name").strip())
             except Exception as e:
                 log.warning(f"Failed to render template jvm_policy for {appd_tier}: {e}")
                 continue  # Skip to next action
@@ -117,104 +102,123 @@ def get_delete_policy_names():
     else:
         # Create Base Policies
         for i in config["base_policies"]:
-            base_policy_json = render_template_json(i, policy_params)
-            policy_names.append(json.loads(base_policy_json).get("name").strip())
+            base_policy = render_template_json(i, policy_params)
+            policy_names.append(base_policy.get("name").strip())
 
     log.info(f"Policies to be deleted: {', '.join(policy_names)}")
     return policy_names
 
-def delete_policies():
+def log_delete_results(results, appd_tier):
+    """Logs the per-entity teardown report and returns the results."""
+    for r in results:
+        label = f"{r['endpoint']} '{r['name']}'"
+        if r.get("skipped"):
+            log.info(f"Skipped {label} for {appd_tier}: not found")
+        elif r["success"]:
+            log.info(f"Successfully deleted {label} (ID {r['id']}) for {appd_tier}...!")
+        else:
+            log.error(f"Failed to delete {label} (ID {r['id']}) for {appd_tier}: "
+                      f"{r.get('message') or r.get('error')}")
+    return results
+
+def delete_policies(appd, appd_id, config, params, tier_type, max_workers=DELETE_WORKERS):
     log.info("------------------------\n")
     log.info("Starting policy deletion...\n")
 
-    policy_names = get_delete_policy_names()
-
-    policy_ids = appd.get_appd_policy_ids(appd_id, policy_names)
+    policy_names = get_delete_policy_names(config, params, tier_type)
+    results = appd.delete_entities(appd_id, {"policies": policy_names}, max_workers)
+    return log_delete_results(results, params["appd_tier"])
 
-    for policy_id in policy_ids:
-        try:
-            log.info(f"Deleting policy ID {policy_id} for {appd_tier}...")
-            appd.delete_appd_policy(appd_id, policy_id)
-            log.info(f"Successfully deleted policy ID {policy_id} for {appd_tier}...!")
-        except Exception as e:
-            log.error(f"Failed to delete policy ID {policy_id} for {appd_tier}: {str(e)}")
-            continue
-
-def get_delete_action_names():
+def get_delete_action_names(config, params):
     action_names = []
 
     for i in config["base_actions"]:
-        base_action_json = render_template_json(i, params)
-        action_names.append(json.loads(base_action_json).get("name").strip())
+        base_action = render_template_json(i, params)
+        action_names.append(base_action.get("name").strip())
 
     log.info(f"Actions to be deleted: {', '.join(action_names)}")
     return action_names
 
-def delete_actions():
+def delete_actions(appd, appd_id, config, params, max_workers=DELETE_WORKERS):
     log.info("------------------------\n")
     log.info("Starting action deletion...\n")
 
-    action_names = get_delete_action_names()
-
-    action_ids = appd.get_appd_action_ids(appd_id, action_names)
+    action_names = get_delete_action_names(config, params)
+    results = appd.delete_entities(appd_id, {"actions": action_names}, max_workers)
+    return log_delete_results(results, params["appd_tier"])
 
-    for action_id in action_ids:
-        try:
-            log.info(f"Deleting action ID {action_id} for {appd_tier}...")
-            appd.delete_appd_action(appd_id, action_id)
-            log.info(f"Successfully deleted action ID {action_id} for {appd_tier}...!")
-        except Exception as e:
-            log.error(f"Failed to delete action ID {action_id} for {appd_tier}: {str(e)}")
-            continue
-    
-def get_delete_healthrule_names():   
+def get_delete_healthrule_names(config, params, tier_type):
     healthrule_names = []
 
     if tier_type == "Application Server":
         # Create JVM specific health rules
         for i in config["jvm_healthrules"]:
-            jvmhr_json = render_template_json(i, params)
-            healthrule_names.append(json.loads(jvmhr_json).get("name").strip())
+            jvmhr = render_template_json(i, params)
+            healthrule_names.append(jvmhr.get("name").strip())
 
     elif tier_type == ".NET Application Server":
         # Create Dot net specific health rules
         for i in config["clr_healthrules"]:
-            clrhr_json = render_template_json(i, params)
-            healthrule_names.append(json.loads(clrhr_json).get("name").strip())
+            clrhr = render_template_json(i, params)
+            healthrule_names.append(clrhr.get("name").strip())
 
     else:
         # Create Base Health rules
         for i in config["base_healthrules"]:
-            hr_json = render_template_json(i, params)
-            healthrule_names.append(json.loads(hr_json).get("name").strip())
+            hr = render_template_json(i, params)
+            healthrule_names.append(hr.get("name").strip())
 
     log.info(f"Health rules to be deleted: {', '.join(healthrule_names)}")
     return healthrule_names
 
-def delete_healthrules():
+def delete_healthrules(appd, appd_id, config, params, tier_type, max_workers=DELETE_WORKERS):
     log.info("------------------------\n")
     log.info("Starting health rule deletion...\n")
 
-    healthrule_names = get_delete_healthrule_names()
+    healthrule_names = get_delete_healthrule_names(config, params, tier_type)
+    results = appd.delete_entities(appd_id, {"health-rules": healthrule_names}, max_workers)
+    return log_delete_results(results, params["appd_tier"])
 
-    healthrule_ids = appd.get_appd_hr_ids(appd_id, healthrule_names)
+def delete_all(appd, appd_id, config, params, tier_type, max_workers=DELETE_WORKERS):
+    """
+    Offboards the tier's policies, actions and health rules in one pass:
+    one listing per entity type, then parallel DELETEs with policies first.
+    """
+    log.info("------------------------\n")
+    log.info("Starting teardown...\n")
 
-    for hr_id in healthrule_ids:
-        try:
-            log.info(f"Deleting health rule ID {hr_id} for {appd_tier}...")
-            appd.delete_appd_hr(appd_id, hr_id)
-            log.info(f"Successfully deleted health rule ID {hr_id} for {appd_tier}...!")
-        except Exception as e:
-            log.error(f"Failed to delete health rule ID {hr_id} for {appd_tier}: {str(e)}")
-            continue
+    results = appd.delete_entities(appd_id, {
+        "policies": get_delete_policy_names(config, params, tier_type),
+        "actions": get_delete_action_names(config, params),
+        "health-rules": get_delete_healthrule_names(config, params, tier_type),
+    }, max_workers)
+    return log_delete_results(results, params["appd_tier"])
 
 def main():
     """AppDynamics HR Generator"""
+    configure_logging(adopt=[logger])
 
     log.info("################################")
     log.info("##   AppDynamics Onboarder    ##")
     log.info("################################\n")
 
+    # Secrets, the client and the application lookup are only needed here,
+    # so importing this module does no file or network I/O
+    params = load_params()
+    client_id, client_secret = get_secrets(
+        params["account_name"], os.getenv("SECRETS_PATH", "").strip()
+    )
+    params["client_id"] = client_id
+    params["client_secret"] = client_secret
+    appd = AppDynamics(
+        params["appd_env"],
+        params["client_id"],
+        params["account_name"],
+        params["client_secret"]
+    )
+    # Served from the lookup cache on repeat runs; LOOKUP_REFRESH=true forces a fetch
+    refresh = os.getenv("LOOKUP_REFRESH", "").strip().lower() == "true"
+    appd_id = appd.get_appID(params['ApplicationName'], refresh=refresh)
 
     if params["update"] and params["healthrule_name"]:
         result = appd.update_health_rule_thresholds(
@@ -228,35 +232,16 @@ def main():
         else:
             log.warning(result.get("message", result.get("error", "Unknown error")))
 
+    elif params["delete"]:
+        config = load_config()
+        tier_type = get_tier_type(appd, appd_id, params["appd_tier"])
+        workers = int(os.getenv("DELETE_WORKERS", "").strip() or DELETE_WORKERS)
+        results = delete_all(appd, appd_id, config, params, tier_type, workers)
+        if not all(r["success"] for r in results):
+            exit(1)
+
     # Exit gracefully.
     exit(0)
 
-# Parameters dictionary to pass to templates
-client_id, client_secret = get_secrets(account_name)
-params = {
-    "appd_env": appd_env,
-    "BusinessName": BusinessName,
-    "ApplicationName": ApplicationName,
-    "appd_tier": appd_tier,
-    "user_email": user_email,
-    "client_id": client_id,
-    "account_name": account_name,
-    "client_secret": client_secret,
-    "critical_value": critical_value if critical_value else None,
-    "warning_value": warning_value if warning_value else None,
-    "update": update_flag,
-    "healthrule_name": healthrule_name
-}
-appd = AppDynamics(
-    params["appd_env"],
-    params["client_id"],
-    params["account_name"],
-    params["client_secret"]
-)
-#appd = AppDynamics(params['appd_env'], params['client_id'], params['account_name'], params['client_secret'] )
-appd_id = appd.get_appID(params['ApplicationName'])
-tier_type = appd.get_appd_tier(appd_id, params['appd_tier'])[0]["type"]
-config = load_config()
-
 if __name__ == "__main__":
     main()